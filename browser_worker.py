@@ -0,0 +1,469 @@
+"""
+Servicio de navegadores aislado del proceso del bot.
+
+Uno o más procesos worker son dueños de las instancias de Chrome y resuelven enlaces
+que requieren navegador. El bot les habla por un socket Unix local con JSON por línea:
+
+    -> {"id": "...", "method": "resolve", "params": {"url": "...", "owner": "..."}}
+    <- {"id": "...", "ok": true, "result": "..."}
+
+Cada conexión admite varias peticiones en vuelo (se responden por id a medida que
+terminan). Si un worker muere o deja de responder al ping, el bot lo vuelve a lanzar.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Any, List
+
+logger = logging.getLogger(__name__)
+
+# Número de procesos worker (0 = resolver en el proceso del bot, como antes)
+BROWSER_WORKERS = int(os.getenv("BROWSER_WORKERS", "1"))
+# Navegadores simultáneos por worker
+BROWSER_WORKER_CONCURRENCY = int(os.getenv("BROWSER_WORKER_CONCURRENCY", "2"))
+BROWSER_WORKER_SOCKET_DIR = os.getenv("BROWSER_WORKER_SOCKET_DIR", tempfile.gettempdir())
+HEALTH_CHECK_INTERVAL = float(os.getenv("BROWSER_WORKER_HEALTH_INTERVAL", "10"))
+RESOLVE_TIMEOUT = float(os.getenv("BROWSER_WORKER_TIMEOUT", "300"))
+
+
+class WorkerUnavailableError(Exception):
+    """El proceso worker no está disponible o se cayó durante la petición"""
+
+
+class WorkerResolveError(Exception):
+    """El handler falló dentro del worker; retryable viene calculado con el error original"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _send_message(sock, lock, message: Dict[str, Any]):
+    data = (json.dumps(message) + "\n").encode('utf-8')
+    with lock:
+        sock.sendall(data)
+
+
+class BrowserWorkerServer:
+    """Proceso worker: recibe peticiones por el socket y las resuelve con Chrome"""
+
+    def __init__(self, socket_path: str, concurrency: int = BROWSER_WORKER_CONCURRENCY):
+        self.socket_path = socket_path
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.active = 0
+        self.active_lock = threading.Lock()
+        self.running = True
+        self.server_socket = None
+
+    def serve_forever(self):
+        """Acepta conexiones hasta que se detenga el worker"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.server_socket.listen()
+        logger.info(f"Worker de navegador escuchando en {self.socket_path} (PID: {os.getpid()})")
+
+        while self.running:
+            try:
+                conn, _ = self.server_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+
+    def shutdown(self):
+        """Detiene el worker y mata sus navegadores"""
+        from handlers.browser_registry import browser_registry
+
+        self.running = False
+        browser_registry.reap_all()
+        try:
+            if self.server_socket:
+                self.server_socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    def _handle_connection(self, conn):
+        """Lee peticiones de una conexión y responde cada una al terminar"""
+        write_lock = threading.Lock()
+        try:
+            for line in conn.makefile('r', encoding='utf-8'):
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                request_id = request.get('id')
+                method = request.get('method')
+                params = request.get('params') or {}
+
+                if method == 'resolve':
+                    future = self.executor.submit(self._resolve, request_id, params)
+                    future.add_done_callback(
+                        lambda f, rid=request_id: self._reply(conn, write_lock, rid, f.result())
+                    )
+                elif method == 'ping':
+                    self._reply(conn, write_lock, request_id, {'ok': True, 'result': self._health()})
+                elif method == 'reap':
+                    self._reply(conn, write_lock, request_id, {'ok': True, 'result': self._reap(params)})
+                else:
+                    self._reply(conn, write_lock, request_id, {'ok': False, 'error': f"Método desconocido: {method}"})
+        except (OSError, ValueError) as e:
+            logger.debug(f"Conexión cerrada: {e}")
+        finally:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _reply(self, conn, write_lock, request_id, response: Dict[str, Any]):
+        response['id'] = request_id
+        try:
+            _send_message(conn, write_lock, response)
+        except OSError as e:
+            logger.debug(f"No se pudo responder {request_id}: {e}")
+
+    def _resolve(self, request_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Resuelve un enlace con los navegadores de este proceso"""
+        from handlers import resolve_in_process
+        from handlers.browser_registry import browser_registry
+
+        owner = params.get('owner') or request_id
+        with self.active_lock:
+            self.active += 1
+
+        browser_registry.set_owner(owner)
+        try:
+            return {'ok': True, 'result': resolve_in_process(params['url'])}
+        except Exception as e:
+            from handlers.retry import is_retryable
+            return {
+                'ok': False,
+                'error': str(e),
+                'retryable': is_retryable(e),
+                'recycled': browser_registry.consume_recycled(owner)
+            }
+        finally:
+            browser_registry.reap_owner(owner)
+            browser_registry.clear_owner()
+            with self.active_lock:
+                self.active -= 1
+
+    def _reap(self, params: Dict[str, Any]) -> int:
+        from handlers.browser_registry import browser_registry
+        return browser_registry.reap_owner(params.get('owner', ''))
+
+    def _health(self) -> Dict[str, Any]:
+        from handlers.browser_registry import browser_registry
+        return {
+            'pid': os.getpid(),
+            'active': self.active,
+            'concurrency': self.concurrency,
+            'browsers': browser_registry.stats()
+        }
+
+
+class BrowserWorkerClient:
+    """Conexión del bot a un worker, con varias peticiones en vuelo identificadas por id"""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.sock = None
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def connect(self, timeout: float = 30):
+        """Conecta al socket, esperando a que el worker termine de arrancar"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                break
+            except OSError:
+                sock.close()
+                if time.time() > deadline:
+                    raise WorkerUnavailableError(f"No se pudo conectar a {self.socket_path}")
+                time.sleep(0.2)
+
+        self.sock = sock
+        threading.Thread(target=self._read_responses, args=(sock,), daemon=True).start()
+
+    def call(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Envía una petición y espera su respuesta"""
+        if self.sock is None:
+            raise WorkerUnavailableError("Worker no conectado")
+
+        request_id = uuid.uuid4().hex[:12]
+        future = Future()
+        with self.lock:
+            self.pending[request_id] = future
+
+        try:
+            _send_message(self.sock, self.write_lock, {'id': request_id, 'method': method, 'params': params or {}})
+            return future.result(timeout=timeout)
+        except OSError as e:
+            raise WorkerUnavailableError(f"Error enviando petición al worker: {e}")
+        finally:
+            with self.lock:
+                self.pending.pop(request_id, None)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self._fail_pending("Conexión con el worker cerrada")
+
+    def _read_responses(self, sock):
+        try:
+            for line in sock.makefile('r', encoding='utf-8'):
+                try:
+                    response = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                with self.lock:
+                    future = self.pending.get(response.get('id'))
+                if future and not future.done():
+                    future.set_result(response)
+        except (OSError, ValueError):
+            pass
+        self._fail_pending("El worker de navegador se desconectó")
+
+    def _fail_pending(self, reason: str):
+        with self.lock:
+            futures = list(self.pending.values())
+        for future in futures:
+            if not future.done():
+                future.set_exception(WorkerUnavailableError(reason))
+
+
+class _WorkerHandle:
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: Optional[subprocess.Popen] = None
+        self.client: Optional[BrowserWorkerClient] = None
+
+
+class BrowserWorkerPool:
+    """Supervisa los procesos worker: los lanza, vigila su salud y los relanza si mueren"""
+
+    def __init__(self, size: int = BROWSER_WORKERS, concurrency: int = BROWSER_WORKER_CONCURRENCY,
+                 health_interval: float = HEALTH_CHECK_INTERVAL):
+        self.size = size
+        self.concurrency = concurrency
+        self.health_interval = health_interval
+        self.workers: List[_WorkerHandle] = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.health_thread = None
+        # Cada start() abre una generación; el vigilante de una generación anterior termina solo
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self):
+        """Lanza los workers (se llama de forma perezosa con la primera petición)"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            self.workers = [
+                _WorkerHandle(i, os.path.join(BROWSER_WORKER_SOCKET_DIR, f"browser-worker-{os.getpid()}-{i}.sock"))
+                for i in range(self.size)
+            ]
+            for worker in self.workers:
+                self._spawn(worker)
+            self.generation += 1
+            generation = self.generation
+
+        self.health_thread = threading.Thread(target=self._health_loop, args=(generation,), daemon=True)
+        self.health_thread.start()
+
+    def resolve(self, url: str, owner: str, timeout: float = RESOLVE_TIMEOUT) -> str:
+        """Resuelve un enlace en el worker con menos peticiones en vuelo"""
+        from handlers.browser_registry import browser_registry
+
+        self.start()
+        with self.lock:
+            candidates = [w for w in self.workers if w.client and w.client.sock]
+        if not candidates:
+            raise WorkerUnavailableError("No hay workers de navegador disponibles")
+
+        worker = min(candidates, key=lambda w: w.client.in_flight)
+        try:
+            response = worker.client.call('resolve', {'url': url, 'owner': owner}, timeout=timeout)
+        except TimeoutError:
+            self.reap_owner(owner)
+            raise Exception(f"Timeout del worker de navegador después de {timeout:.0f}s")
+
+        if response.get('ok'):
+            return response['result']
+        if response.get('recycled'):
+            # Propagar al registro local para que la cola reintente la tarea
+            browser_registry.mark_recycled(owner)
+        raise WorkerResolveError(response.get('error', 'Error desconocido en el worker de navegador'),
+                                 response.get('retryable', False))
+
+    def reap_owner(self, owner: str) -> int:
+        """Pide a todos los workers que maten los navegadores de un dueño"""
+        if not self.running:
+            return 0
+        killed = 0
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                if worker.client:
+                    killed += worker.client.call('reap', {'owner': owner}, timeout=10).get('result', 0)
+            except Exception as e:
+                logger.debug(f"Worker {worker.index} no pudo limpiar {owner}: {e}")
+        return killed
+
+    def health(self) -> List[Dict[str, Any]]:
+        """Estado de cada worker (PID, peticiones activas, navegadores)"""
+        result = []
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                result.append(worker.client.call('ping', timeout=5)['result'])
+            except Exception as e:
+                result.append({'index': worker.index, 'error': str(e)})
+        return result
+
+    def restart(self):
+        """Relanza todos los workers (usado por /restart)"""
+        self.shutdown()
+        self.start()
+
+    def shutdown(self):
+        """Detiene los workers; cada uno mata sus navegadores al recibir SIGTERM"""
+        with self.lock:
+            self.running = False
+            workers = list(self.workers)
+            self.workers = []
+        for worker in workers:
+            self._stop(worker)
+
+    def _spawn(self, worker: _WorkerHandle):
+        # Cada worker escribe su propio archivo de PIDs (manage_bot.sh los lee todos)
+        env = dict(os.environ)
+        env['BROWSER_PID_FILE'] = f"{os.getenv('BROWSER_PID_FILE', 'browser.pids')}.worker{worker.index}"
+        worker.process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__),
+            '--socket', worker.socket_path,
+            '--concurrency', str(self.concurrency),
+            '--parent-pid', str(os.getpid())
+        ], env=env)
+        worker.client = BrowserWorkerClient(worker.socket_path)
+        try:
+            worker.client.connect()
+            logger.info(f"Worker de navegador {worker.index} iniciado (PID: {worker.process.pid})")
+        except WorkerUnavailableError as e:
+            logger.error(f"Worker de navegador {worker.index} no arrancó: {e}")
+
+    def _stop(self, worker: _WorkerHandle):
+        if worker.client:
+            worker.client.close()
+        if worker.process and worker.process.poll() is None:
+            worker.process.terminate()
+            try:
+                worker.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+
+    def _health_loop(self, generation: int):
+        """Relanza los workers que murieron o no responden al ping"""
+        while self.running and self.generation == generation:
+            time.sleep(self.health_interval)
+            with self.lock:
+                current = self.running and self.generation == generation
+                workers = list(self.workers) if current else []
+
+            for worker in workers:
+                healthy = worker.process is not None and worker.process.poll() is None
+                if healthy:
+                    try:
+                        worker.client.call('ping', timeout=5)
+                    except Exception:
+                        healthy = False
+
+                if not healthy:
+                    logger.warning(f"Worker de navegador {worker.index} caído, relanzando...")
+                    self._stop(worker)
+                    with self.lock:
+                        if self.running and self.generation == generation:
+                            self._spawn(worker)
+
+
+# Instancia global usada por el dispatcher de handlers
+browser_workers = BrowserWorkerPool()
+
+
+def _watch_parent(parent_pid: int, server: BrowserWorkerServer):
+    """Termina el worker si el proceso del bot desaparece"""
+    while server.running:
+        if os.getppid() != parent_pid:
+            logger.warning("El bot terminó, cerrando worker de navegador")
+            server.shutdown()
+            os._exit(0)
+        time.sleep(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de navegadores del bot")
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--concurrency', type=int, default=BROWSER_WORKER_CONCURRENCY)
+    parser.add_argument('--parent-pid', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - browser_worker - %(levelname)s - %(message)s'
+    )
+
+    server = BrowserWorkerServer(args.socket, args.concurrency)
+
+    def signal_handler(signum, frame):
+        server.shutdown()
+        os._exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    if args.parent_pid:
+        threading.Thread(target=_watch_parent, args=(args.parent_pid, server), daemon=True).start()
+
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
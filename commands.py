@@ -1,23 +1,7 @@
-from handlers import is_supported_link
+from handlers.registry import handler_registry
 
-SUPPORTED_SITES = {
-    'MediaFire': {
-        'ejemplo': 'https://www.mediafire.com/file/ejemplo/file.apk',
-        'notas': 'Soporta archivos individuales y carpetas'
-    },
-    'MegaUp': {
-        'ejemplo': 'https://megaup.net/ejemplo',
-        'notas': 'Requiere esperar 5 segundos para el captcha'
-    },
-    'A2ZAPK': {
-        'ejemplo': 'https://a2zapk.io/ejemplo',
-        'notas': 'Usa estrategia de distracción'
-    },
-    'APK4Free': {
-        'ejemplo': 'https://apk4free.net/ejemplo',
-        'notas': 'Descarga directa de APKs modificados'
-    }
-}
+# Generado desde el registro de handlers: un sitio nuevo aparece aquí automáticamente
+SUPPORTED_SITES = handler_registry.supported_sites()
 
 def generate_support_message():
     """Genera el mensaje de sitios soportados"""
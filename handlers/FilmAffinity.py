@@ -8,6 +8,9 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
 from bs4 import BeautifulSoup
+from .browser_registry import browser_registry
+from .dom_snapshot import wait_for_snapshot
+from .film_cache import film_cache, film_id_from_url
 
 class FilmAffinityHandler:
     @staticmethod
@@ -32,6 +35,9 @@ class FilmAffinityHandler:
     @staticmethod
     def get_driver():
         """Configura y retorna un driver de Chrome optimizado"""
+        # No lanzar otro Chrome si los navegadores ya superan el presupuesto de memoria
+        browser_registry.wait_for_capacity()
+        
         options = Options()
         options.add_argument('--headless')  # Ejecutar en segundo plano
         options.add_argument('--no-sandbox')
@@ -47,7 +53,7 @@ class FilmAffinityHandler:
         try:
             driver = webdriver.Chrome(options=options)
             driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            return driver
+            return browser_registry.register(driver, label='filmaffinity')
         except Exception as e:
             raise Exception(f"Error al inicializar ChromeDriver: {str(e)}. Asegúrate de tener ChromeDriver instalado.")
 
@@ -110,6 +116,213 @@ class FilmAffinityHandler:
         words = genre.split()
         return ''.join(word.capitalize() for word in words if word)
 
+    @staticmethod
+    def _parse_movie_info(soup):
+        """Extrae los datos estructurados de la ficha (título, dirección, actores, géneros)"""
+        title = soup.title.string.strip() if soup.title and soup.title.string else ''
+        print(f"DEBUG - Título de la página: {soup.title.string if soup.title else 'No title'}")
+
+        # Extraer géneros usando múltiples estrategias
+        genres = []
+
+        # Estrategia 1: Buscar por dt con texto "Género"
+        genre_dts = soup.find_all('dt', string=lambda text: text and 'género' in text.lower())
+        for genre_dt in genre_dts:
+            genre_dd = genre_dt.find_next_sibling('dd')
+            if genre_dd:
+                # Buscar enlaces en el dd
+                genre_links = genre_dd.find_all('a')
+                for link in genre_links:
+                    genre_text = link.get_text().strip()
+                    if genre_text:
+                        cleaned_genres = FilmAffinityHandler.clean_genre(genre_text)
+                        if cleaned_genres:
+                            # Si es una lista (caso Perros/Lobos), agregar cada elemento
+                            if isinstance(cleaned_genres, list):
+                                for single_genre in cleaned_genres:
+                                    if single_genre not in genres:
+                                        genres.append(single_genre)
+                            # Si es un string normal, agregar directamente
+                            else:
+                                if cleaned_genres not in genres:
+                                    genres.append(cleaned_genres)
+
+                # Si no hay enlaces, buscar texto directo
+                if not genre_links:
+                    genre_text = genre_dd.get_text().strip()
+                    # Dividir por comas o espacios múltiples
+                    genre_parts = re.split(r'[,\s]{2,}', genre_text)
+                    for part in genre_parts:
+                        part = part.strip()
+                        if part:
+                            cleaned_genres = FilmAffinityHandler.clean_genre(part)
+                            if cleaned_genres:
+                                if isinstance(cleaned_genres, list):
+                                    for single_genre in cleaned_genres:
+                                        if single_genre not in genres:
+                                            genres.append(single_genre)
+                                else:
+                                    if cleaned_genres not in genres:
+                                        genres.append(cleaned_genres)
+
+        # Estrategia 2: Buscar enlaces que contengan "/genre/"
+        if not genres:
+            genre_links = soup.find_all('a', href=re.compile(r'/genre/'))
+            for link in genre_links[:8]:  # Limitar para evitar spam
+                genre_text = link.get_text().strip()
+                if genre_text and genre_text.lower() not in ['ver más', 'more', 'género', '']:
+                    cleaned_genres = FilmAffinityHandler.clean_genre(genre_text)
+                    if cleaned_genres:
+                        if isinstance(cleaned_genres, list):
+                            for single_genre in cleaned_genres:
+                                if single_genre not in genres:
+                                    genres.append(single_genre)
+                        else:
+                            if cleaned_genres not in genres:
+                                genres.append(cleaned_genres)
+
+        # Estrategia 3: Buscar en meta tags
+        if not genres:
+            meta_desc = soup.find('meta', {'name': 'description'})
+            if meta_desc:
+                content = meta_desc.get('content', '')
+                if 'Género:' in content:
+                    genre_part = content.split('Género:')[1].split('|')[0].strip()
+                    genre_words = re.findall(r'\b[A-ZÁÉÍÓÚ][a-záéíóú]+\b', genre_part)
+                    for word in genre_words[:5]:  # Máximo 5 géneros
+                        cleaned_genres = FilmAffinityHandler.clean_genre(word)
+                        if cleaned_genres:
+                            if isinstance(cleaned_genres, list):
+                                for single_genre in cleaned_genres:
+                                    if single_genre not in genres:
+                                        genres.append(single_genre)
+                            else:
+                                if cleaned_genres not in genres:
+                                    genres.append(cleaned_genres)
+
+        print(f"DEBUG - Géneros encontrados: {genres}")
+
+        # Extraer reparto (primeros 6 actores)
+        actors = []
+        is_animation = False
+
+        # Verificar si es película de animación (volviendo a la lógica original)
+        if 'Animación' in genres or 'Animacion' in genres:
+            is_animation = True
+            print("DEBUG - Película de animación detectada, omitiendo extracción de actores")
+
+        if not is_animation:
+            # Estrategia 1: Buscar por dt con texto "Reparto"
+            cast_dts = soup.find_all('dt', string=lambda text: text and 'reparto' in text.lower())
+            for cast_dt in cast_dts:
+                cast_dd = cast_dt.find_next_sibling('dd')
+                if cast_dd:
+                    # Verificar si el contenido del reparto contiene "Animación"
+                    cast_content = cast_dd.get_text().lower()
+                    if 'animación' in cast_content or 'animacion' in cast_content:
+                        is_animation = True
+                        print("DEBUG - 'Animación' encontrada en reparto, omitiendo actores")
+                        break
+
+                    actor_links = cast_dd.find_all('a')
+                    for link in actor_links[:6]:  # Solo los primeros 6
+                        actor_name = link.get_text().strip()
+                        if actor_name and len(actor_name) > 2:
+                            cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
+                            if cleaned_actor and cleaned_actor not in actors:
+                                actors.append(cleaned_actor)
+
+                    # Si no hay suficientes actores con enlaces, buscar en texto
+                    if len(actors) < 3:
+                        cast_text = cast_dd.get_text()
+                        # Buscar nombres que parezcan actores (formato "Nombre Apellido")
+                        potential_actors = re.findall(r'\b[A-ZÁÉÍÓÚ][a-záéíóú]+\s+[A-ZÁÉÍÓÚ][a-záéíóú]+(?:\s+[A-ZÁÉÍÓÚ][a-záéíóú]+)?\b', cast_text)
+                        for actor_name in potential_actors[:6]:
+                            if len(actors) >= 6:
+                                break
+                            cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
+                            if cleaned_actor and cleaned_actor not in actors:
+                                actors.append(cleaned_actor)
+
+        # Estrategia 2: Buscar enlaces que contengan "/person.php" o "/person/" (solo si no es animación)
+        if not is_animation and len(actors) < 6:
+            person_patterns = [r'/person\.php', r'/person/']
+            for pattern in person_patterns:
+                person_links = soup.find_all('a', href=re.compile(pattern))
+                for link in person_links:
+                    if len(actors) >= 6:
+                        break
+                    actor_name = link.get_text().strip()
+                    if actor_name and len(actor_name) > 2 and len(actor_name) < 50:
+                        cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
+                        if cleaned_actor and cleaned_actor not in actors:
+                            actors.append(cleaned_actor)
+
+        # Estrategia 3: Buscar en meta description (solo si no es animación)
+        if not is_animation and len(actors) < 3:
+            meta_desc = soup.find('meta', {'name': 'description'})
+            if meta_desc:
+                content = meta_desc.get('content', '')
+                # Buscar patrones como "con Nombre Apellido, Nombre2 Apellido2"
+                potential_actors = re.findall(r'\b[A-ZÁÉÍÓÚ][a-záéíóú]+\s+[A-ZÁÉÍÓÚ][a-záéíóú]+\b', content)
+                for actor_name in potential_actors[:6]:
+                    if len(actors) >= 6:
+                        break
+                    # Filtrar nombres que no sean lugares o cosas comunes
+                    if not any(word in actor_name.lower() for word in ['nueva', 'york', 'estados', 'unidos', 'america', 'films']):
+                        cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
+                        if cleaned_actor and len(cleaned_actor) > 3 and cleaned_actor not in actors:
+                            actors.append(cleaned_actor)
+
+        if is_animation:
+            print("DEBUG - Película de animación: no se agregaron actores")
+        else:
+            print(f"DEBUG - Actores encontrados: {actors}")
+
+        # Dirección (solo se guarda en los datos estructurados)
+        directors = []
+        director_dts = soup.find_all('dt', string=lambda text: text and 'dirección' in text.lower())
+        for director_dt in director_dts:
+            director_dd = director_dt.find_next_sibling('dd')
+            if director_dd:
+                for link in director_dd.find_all('a'):
+                    name = link.get_text().strip()
+                    if name and name not in directors:
+                        directors.append(name)
+        
+        return {
+            'title': title,
+            'director': directors,
+            'actors': actors,
+            'genres': genres,
+            'is_animation': is_animation
+        }
+
+    @staticmethod
+    def render_hashtags(info):
+        """Genera la línea de hashtags a partir de los datos estructurados"""
+        actors = info['actors']
+        genres = info['genres']
+        
+        # Formatear resultado
+        if actors or genres:
+            result_parts = ['#Películas', '#MP4']
+
+            # Agregar actores
+            for actor in actors[:6]:  # Máximo 6 actores
+                result_parts.append(f'#{actor}')
+
+            # Agregar géneros en el orden que aparecen
+            for genre in genres:
+                result_parts.append(f'#{genre}')
+
+            result = ' '.join(result_parts)
+            print(f"DEBUG - Resultado final: {result}")
+            return result
+        else:
+            print("DEBUG - No se encontraron géneros ni actores")
+            raise Exception("No se encontraron géneros ni actores en la página")
+
     @staticmethod
     def extract_movie_info(url, retries=2):
         driver = None
@@ -126,190 +339,29 @@ class FilmAffinityHandler:
                     EC.presence_of_element_located((By.TAG_NAME, "body"))
                 )
                 
-                # Esperar un poco más para asegurar que todo el contenido dinámico cargue
-                time.sleep(3)
+                # Esperar a que aparezcan los bloques de género/reparto (máximo 3 segundos)
+                # con snapshots del DOM en lugar de una espera fija
+                wait_for_snapshot(
+                    driver,
+                    lambda snapshot: any(
+                        'género' in t['term'].lower() or 'reparto' in t['term'].lower()
+                        for t in snapshot['terms']
+                    ),
+                    timeout=3
+                )
                 
                 # Obtener el HTML de la página
                 page_source = driver.page_source
                 soup = BeautifulSoup(page_source, 'html.parser')
                 
-                print(f"DEBUG - Título de la página: {soup.title.string if soup.title else 'No title'}")
-                
-                # Extraer géneros usando múltiples estrategias
-                genres = []
-                
-                # Estrategia 1: Buscar por dt con texto "Género"
-                genre_dts = soup.find_all('dt', string=lambda text: text and 'género' in text.lower())
-                for genre_dt in genre_dts:
-                    genre_dd = genre_dt.find_next_sibling('dd')
-                    if genre_dd:
-                        # Buscar enlaces en el dd
-                        genre_links = genre_dd.find_all('a')
-                        for link in genre_links:
-                            genre_text = link.get_text().strip()
-                            if genre_text:
-                                cleaned_genres = FilmAffinityHandler.clean_genre(genre_text)
-                                if cleaned_genres:
-                                    # Si es una lista (caso Perros/Lobos), agregar cada elemento
-                                    if isinstance(cleaned_genres, list):
-                                        for single_genre in cleaned_genres:
-                                            if single_genre not in genres:
-                                                genres.append(single_genre)
-                                    # Si es un string normal, agregar directamente
-                                    else:
-                                        if cleaned_genres not in genres:
-                                            genres.append(cleaned_genres)
-                        
-                        # Si no hay enlaces, buscar texto directo
-                        if not genre_links:
-                            genre_text = genre_dd.get_text().strip()
-                            # Dividir por comas o espacios múltiples
-                            genre_parts = re.split(r'[,\s]{2,}', genre_text)
-                            for part in genre_parts:
-                                part = part.strip()
-                                if part:
-                                    cleaned_genres = FilmAffinityHandler.clean_genre(part)
-                                    if cleaned_genres:
-                                        if isinstance(cleaned_genres, list):
-                                            for single_genre in cleaned_genres:
-                                                if single_genre not in genres:
-                                                    genres.append(single_genre)
-                                        else:
-                                            if cleaned_genres not in genres:
-                                                genres.append(cleaned_genres)
-                
-                # Estrategia 2: Buscar enlaces que contengan "/genre/"
-                if not genres:
-                    genre_links = soup.find_all('a', href=re.compile(r'/genre/'))
-                    for link in genre_links[:8]:  # Limitar para evitar spam
-                        genre_text = link.get_text().strip()
-                        if genre_text and genre_text.lower() not in ['ver más', 'more', 'género', '']:
-                            cleaned_genres = FilmAffinityHandler.clean_genre(genre_text)
-                            if cleaned_genres:
-                                if isinstance(cleaned_genres, list):
-                                    for single_genre in cleaned_genres:
-                                        if single_genre not in genres:
-                                            genres.append(single_genre)
-                                else:
-                                    if cleaned_genres not in genres:
-                                        genres.append(cleaned_genres)
-                
-                # Estrategia 3: Buscar en meta tags
-                if not genres:
-                    meta_desc = soup.find('meta', {'name': 'description'})
-                    if meta_desc:
-                        content = meta_desc.get('content', '')
-                        if 'Género:' in content:
-                            genre_part = content.split('Género:')[1].split('|')[0].strip()
-                            genre_words = re.findall(r'\b[A-ZÁÉÍÓÚ][a-záéíóú]+\b', genre_part)
-                            for word in genre_words[:5]:  # Máximo 5 géneros
-                                cleaned_genres = FilmAffinityHandler.clean_genre(word)
-                                if cleaned_genres:
-                                    if isinstance(cleaned_genres, list):
-                                        for single_genre in cleaned_genres:
-                                            if single_genre not in genres:
-                                                genres.append(single_genre)
-                                    else:
-                                        if cleaned_genres not in genres:
-                                            genres.append(cleaned_genres)
+                info = FilmAffinityHandler._parse_movie_info(soup)
+                result = FilmAffinityHandler.render_hashtags(info)
                 
-                print(f"DEBUG - Géneros encontrados: {genres}")
-                
-                # Extraer reparto (primeros 6 actores)
-                actors = []
-                is_animation = False
-                
-                # Verificar si es película de animación (volviendo a la lógica original)
-                if 'Animación' in genres or 'Animacion' in genres:
-                    is_animation = True
-                    print("DEBUG - Película de animación detectada, omitiendo extracción de actores")
-                
-                if not is_animation:
-                    # Estrategia 1: Buscar por dt con texto "Reparto"
-                    cast_dts = soup.find_all('dt', string=lambda text: text and 'reparto' in text.lower())
-                    for cast_dt in cast_dts:
-                        cast_dd = cast_dt.find_next_sibling('dd')
-                        if cast_dd:
-                            # Verificar si el contenido del reparto contiene "Animación"
-                            cast_content = cast_dd.get_text().lower()
-                            if 'animación' in cast_content or 'animacion' in cast_content:
-                                is_animation = True
-                                print("DEBUG - 'Animación' encontrada en reparto, omitiendo actores")
-                                break
-                            
-                            actor_links = cast_dd.find_all('a')
-                            for link in actor_links[:6]:  # Solo los primeros 6
-                                actor_name = link.get_text().strip()
-                                if actor_name and len(actor_name) > 2:
-                                    cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
-                                    if cleaned_actor and cleaned_actor not in actors:
-                                        actors.append(cleaned_actor)
-                            
-                            # Si no hay suficientes actores con enlaces, buscar en texto
-                            if len(actors) < 3:
-                                cast_text = cast_dd.get_text()
-                                # Buscar nombres que parezcan actores (formato "Nombre Apellido")
-                                potential_actors = re.findall(r'\b[A-ZÁÉÍÓÚ][a-záéíóú]+\s+[A-ZÁÉÍÓÚ][a-záéíóú]+(?:\s+[A-ZÁÉÍÓÚ][a-záéíóú]+)?\b', cast_text)
-                                for actor_name in potential_actors[:6]:
-                                    if len(actors) >= 6:
-                                        break
-                                    cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
-                                    if cleaned_actor and cleaned_actor not in actors:
-                                        actors.append(cleaned_actor)
-                
-                # Estrategia 2: Buscar enlaces que contengan "/person.php" o "/person/" (solo si no es animación)
-                if not is_animation and len(actors) < 6:
-                    person_patterns = [r'/person\.php', r'/person/']
-                    for pattern in person_patterns:
-                        person_links = soup.find_all('a', href=re.compile(pattern))
-                        for link in person_links:
-                            if len(actors) >= 6:
-                                break
-                            actor_name = link.get_text().strip()
-                            if actor_name and len(actor_name) > 2 and len(actor_name) < 50:
-                                cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
-                                if cleaned_actor and cleaned_actor not in actors:
-                                    actors.append(cleaned_actor)
-                
-                # Estrategia 3: Buscar en meta description (solo si no es animación)
-                if not is_animation and len(actors) < 3:
-                    meta_desc = soup.find('meta', {'name': 'description'})
-                    if meta_desc:
-                        content = meta_desc.get('content', '')
-                        # Buscar patrones como "con Nombre Apellido, Nombre2 Apellido2"
-                        potential_actors = re.findall(r'\b[A-ZÁÉÍÓÚ][a-záéíóú]+\s+[A-ZÁÉÍÓÚ][a-záéíóú]+\b', content)
-                        for actor_name in potential_actors[:6]:
-                            if len(actors) >= 6:
-                                break
-                            # Filtrar nombres que no sean lugares o cosas comunes
-                            if not any(word in actor_name.lower() for word in ['nueva', 'york', 'estados', 'unidos', 'america', 'films']):
-                                cleaned_actor = FilmAffinityHandler.clean_name(actor_name)
-                                if cleaned_actor and len(cleaned_actor) > 3 and cleaned_actor not in actors:
-                                    actors.append(cleaned_actor)
-                
-                if is_animation:
-                    print("DEBUG - Película de animación: no se agregaron actores")
-                else:
-                    print(f"DEBUG - Actores encontrados: {actors}")
-                
-                # Formatear resultado
-                if actors or genres:
-                    result_parts = ['#Películas', '#MP4']
-                    
-                    # Agregar actores
-                    for actor in actors[:6]:  # Máximo 6 actores
-                        result_parts.append(f'#{actor}')
-                    
-                    # Agregar géneros en el orden que aparecen
-                    for genre in genres:
-                        result_parts.append(f'#{genre}')
-                    
-                    result = ' '.join(result_parts)
-                    print(f"DEBUG - Resultado final: {result}")
-                    return result
-                else:
-                    print("DEBUG - No se encontraron géneros ni actores")
-                    raise Exception("No se encontraron géneros ni actores en la página")
+                # Guardar ficha y hashtags para que las repeticiones no abran Chrome
+                film_id = film_id_from_url(url)
+                if film_id:
+                    film_cache.put(film_id, url, info, result)
+                return result
                     
             except Exception as e:
                 print(f"DEBUG - Error en intento {attempt + 1}: {str(e)}")
@@ -318,21 +370,18 @@ class FilmAffinityHandler:
                 time.sleep(3)
             finally:
                 if driver:
-                    try:
-                        driver.quit()
-                    except:
-                        pass
+                    browser_registry.release(driver)
         
         raise Exception("No se pudo extraer información después de varios intentos")
 
     @staticmethod
-    def process_url(url):
+    def process_url(url, retries=2):
         """Método principal para procesar una URL de FilmAffinity"""
         try:
             if not FilmAffinityHandler.is_filmaffinity_link(url):
                 raise Exception("La URL no es de FilmAffinity")
             
-            return FilmAffinityHandler.extract_movie_info(url)
+            return FilmAffinityHandler.extract_movie_info(url, retries)
             
         except Exception as e:
             raise Exception(f"Error al procesar URL de FilmAffinity: {str(e)}")
\ No newline at end of file
@@ -1,51 +1,164 @@
-from .mediafire import MediaFireHandler
-from .megaup import MegaUpHandler
-from .a2zapk import A2ZAPKHandler
-from .apk4free import APK4FreeHandler
-from .apkdone import APKDoneHandler
-from .uptodown import UptodownHandler
-from .liteapks import LiteAPKsHandler
-from .apkdone_info_extractor import APKDoneInfoExtractor
-from .FilmAffinity import FilmAffinityHandler
+import sys
+import asyncio
 
+from .browser_registry import browser_registry
+from .async_http import ASYNC_HTTP_ENABLED
+from .hedging import hedger
+from .film_cache import film_cache
+from .link_store import link_store
+from .circuit_breaker import circuit_breaker, SiteUnavailableError, RecentFailureError
+from .retry import is_retryable, HANDLER_ATTEMPTS
+from .registry import handler_registry, load_handler, COST_HTTP, COST_BROWSER
+
+# Las clases de handlers se importan en el primer uso (selenium, cloudscraper y bs4
+# no se cargan al arrancar): `from handlers import MegaUpHandler` sigue funcionando
+_LAZY_HANDLERS = {
+    'MediaFireHandler': 'handlers.mediafire:MediaFireHandler',
+    'MegaUpHandler': 'handlers.megaup:MegaUpHandler',
+    'A2ZAPKHandler': 'handlers.a2zapk:A2ZAPKHandler',
+    'APK4FreeHandler': 'handlers.apk4free:APK4FreeHandler',
+    'APKDoneHandler': 'handlers.apkdone:APKDoneHandler',
+    'UptodownHandler': 'handlers.uptodown:UptodownHandler',
+    'LiteAPKsHandler': 'handlers.liteapks:LiteAPKsHandler',
+    'APKDoneInfoExtractor': 'handlers.apkdone_info_extractor:APKDoneInfoExtractor',
+    'FilmAffinityHandler': 'handlers.FilmAffinity:FilmAffinityHandler',
+}
+
+
+def __getattr__(name):
+    path = _LAZY_HANDLERS.get(name)
+    if path is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return load_handler(path)
+
+
+
+def resolve_link(url):
+    """Handler, clase de costo y URL canónica de un enlace (None si no está soportado)"""
+    return handler_registry.resolve(url)
 
 def is_supported_link(url):
-    return (MediaFireHandler.is_mediafire_link(url) or 
-            MegaUpHandler.is_megaup_link(url) or
-            A2ZAPKHandler.is_a2zapk_link(url) or
-            APK4FreeHandler.is_apk4free_link(url) or
-            APKDoneHandler.is_apkdone_link(url) or
-            UptodownHandler.is_uptodown_link(url) or
-            LiteAPKsHandler.is_liteapks_link(url) or
-            FilmAffinityHandler.is_filmaffinity_link(url))
+    return resolve_link(url) is not None
+
+# Sitios que necesitan Chrome: se resuelven en el worker de navegador si está activo
+def is_browser_link(url):
+    match = resolve_link(url)
+    return match is not None and match.cost == COST_BROWSER
 
 def get_direct_link(url):
-    if MediaFireHandler.is_mediafire_link(url):
-        return MediaFireHandler.get_direct_link(url)
-    elif MegaUpHandler.is_megaup_link(url):
-        return MegaUpHandler.get_direct_link(url)
-    elif A2ZAPKHandler.is_a2zapk_link(url):
-        return A2ZAPKHandler.get_direct_link(url)
-    elif APK4FreeHandler.is_apk4free_link(url):
-        return APK4FreeHandler.get_direct_link(url)
-    elif APKDoneHandler.is_apkdone_link(url):
-        return APKDoneHandler.get_direct_link(url)
-    elif UptodownHandler.is_uptodown_link(url):
-        return UptodownHandler.get_direct_link(url)
-    elif LiteAPKsHandler.is_liteapks_link(url):
-        return LiteAPKsHandler.get_direct_link(url)
-    elif FilmAffinityHandler.is_filmaffinity_link(url):
-        return FilmAffinityHandler.process_url(url)
-    raise Exception("Servicio no soportado")
+    match = resolve_link(url)
+    if match is None:
+        raise Exception("Servicio no soportado")
+    
+    # Las fichas de FilmAffinity no son enlaces: no pasan por link_store
+    if match.spec.key == 'filmaffinity':
+        return _filmaffinity_info(match)
+
+    # URLs populares: enlace guardado y refrescado en segundo plano antes de vencer
+    stored = link_store.lookup(match)
+    if stored:
+        return stored
+    link = _resolve_guarded(match)
+    link_store.remember(match, link)
+    return link
+
+def _filmaffinity_info(match):
+    """Fichas ya extraídas: se responden desde SQLite sin abrir Chrome"""
+    cached = film_cache.lookup(match.url, refresh=lambda: _resolve_guarded(match))
+    if cached:
+        return cached
+    return _resolve_guarded(match)
+
+def _resolve_guarded(match):
+    """Resolución detrás del circuito del sitio y de la caché negativa de la URL"""
+    circuit_breaker.check(match)
+    try:
+        link = _resolve_uncached(match)
+    except Exception as e:
+        circuit_breaker.record_failure(match, e, remember=not is_retryable(e))
+        raise
+    except BaseException:
+        circuit_breaker.release_probe(match)
+        raise
+    circuit_breaker.record_success(match)
+    return link
+
+def _resolve_uncached(match):
+    if match.cost == COST_BROWSER:
+        from browser_worker import browser_workers
+        if browser_workers.enabled:
+            return browser_workers.resolve(match.url, browser_registry.current_owner())
+    return _resolve_match(match)
+
+# Resolución en el proceso actual (también la usa el worker de navegador)
+def resolve_in_process(url):
+    match = resolve_link(url)
+    if match is None:
+        raise Exception("Servicio no soportado")
+    return _resolve_match(match)
+
+def _resolve_match(match):
+    resolver = match.resolver()
+    # Un solo intento: los reintentos con backoff los programa la cola (handlers/retry.py)
+    # Los sitios en HEDGE_SITES lanzan un respaldo cuando se supera su p90
+    if match.spec.key in hedger.sites:
+        return hedger.run(match.spec.key, lambda: resolver(match.url, HANDLER_ATTEMPTS))
+    return resolver(match.url, HANDLER_ATTEMPTS)
+
+def _async_match(url):
+    """Coincidencia del registro si el handler tiene variante asíncrona (aget_direct_link)"""
+    if not ASYNC_HTTP_ENABLED:
+        return None
+    match = resolve_link(url)
+    if match is None or match.cost != COST_HTTP or not hasattr(match.handler, 'aget_direct_link'):
+        return None
+    return match
+
+def supports_async(url):
+    return _async_match(url) is not None
+
+async def aget_direct_link(url):
+    """Resuelve en el event loop si el handler tiene variante asíncrona, si no en un hilo"""
+    match = _async_match(url)
+    if match is not None:
+        stored = link_store.lookup(match)
+        if stored:
+            return stored
+        circuit_breaker.check(match)
+        try:
+            link = await hedger.arun(match.spec.key, lambda: match.handler.aget_direct_link(match.url, HANDLER_ATTEMPTS))
+        except Exception as e:
+            circuit_breaker.record_failure(match, e, remember=not is_retryable(e))
+            raise
+        except BaseException:
+            circuit_breaker.release_probe(match)
+            raise
+        circuit_breaker.record_success(match)
+        link_store.remember(match, link)
+        return link
+    return await asyncio.to_thread(get_direct_link, url)
 
 # Función original para carpetas MediaFire
 def process_mediafire_folder(url):
-    return MediaFireHandler.process_folder(url)
+    return load_handler(_LAZY_HANDLERS['MediaFireHandler']).process_folder(url)
+
+# Latencia y proporción de tráfico por nivel del resolvedor de MediaFire (vacío si no se cargó)
+def mediafire_tier_stats():
+    module = sys.modules.get('handlers.mediafire')
+    return module.tier_metrics.stats() if module else {}
+
+# Resolución de carpetas MediaFire: generador de {'name', 'url', 'link' | 'error'}
+def resolve_mediafire_folder(url):
+    from .mediafire_folder import resolve_folder
+    return resolve_folder(url)
 
 # Función para obtener información formateada de APKDone
 def get_apkdone_formatted_info(url):
-    return APKDoneInfoExtractor.get_formatted_info(url)
+    return load_handler(_LAZY_HANDLERS['APKDoneInfoExtractor']).get_formatted_info(url)
 
 # Función para obtener información formateada de FilmAffinity
 def get_filmaffinity_formatted_info(url):
-    return FilmAffinityHandler.process_url(url)
\ No newline at end of file
+    match = resolve_link(url)
+    if match is None or match.spec.key != 'filmaffinity':
+        raise Exception("La URL no es de FilmAffinity")
+    return _filmaffinity_info(match)
\ No newline at end of file
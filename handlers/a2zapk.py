@@ -12,6 +12,8 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
 from webdriver_manager.chrome import ChromeDriverManager
+from .browser_registry import browser_registry
+from .dom_snapshot import take_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,9 @@ class A2ZAPKHandler:
     @staticmethod
     def _setup_driver():
         """Configuración del driver Chrome - Simplificada como en AZ2APK.txt"""
+        # No lanzar otro Chrome si los navegadores ya superan el presupuesto de memoria
+        browser_registry.wait_for_capacity()
+        
         chrome_options = Options()
         
         # Configuraciones básicas para Ubuntu/servidor
@@ -47,91 +52,104 @@ class A2ZAPKHandler:
         service = Service(ChromeDriverManager().install())
         driver = webdriver.Chrome(service=service, options=chrome_options)
         driver.set_page_load_timeout(30)
-        return driver
+        return browser_registry.register(driver, label='a2zapk')
+
+    # Reglas de la cascada original (AZ2APK.txt) en orden de prioridad
+    LINK_RULES = [
+        'span_DOWNLOAD',     # //span[contains(text(), 'DOWNLOAD')]/ancestor::a
+        'span_Download',     # //span[contains(text(), 'Download')]/ancestor::a
+        'href_apk',          # //a[contains(@href, '.apk')]
+        'text_download',     # //a[contains(text(), 'download') and contains(@href, 'http')]
+        'class_download',    # //a[contains(@class, 'download')]
+        'button_download',   # //button[contains(text(), 'download')]/parent::a
+        'fallback',          # Primeros 10 enlaces por patrón de URL o texto
+    ]
+
+    # Patrones de la búsqueda de emergencia sobre el atributo href crudo
+    EMERGENCY_RULES = ['regex_apk', 'regex_download', 'regex_file']
 
     @staticmethod
-    def _extract_link_ultrafast(driver):
-        """Extracción ultrarrápida exactamente como en AZ2APK.txt"""
-        try:
-            logger.info("Iniciando extracción ultrarrápida...")
-            
-            # Búsqueda múltiple simultánea (exactamente como en AZ2APK.txt)
-            potential_selectors = [
-                "//span[contains(text(), 'DOWNLOAD')]/ancestor::a",
-                "//span[contains(text(), 'Download')]/ancestor::a", 
-                "//a[contains(@href, '.apk')]",
-                "//a[contains(text(), 'download') and contains(@href, 'http')]",
-                "//a[contains(@class, 'download')]",
-                "//button[contains(text(), 'download')]/parent::a",
-            ]
-            
-            # Buscar todos los elementos posibles de una vez
-            for selector in potential_selectors:
-                try:
-                    elements = driver.find_elements(By.XPATH, selector)
-                    if elements:
-                        href = elements[0].get_attribute('href')
-                        if href and 'http' in href and href != driver.current_url:
-                            logger.info(f"Enlace encontrado con selector: {selector}")
-                            return href
-                except Exception as e:
-                    logger.debug(f"Error con selector {selector}: {e}")
-                    continue
-            
-            # Fallback: buscar CUALQUIER enlace (como en AZ2APK.txt)
-            logger.info("Iniciando búsqueda fallback...")
-            all_links = driver.find_elements(By.TAG_NAME, "a")
-            for link in all_links[:10]:  # Solo primeros 10 para velocidad (como en AZ2APK.txt)
-                try:
-                    href = link.get_attribute('href')
-                    text = link.text.lower()
-                    
-                    if href and href != driver.current_url:
-                        if any(pattern in href.lower() for pattern in ['.apk', 'download', 'file']):
-                            logger.info(f"Enlace encontrado por patrón URL: {href}")
-                            return href
-                        if href and any(pattern in text for pattern in ['download', 'get', 'direct']):
-                            logger.info(f"Enlace encontrado por patrón texto: {href}")
-                            return href
-                except Exception as e:
-                    logger.debug(f"Error procesando enlace: {e}")
-                    continue
-                    
-            logger.warning("No se encontró enlace con extracción ultrarrápida")
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error en extracción ultrarrápida: {e}")
-            return None
+    def _collect_link_candidates(driver):
+        """Obtiene todos los enlaces candidatos con su regla a partir de un solo snapshot del DOM"""
+        snapshot = take_snapshot(driver)
+        candidates = []
+
+        for link in snapshot['links']:
+            index, href, raw_href = link['index'], link['href'], link['raw_href']
+            if 'DOWNLOAD' in link['span_text']:
+                candidates.append({'rule': 'span_DOWNLOAD', 'index': index, 'href': href})
+            if 'Download' in link['span_text']:
+                candidates.append({'rule': 'span_Download', 'index': index, 'href': href})
+            if '.apk' in raw_href:
+                candidates.append({'rule': 'href_apk', 'index': index, 'href': href})
+            if 'download' in link['own_text'] and 'http' in raw_href:
+                candidates.append({'rule': 'text_download', 'index': index, 'href': href})
+            if 'download' in link['classes']:
+                candidates.append({'rule': 'class_download', 'index': index, 'href': href})
+
+        for button in snapshot['buttons']:
+            if 'download' in button['own_text'] and button['parent_href']:
+                candidates.append({'rule': 'button_download', 'index': button['index'], 'href': button['parent_href']})
+
+        for link in snapshot['links'][:10]:
+            href, text = link['href'].lower(), link['text'].lower()
+            if (any(pattern in href for pattern in ['.apk', 'download', 'file']) or
+                    any(pattern in text for pattern in ['download', 'get', 'direct'])):
+                candidates.append({'rule': 'fallback', 'index': link['index'], 'href': link['href']})
+
+        for index, raw_href in enumerate(snapshot['raw_hrefs']):
+            lower = raw_href.lower()
+            for pattern, rule in [('.apk', 'regex_apk'), ('download', 'regex_download'), ('file', 'regex_file')]:
+                if pattern in lower:
+                    candidates.append({'rule': rule, 'index': index, 'href': raw_href})
+
+        return {'url': snapshot['url'], 'candidates': candidates}
 
     @staticmethod
-    def _extract_with_regex_emergency(driver):
-        """Búsqueda de emergencia como en AZ2APK.txt"""
-        try:
-            logger.info("Iniciando búsqueda de emergencia...")
-            page_source = driver.page_source
-            
-            # Patrones exactos de AZ2APK.txt
-            patterns = [
-                r'href=["\']([^"\']*\.apk[^"\']*)["\']',
-                r'href=["\']([^"\']*download[^"\']*)["\']',
-                r'href=["\']([^"\']*file[^"\']*)["\']'
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, page_source, re.IGNORECASE)
-                if matches:
-                    for match in matches:
-                        if match and 'http' in match and match != driver.current_url:
-                            logger.info(f"Enlace encontrado con regex: {match}")
-                            return match
-            
-            logger.warning("No se encontró enlace con búsqueda de emergencia")
-            return None
-                        
-        except Exception as e:
-            logger.error(f"Error en búsqueda de emergencia: {e}")
-            return None
+    def _rank_link_candidates(snapshot, rules):
+        """Devuelve el mejor candidato válido según el orden de las reglas"""
+        priority = {rule: position for position, rule in enumerate(rules)}
+        current_url = snapshot['url']
+
+        ranked = sorted(
+            (c for c in snapshot['candidates'] if c.get('rule') in priority),
+            key=lambda c: (priority[c['rule']], c.get('index', 0))
+        )
+        for candidate in ranked:
+            href = candidate.get('href')
+            if href and 'http' in href and href != current_url:
+                return candidate
+        return None
+
+    @staticmethod
+    def _extract_link_ultrafast(driver, snapshot=None):
+        """Extracción ultrarrápida: todas las reglas de AZ2APK.txt en una sola evaluación JS"""
+        logger.info("Iniciando extracción ultrarrápida...")
+        if snapshot is None:
+            snapshot = A2ZAPKHandler._collect_link_candidates(driver)
+
+        candidate = A2ZAPKHandler._rank_link_candidates(snapshot, A2ZAPKHandler.LINK_RULES)
+        if candidate:
+            logger.info(f"Enlace encontrado con regla: {candidate['rule']}")
+            return candidate['href']
+
+        logger.warning("No se encontró enlace con extracción ultrarrápida")
+        return None
+
+    @staticmethod
+    def _extract_with_regex_emergency(driver, snapshot=None):
+        """Búsqueda de emergencia sobre los href crudos, sin descargar page_source"""
+        logger.info("Iniciando búsqueda de emergencia...")
+        if snapshot is None:
+            snapshot = A2ZAPKHandler._collect_link_candidates(driver)
+
+        candidate = A2ZAPKHandler._rank_link_candidates(snapshot, A2ZAPKHandler.EMERGENCY_RULES)
+        if candidate:
+            logger.info(f"Enlace encontrado con regex: {candidate['href']}")
+            return candidate['href']
+
+        logger.warning("No se encontró enlace con búsqueda de emergencia")
+        return None
 
     @staticmethod
     def _try_duplicate_tab(driver, original_window):
@@ -213,9 +231,12 @@ class A2ZAPKHandler:
             return False
 
     @staticmethod
-    def get_direct_link(url, retries=2):
+    def get_direct_link(url, retries=3):
         """
         Obtiene el enlace directo siguiendo exactamente la estrategia de AZ2APK.txt
+
+        Un solo intento: retries se acepta por la interfaz común de los handlers
+        y los reintentos (con backoff y un navegador nuevo) los programa la cola.
         """
         driver = None
         try:
@@ -296,8 +317,9 @@ class A2ZAPKHandler:
             current_url = driver.current_url
             logger.info(f"🔍 URL original ahora: {current_url}")
             
-            # EXTRACCIÓN ULTRARRÁPIDA
-            download_link = A2ZAPKHandler._extract_link_ultrafast(driver)
+            # EXTRACCIÓN ULTRARRÁPIDA (un solo round-trip para todas las reglas)
+            snapshot = A2ZAPKHandler._collect_link_candidates(driver)
+            download_link = A2ZAPKHandler._extract_link_ultrafast(driver, snapshot)
             
             extraction_time = time.time() - start_time
             logger.info(f"⏱️ Tiempo de extracción: {extraction_time:.2f} segundos")
@@ -322,7 +344,7 @@ class A2ZAPKHandler:
                 logger.info("🔍 Intentando búsqueda de emergencia...")
                 
                 # Búsqueda de emergencia (como en AZ2APK.txt)
-                emergency_link = A2ZAPKHandler._extract_with_regex_emergency(driver)
+                emergency_link = A2ZAPKHandler._extract_with_regex_emergency(driver, snapshot)
                 
                 if emergency_link:
                     emergency_time = time.time() - start_time
@@ -334,11 +356,7 @@ class A2ZAPKHandler:
 
         except Exception as e:
             logger.error(f"Error en intento: {str(e)}")
-            if retries > 0:
-                logger.info(f"🔄 Reintentando... ({retries} intentos restantes)")
-                time.sleep(3)
-                return A2ZAPKHandler.get_direct_link(url, retries-1)
-            raise Exception(f"Error al procesar enlace A2ZAPK después de múltiples intentos: {str(e)}")
+            raise Exception(f"Error al procesar enlace A2ZAPK: {str(e)}") from e
             
         finally:
             if driver:
@@ -351,7 +369,7 @@ class A2ZAPKHandler:
                                 driver.close()
                             except:
                                 pass
-                    driver.quit()
+                    browser_registry.release(driver)
                     logger.info("🚪 Driver cerrado correctamente")
                 except Exception as e:
                     logger.warning(f"Error cerrando driver: {e}")
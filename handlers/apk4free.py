@@ -1,8 +1,13 @@
 import re
 import time
+import asyncio
 import cloudscraper
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
+from .async_http import fetch, CloudflareChallenge
+from .page_fetch import fetch_pages, parsed_page, aextract
+from .http_cache import cached_session
+from .strategy_stats import strategy_stats
+from .retry import link_not_found
 
 class APK4FreeHandler:
     @staticmethod
@@ -12,12 +17,13 @@ class APK4FreeHandler:
 
     @staticmethod
     def get_scraper():
-        return cloudscraper.create_scraper(browser={
+        # Las páginas pasan por la caché HTTP en disco (revalidación con ETag/Last-Modified)
+        return cached_session(cloudscraper.create_scraper(browser={
             'browser': 'chrome',
             'platform': 'windows',
             'mobile': False,
             'desktop': True,
-        }, delay=1)
+        }, delay=1))
 
     @staticmethod
     def normalize_url(url):
@@ -39,8 +45,56 @@ class APK4FreeHandler:
         return url
 
     @staticmethod
-    def get_direct_link(url, retries=3):
-        scraper = APK4FreeHandler.get_scraper()
+    def _by_links_section(soup):
+        # Primer botón después de "Download links"
+        download_links_text = soup.find(text=re.compile(r'Download links', re.IGNORECASE))
+        if download_links_text and download_links_text.parent:
+            next_link = download_links_text.parent.find_next('a', class_='buttond downloadAPK dapk_b')
+            if next_link and next_link.get('href', '').startswith('http'):
+                return next_link['href']
+        return None
+
+    @staticmethod
+    def _by_button_class(soup):
+        # Cualquier enlace con la clase específica
+        download_button = soup.find('a', class_='buttond downloadAPK dapk_b')
+        if download_button and download_button.get('href', '').startswith('http'):
+            return download_button['href']
+        return None
+
+    @staticmethod
+    def _by_files_domain(soup):
+        # Enlaces que apunten a files.apk4free.net
+        for link in soup.find_all('a', href=True):
+            if 'files.apk4free.net' in link['href']:
+                return link['href']
+        return None
+
+    @staticmethod
+    def _by_script(soup):
+        # Enlaces de descarga dentro de JavaScript
+        for script in soup.find_all('script'):
+            if script.string:
+                matches = re.findall(r'(https?://files\.apk4free\.net/[^\s"\']+)', script.string)
+                if matches:
+                    return matches[0]
+        return None
+
+    # Métodos de extracción en su orden original (del más preciso al más amplio)
+    STRATEGIES = ('_by_links_section', '_by_button_class', '_by_files_domain', '_by_script')
+
+    @staticmethod
+    def _extract_direct_link(soup):
+        """Busca el enlace directo en el HTML ya parseado, empezando por el método que más acierta"""
+        strategies = [(name, getattr(APK4FreeHandler, name)) for name in APK4FreeHandler.STRATEGIES]
+        direct_url, method = strategy_stats.run('apk4free', strategies, soup)
+        if direct_url:
+            print(f"Enlace encontrado ({method}): {direct_url}")
+        return direct_url
+
+    @staticmethod
+    def get_direct_link(url, retries=3, scraper=None, prefetched=None):
+        scraper = scraper or APK4FreeHandler.get_scraper()
         
         # Normalizar URL primero
         download_url = APK4FreeHandler.normalize_url(url)
@@ -49,57 +103,26 @@ class APK4FreeHandler:
             try:
                 print(f"Intento {attempt + 1}: Accediendo a {download_url}")
                 
-                # Hacer request a la página de descarga
-                response = scraper.get(download_url)
-                response.raise_for_status()
+                # Hacer request a la página de descarga (en el primer intento se usa
+                # la página ya descargada por get_download_info, si la hay)
+                if attempt == 0 and prefetched is not None:
+                    response = prefetched
+                else:
+                    response = scraper.get(download_url)
+                    response.raise_for_status()
                 
                 # Esperar 6 segundos como mencionas
                 print("Esperando 6 segundos...")
                 time.sleep(6)
                 
                 # Parsear HTML
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Método 1: Buscar el primer botón después de "Download links"
-                download_links_text = soup.find(text=re.compile(r'Download links', re.IGNORECASE))
-                if download_links_text:
-                    # Buscar el elemento padre que contiene "Download links"
-                    parent = download_links_text.parent
-                    if parent:
-                        # Buscar el primer enlace con clase buttond downloadAPK dapk_b después del texto
-                        next_link = parent.find_next('a', class_='buttond downloadAPK dapk_b')
-                        if next_link and next_link.get('href'):
-                            direct_url = next_link['href']
-                            if direct_url.startswith('http'):
-                                print(f"Enlace encontrado (Método 1): {direct_url}")
-                                return direct_url
-
-                # Método 2: Buscar cualquier enlace con la clase específica
-                download_button = soup.find('a', class_='buttond downloadAPK dapk_b')
-                if download_button and download_button.get('href'):
-                    direct_url = download_button['href']
-                    if direct_url.startswith('http'):
-                        print(f"Enlace encontrado (Método 2): {direct_url}")
-                        return direct_url
-
-                # Método 3: Buscar enlaces que apunten a files.apk4free.net
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    if 'files.apk4free.net' in href:
-                        print(f"Enlace encontrado (Método 3): {href}")
-                        return href
-
-                # Método 4: Buscar en JavaScript si hay algún enlace de descarga
-                for script in soup.find_all('script'):
-                    if script.string:
-                        # Buscar patrones de URL en el JavaScript
-                        matches = re.findall(r'(https?://files\.apk4free\.net/[^\s"\']+)', script.string)
-                        if matches:
-                            print(f"Enlace encontrado (Método 4): {matches[0]}")
-                            return matches[0]
+                soup = parsed_page(response)
+                direct_url = APK4FreeHandler._extract_direct_link(soup)
+                if direct_url:
+                    return direct_url
 
                 # Si no se encontró nada, intentar hacer un segundo request después de más tiempo
-                if attempt == 0:
+                if attempt == 0 and retries > 1:
                     print("No se encontró enlace, esperando más tiempo...")
                     time.sleep(5)
                     continue
@@ -110,19 +133,60 @@ class APK4FreeHandler:
                     raise Exception(f"Error APK4Free después de {retries} intentos: {str(e)}")
                 time.sleep(3)
 
-        raise Exception("No se encontró enlace directo después de varios intentos")
+        raise link_not_found(retries)
 
     @staticmethod
-    def extract_app_info(url):
-        """Extrae información de la app desde la URL"""
-        scraper = APK4FreeHandler.get_scraper()
+    async def aget_direct_link(url, retries=3):
+        """Versión asíncrona de get_direct_link sobre la sesión HTTP compartida"""
+        download_url = APK4FreeHandler.normalize_url(url)
         
+        for attempt in range(retries):
+            try:
+                print(f"Intento {attempt + 1} (async): Accediendo a {download_url}")
+                
+                response = await fetch(download_url)
+                response.raise_for_status()
+                
+                print("Esperando 6 segundos...")
+                await asyncio.sleep(6)
+                
+                direct_url = await aextract(response, APK4FreeHandler._extract_direct_link)
+                if direct_url:
+                    return direct_url
+
+                if attempt == 0 and retries > 1:
+                    print("No se encontró enlace, esperando más tiempo...")
+                    await asyncio.sleep(5)
+                    continue
+
+            except CloudflareChallenge:
+                print("Desafío de Cloudflare, usando cloudscraper...")
+                return await asyncio.to_thread(APK4FreeHandler.get_direct_link, url, retries)
+            except Exception as e:
+                print(f"Error en intento {attempt + 1}: {str(e)}")
+                if attempt == retries - 1:
+                    raise Exception(f"Error APK4Free después de {retries} intentos: {str(e)}")
+                await asyncio.sleep(3)
+
+        raise link_not_found(retries)
+
+    @staticmethod
+    def _info_url(url):
+        """URL de la página principal de la app (sin /download)"""
+        return url.replace('/download/', '/') if '/download/' in url else url
+
+    @staticmethod
+    def extract_app_info(url, prefetched=None):
+        """Extrae información de la app desde la URL"""
         try:
             # Si es URL de descarga, obtener la URL original
-            original_url = url.replace('/download/', '/') if '/download/' in url else url
+            original_url = APK4FreeHandler._info_url(url)
             
-            response = scraper.get(original_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            if prefetched is not None:
+                response = prefetched
+            else:
+                response = APK4FreeHandler.get_scraper().get(original_url)
+            soup = parsed_page(response)
             
             # Extraer título
             title = "APK"
@@ -153,8 +217,14 @@ class APK4FreeHandler:
     def get_download_info(url):
         """Obtiene tanto el enlace directo como la información de la app"""
         try:
-            direct_link = APK4FreeHandler.get_direct_link(url)
-            app_info = APK4FreeHandler.extract_app_info(url)
+            # Página de descarga y página principal se piden una vez cada una, en paralelo
+            scraper = APK4FreeHandler.get_scraper()
+            download_url = APK4FreeHandler.normalize_url(url)
+            info_url = APK4FreeHandler._info_url(url)
+            pages = fetch_pages(scraper, [download_url, info_url], APK4FreeHandler.get_scraper)
+            
+            direct_link = APK4FreeHandler.get_direct_link(url, scraper=scraper, prefetched=pages[download_url])
+            app_info = APK4FreeHandler.extract_app_info(url, prefetched=pages[info_url])
             
             return {
                 'direct_link': direct_link,
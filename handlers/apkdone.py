@@ -1,8 +1,13 @@
 import re
-import time
+import asyncio
 import cloudscraper
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
+from .async_http import fetch, CloudflareChallenge
+from .page_fetch import fetch_pages, parsed_page, aextract
+from .http_cache import cached_session
+from .retry import link_not_found
+from .hedging import hedge_sleep
+from .streaming import stream_page, astream_page, STREAMING_FETCH
 
 class APKDoneHandler:
     @staticmethod
@@ -12,12 +17,13 @@ class APKDoneHandler:
 
     @staticmethod
     def get_scraper():
-        return cloudscraper.create_scraper(browser={
+        # Las páginas pasan por la caché HTTP en disco (revalidación con ETag/Last-Modified)
+        return cached_session(cloudscraper.create_scraper(browser={
             'browser': 'chrome',
             'platform': 'windows',
             'mobile': False,
             'desktop': True,
-        }, delay=1)
+        }, delay=1))
 
     @staticmethod
     def normalize_url(url):
@@ -48,8 +54,11 @@ class APKDoneHandler:
             return False
             
         # Obtener todo el texto del elemento
-        text = element.get_text().strip()
-        
+        return APKDoneHandler.is_valid_download_text(element.get_text().strip())
+
+    @staticmethod
+    def is_valid_download_text(text):
+        """Misma validación que is_valid_download_button, sobre el texto del botón"""
         # RECHAZAR explícitamente el botón "Fast Download with APKDone"
         rejected_patterns = [
             r'Fast\s*Download\s*with\s*APKDone',
@@ -88,8 +97,106 @@ class APKDoneHandler:
         return url
 
     @staticmethod
-    def get_direct_link(url, retries=3):
-        scraper = APKDoneHandler.get_scraper()
+    def _stream_matcher(download_url):
+        """
+        Criterio de corte de la lectura incremental: el primer "Download APK (NN MB)" válido,
+        que es el mismo botón que elige el Método 1 de _extract_direct_link
+        """
+        def match(attrs, text):
+            if (re.search(r'\(\d+(?:\.\d+)?\s*[KMGT]?B\)', text, re.IGNORECASE) and
+                    APKDoneHandler.is_valid_download_text(text)):
+                return APKDoneHandler.fix_download_url(urljoin(download_url, attrs['href']))
+            return None
+        return match
+
+    @staticmethod
+    def _extract_direct_link(soup, download_url):
+        """Busca el enlace directo en el HTML ya parseado de la página de descarga"""
+        # Método 1: Buscar específicamente "Download APK" con validación
+        print("🔍 Buscando botones 'Download APK'...")
+        download_buttons = soup.find_all('a', href=True)
+
+        valid_buttons = []
+        for button in download_buttons:
+            if APKDoneHandler.is_valid_download_button(button):
+                valid_buttons.append(button)
+
+        # Priorizar botones con tamaño en el texto
+        for button in valid_buttons:
+            text = button.get_text().strip()
+            # Buscar patrón con tamaño (ej: "Download APK (53 MB)")
+            if re.search(r'\(\d+(?:\.\d+)?\s*[KMGT]?B\)', text, re.IGNORECASE):
+                direct_url = button['href']
+                if not direct_url.startswith('http'):
+                    direct_url = urljoin(download_url, direct_url)
+                # Corregir URL si es necesario
+                direct_url = APKDoneHandler.fix_download_url(direct_url)
+                print(f"✅ Enlace prioritario encontrado (con tamaño): {direct_url}")
+                return direct_url
+
+        # Si no hay con tamaño, usar el primer botón válido
+        if valid_buttons:
+            button = valid_buttons[0]
+            direct_url = button['href']
+            if not direct_url.startswith('http'):
+                direct_url = urljoin(download_url, direct_url)
+            # Corregir URL si es necesario
+            direct_url = APKDoneHandler.fix_download_url(direct_url)
+            print(f"✅ Enlace válido encontrado: {direct_url}")
+            return direct_url
+
+        # Método 2: Buscar por patrones específicos en el texto
+        print("🔍 Buscando por patrones específicos...")
+        for link in soup.find_all('a', href=True):
+            link_text = link.get_text().strip()
+
+            # Solo aceptar si contiene "Download APK" y NO contiene "Fast Download"
+            if (re.search(r'Download\s*APK', link_text, re.IGNORECASE) and 
+                not re.search(r'Fast\s*Download', link_text, re.IGNORECASE) and
+                not re.search(r'APKDone', link_text, re.IGNORECASE)):
+
+                direct_url = link['href']
+                if not direct_url.startswith('http'):
+                    direct_url = urljoin(download_url, direct_url)
+                # Corregir URL si es necesario
+                direct_url = APKDoneHandler.fix_download_url(direct_url)
+                print(f"✅ Enlace encontrado (Método 2): {direct_url}")
+                return direct_url
+
+        # Método 3: Buscar enlaces que apunten directamente a archivos APK
+        print("🔍 Buscando enlaces directos a APK...")
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if href.lower().endswith('.apk'):
+                if not href.startswith('http'):
+                    href = urljoin(download_url, href)
+                # Verificar que no sea la misma página de descarga
+                if href != download_url:
+                    print(f"✅ Enlace directo APK encontrado: {href}")
+                    return href
+
+        # Método 4: Buscar por clases específicas, pero con validación de texto
+        print("🔍 Buscando por clases CSS...")
+        download_classes = [
+            'download-btn', 'download-button', 'btn-download', 
+            'download-link', 'apk-download', 'download'
+        ]
+
+        for class_name in download_classes:
+            buttons = soup.find_all('a', class_=re.compile(class_name, re.IGNORECASE), href=True)
+            for button in buttons:
+                if APKDoneHandler.is_valid_download_button(button):
+                    direct_url = button['href']
+                    if not direct_url.startswith('http'):
+                        direct_url = urljoin(download_url, direct_url)
+                    print(f"✅ Enlace encontrado por clase ({class_name}): {direct_url}")
+                    return direct_url
+
+        return None
+
+    @staticmethod
+    def get_direct_link(url, retries=3, scraper=None, prefetched=None):
+        scraper = scraper or APKDoneHandler.get_scraper()
         
         # Normalizar URL primero
         download_url = APKDoneHandler.normalize_url(url)
@@ -98,122 +205,105 @@ class APKDoneHandler:
             try:
                 print(f"Intento {attempt + 1}: Accediendo a {download_url}")
                 
-                # Hacer request a la página de descarga
-                response = scraper.get(download_url)
-                response.raise_for_status()
+                # Hacer request a la página de descarga (en el primer intento se usa
+                # la página ya descargada por get_download_info, si la hay)
+                if attempt == 0 and prefetched is not None:
+                    response = prefetched
+                elif STREAMING_FETCH:
+                    # Lectura incremental: se corta al aparecer el botón con tamaño
+                    response = stream_page(scraper, download_url, 'apkdone',
+                                           match_anchor=APKDoneHandler._stream_matcher(download_url))
+                    if response.link:
+                        print(f"✅ Enlace encontrado (lectura parcial): {response.link}")
+                        return response.link
+                else:
+                    response = scraper.get(download_url)
+                    response.raise_for_status()
                 
                 # Esperar unos segundos para que cargue el contenido
                 print("Esperando 3 segundos...")
-                time.sleep(3)
+                hedge_sleep(3)
                 
                 # Parsear HTML
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Método 1: Buscar específicamente "Download APK" con validación
-                print("🔍 Buscando botones 'Download APK'...")
-                download_buttons = soup.find_all('a', href=True)
-                
-                valid_buttons = []
-                for button in download_buttons:
-                    if APKDoneHandler.is_valid_download_button(button):
-                        valid_buttons.append(button)
+                soup = parsed_page(response)
                 
-                # Priorizar botones con tamaño en el texto
-                for button in valid_buttons:
-                    text = button.get_text().strip()
-                    # Buscar patrón con tamaño (ej: "Download APK (53 MB)")
-                    if re.search(r'\(\d+(?:\.\d+)?\s*[KMGT]?B\)', text, re.IGNORECASE):
-                        direct_url = button['href']
-                        if not direct_url.startswith('http'):
-                            direct_url = urljoin(download_url, direct_url)
-                        # Corregir URL si es necesario
-                        direct_url = APKDoneHandler.fix_download_url(direct_url)
-                        print(f"✅ Enlace prioritario encontrado (con tamaño): {direct_url}")
-                        return direct_url
-                
-                # Si no hay con tamaño, usar el primer botón válido
-                if valid_buttons:
-                    button = valid_buttons[0]
-                    direct_url = button['href']
-                    if not direct_url.startswith('http'):
-                        direct_url = urljoin(download_url, direct_url)
-                    # Corregir URL si es necesario
-                    direct_url = APKDoneHandler.fix_download_url(direct_url)
-                    print(f"✅ Enlace válido encontrado: {direct_url}")
+                direct_url = APKDoneHandler._extract_direct_link(soup, download_url)
+                if direct_url:
                     return direct_url
 
-                # Método 2: Buscar por patrones específicos en el texto
-                print("🔍 Buscando por patrones específicos...")
-                for link in soup.find_all('a', href=True):
-                    link_text = link.get_text().strip()
-                    
-                    # Solo aceptar si contiene "Download APK" y NO contiene "Fast Download"
-                    if (re.search(r'Download\s*APK', link_text, re.IGNORECASE) and 
-                        not re.search(r'Fast\s*Download', link_text, re.IGNORECASE) and
-                        not re.search(r'APKDone', link_text, re.IGNORECASE)):
-                        
-                        direct_url = link['href']
-                        if not direct_url.startswith('http'):
-                            direct_url = urljoin(download_url, direct_url)
-                        # Corregir URL si es necesario
-                        direct_url = APKDoneHandler.fix_download_url(direct_url)
-                        print(f"✅ Enlace encontrado (Método 2): {direct_url}")
-                        return direct_url
+                # Si no se encontró nada en el primer intento, esperar más tiempo
+                if attempt == 0 and retries > 1:
+                    print("⏳ No se encontró enlace, esperando más tiempo...")
+                    hedge_sleep(5)
+                    continue
+
+            except Exception as e:
+                print(f"❌ Error en intento {attempt + 1}: {str(e)}")
+                if attempt == retries - 1:
+                    raise Exception(f"Error APKDone después de {retries} intentos: {str(e)}")
+                hedge_sleep(3)
 
-                # Método 3: Buscar enlaces que apunten directamente a archivos APK
-                print("🔍 Buscando enlaces directos a APK...")
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    if href.lower().endswith('.apk'):
-                        if not href.startswith('http'):
-                            href = urljoin(download_url, href)
-                        # Verificar que no sea la misma página de descarga
-                        if href != download_url:
-                            print(f"✅ Enlace directo APK encontrado: {href}")
-                            return href
+        raise link_not_found(retries)
 
-                # Método 4: Buscar por clases específicas, pero con validación de texto
-                print("🔍 Buscando por clases CSS...")
-                download_classes = [
-                    'download-btn', 'download-button', 'btn-download', 
-                    'download-link', 'apk-download', 'download'
-                ]
+    @staticmethod
+    async def aget_direct_link(url, retries=3):
+        """Versión asíncrona de get_direct_link sobre la sesión HTTP compartida"""
+        download_url = APKDoneHandler.normalize_url(url)
+        
+        for attempt in range(retries):
+            try:
+                print(f"Intento {attempt + 1} (async): Accediendo a {download_url}")
+                
+                if STREAMING_FETCH:
+                    response = await astream_page(download_url, 'apkdone',
+                                                  match_anchor=APKDoneHandler._stream_matcher(download_url))
+                    if response.link:
+                        print(f"✅ Enlace encontrado (lectura parcial): {response.link}")
+                        return response.link
+                else:
+                    response = await fetch(download_url)
+                response.raise_for_status()
+                
+                print("Esperando 3 segundos...")
+                await asyncio.sleep(3)
                 
-                for class_name in download_classes:
-                    buttons = soup.find_all('a', class_=re.compile(class_name, re.IGNORECASE), href=True)
-                    for button in buttons:
-                        if APKDoneHandler.is_valid_download_button(button):
-                            direct_url = button['href']
-                            if not direct_url.startswith('http'):
-                                direct_url = urljoin(download_url, direct_url)
-                            print(f"✅ Enlace encontrado por clase ({class_name}): {direct_url}")
-                            return direct_url
+                direct_url = await aextract(response, APKDoneHandler._extract_direct_link, download_url)
+                if direct_url:
+                    return direct_url
 
-                # Si no se encontró nada en el primer intento, esperar más tiempo
-                if attempt == 0:
+                if attempt == 0 and retries > 1:
                     print("⏳ No se encontró enlace, esperando más tiempo...")
-                    time.sleep(5)
+                    await asyncio.sleep(5)
                     continue
 
+            except CloudflareChallenge:
+                print("☁️ Desafío de Cloudflare, usando cloudscraper...")
+                return await asyncio.to_thread(APKDoneHandler.get_direct_link, url, retries)
             except Exception as e:
                 print(f"❌ Error en intento {attempt + 1}: {str(e)}")
                 if attempt == retries - 1:
                     raise Exception(f"Error APKDone después de {retries} intentos: {str(e)}")
-                time.sleep(3)
+                await asyncio.sleep(3)
 
-        raise Exception("No se encontró enlace directo después de varios intentos")
+        raise link_not_found(retries)
 
     @staticmethod
-    def extract_app_info(url):
+    def _info_url(url):
+        """URL de la página principal de la app (sin /download)"""
+        return url.replace('/download/', '/') if '/download/' in url else url
+
+    @staticmethod
+    def extract_app_info(url, prefetched=None):
         """Extrae información de la app desde la URL"""
-        scraper = APKDoneHandler.get_scraper()
-        
         try:
             # Si es URL de descarga, obtener la URL original
-            original_url = url.replace('/download/', '/') if '/download/' in url else url
+            original_url = APKDoneHandler._info_url(url)
             
-            response = scraper.get(original_url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            if prefetched is not None:
+                response = prefetched
+            else:
+                response = APKDoneHandler.get_scraper().get(original_url)
+            soup = parsed_page(response)
             
             # Extraer título
             title = "APK"
@@ -297,8 +387,14 @@ class APKDoneHandler:
     def get_download_info(url):
         """Obtiene tanto el enlace directo como la información de la app"""
         try:
-            direct_link = APKDoneHandler.get_direct_link(url)
-            app_info = APKDoneHandler.extract_app_info(url)
+            # Página de descarga y página principal se piden una vez cada una, en paralelo
+            scraper = APKDoneHandler.get_scraper()
+            download_url = APKDoneHandler.normalize_url(url)
+            info_url = APKDoneHandler._info_url(url)
+            pages = fetch_pages(scraper, [download_url, info_url], APKDoneHandler.get_scraper)
+            
+            direct_link = APKDoneHandler.get_direct_link(url, scraper=scraper, prefetched=pages[download_url])
+            app_info = APKDoneHandler.extract_app_info(url, prefetched=pages[info_url])
             
             return {
                 'direct_link': direct_link,
@@ -1,14 +1,30 @@
+import os
 import re
 import time
+import threading
 import requests
 import json
-import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 from functools import wraps
+from .hedging import hedger
+from .translator import PhraseTranslator
+
+# Hilos del pool persistente de extracción
+APKDONE_INFO_WORKERS = int(os.getenv("APKDONE_INFO_WORKERS", "4"))
+# Segundo intento solo si el primero supera el p90 de latencia (desactivado por defecto)
+APKDONE_INFO_HEDGE = os.getenv("APKDONE_INFO_HEDGE", "0") == "1"
+# Glosario JSON adicional para translate_text (opcional)
+TRANSLATION_GLOSSARY_FILE = os.getenv("TRANSLATION_GLOSSARY_FILE", "")
 
 class APKDoneInfoExtractor:
     
+    # Pool de hilos y sesiones por hilo, compartidos entre llamadas
+    _executor = None
+    _executor_lock = threading.Lock()
+    _local = threading.local()
+    
     # Diccionario de traducción de géneros
     GENRE_TRANSLATIONS = {
         # Géneros de aplicaciones
@@ -64,9 +80,51 @@ class APKDoneInfoExtractor:
         "Word": "Palabras"
     }
 
+    # Traducciones de modificaciones y palabras comunes en descripciones
+    TEXT_TRANSLATIONS = {
+        # Modificaciones comunes
+        "Premium Unlocked": "Premium Desbloqueado",
+        "Pro Unlocked": "Pro Desbloqueado", 
+        "Paid Unlocked": "Pagado Desbloqueado",
+        "Full Unlocked": "Completamente Desbloqueado",
+        "Ad-Free": "Sin Anuncios",
+        "No Ads": "Sin Publicidad",
+        "Unlimited": "Ilimitado",
+        "VIP Unlocked": "VIP Desbloqueado",
+        "Premium Features": "Características Premium",
+        "All Features Unlocked": "Todas las Características Desbloqueadas",
+
+        # Palabras comunes en descripciones
+        "generate": "genera",
+        "create": "crea",
+        "edit": "edita",
+        "remove": "elimina",
+        "convert": "convierte",
+        "fix": "corrige",
+        "enhance": "mejora",
+        "photo": "foto",
+        "photos": "fotos",
+        "image": "imagen",
+        "images": "imágenes",
+        "video": "video",
+        "videos": "videos",
+        "background": "fondo",
+        "sketch": "boceto",
+        "text": "texto",
+        "blurry": "borrosas",
+        "from": "a partir de",
+        "to": "en",
+        "and": "y"
+    }
+
+    # Glosario compilado una sola vez para todas las llamadas a translate_text
+    _translator = PhraseTranslator(TEXT_TRANSLATIONS)
+    if TRANSLATION_GLOSSARY_FILE:
+        _translator.load_json(TRANSLATION_GLOSSARY_FILE)
+
     @staticmethod
     def get_scraper():
-        """Crea una nueva sesión de requests para cada proceso"""
+        """Crea una nueva sesión de requests"""
         session = requests.Session()
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -86,49 +144,8 @@ class APKDoneInfoExtractor:
 
     @staticmethod
     def translate_text(text):
-        """Traduce textos comunes al español usando un diccionario básico"""
-        translations = {
-            # Modificaciones comunes
-            "Premium Unlocked": "Premium Desbloqueado",
-            "Pro Unlocked": "Pro Desbloqueado", 
-            "Paid Unlocked": "Pagado Desbloqueado",
-            "Full Unlocked": "Completamente Desbloqueado",
-            "Ad-Free": "Sin Anuncios",
-            "No Ads": "Sin Publicidad",
-            "Unlimited": "Ilimitado",
-            "VIP Unlocked": "VIP Desbloqueado",
-            "Premium Features": "Características Premium",
-            "All Features Unlocked": "Todas las Características Desbloqueadas",
-            
-            # Palabras comunes en descripciones
-            "generate": "genera",
-            "create": "crea",
-            "edit": "edita",
-            "remove": "elimina",
-            "convert": "convierte",
-            "fix": "corrige",
-            "enhance": "mejora",
-            "photo": "foto",
-            "photos": "fotos",
-            "image": "imagen",
-            "images": "imágenes",
-            "video": "video",
-            "videos": "videos",
-            "background": "fondo",
-            "sketch": "boceto",
-            "text": "texto",
-            "blurry": "borrosas",
-            "from": "a partir de",
-            "to": "en",
-            "and": "y"
-        }
-        
-        result = text
-        for english, spanish in translations.items():
-            # Reemplazar palabras completas (case insensitive)
-            result = re.sub(r'\b' + re.escape(english) + r'\b', spanish, result, flags=re.IGNORECASE)
-        
-        return result
+        """Traduce textos comunes al español usando el glosario compilado (una sola pasada)"""
+        return APKDoneInfoExtractor._translator.translate(text)
 
     @staticmethod
     def format_genres(genres_text):
@@ -153,23 +170,40 @@ class APKDoneInfoExtractor:
         return " ".join(hashtags)
 
     @staticmethod
-    def _extract_app_info_process(url, result_queue, process_id):
-        """Función que se ejecuta en proceso separado para extraer información"""
+    def _get_executor():
+        """Pool persistente: los hilos y sus sesiones se reutilizan entre URLs"""
+        with APKDoneInfoExtractor._executor_lock:
+            if APKDoneInfoExtractor._executor is None:
+                APKDoneInfoExtractor._executor = ThreadPoolExecutor(
+                    max_workers=APKDONE_INFO_WORKERS,
+                    thread_name_prefix='apkdone-info'
+                )
+            return APKDoneInfoExtractor._executor
+
+    @staticmethod
+    def _get_session():
+        """Sesión del hilo actual, con conexiones keep-alive ya abiertas"""
+        session = getattr(APKDoneInfoExtractor._local, 'session', None)
+        if session is None:
+            session = APKDoneInfoExtractor.get_scraper()
+            APKDoneInfoExtractor._local.session = session
+        return session
+
+    @staticmethod
+    def _extract_app_info(url, attempt_id):
+        """Extrae la información de la app (se ejecuta en un hilo del pool)"""
         try:
-            print(f"🔄 Proceso {process_id} (PID: {mp.current_process().pid}): Iniciando extracción...")
-            
-            # Crear una sesión completamente nueva para este proceso
-            scraper = APKDoneInfoExtractor.get_scraper()
+            print(f"🔄 Intento {attempt_id} ({threading.current_thread().name}): Iniciando extracción...")
             
             # Si es URL de descarga, obtener la URL original
             original_url = url.replace('/download/', '/') if '/download/' in url else url
-            print(f"🌐 Proceso {process_id}: Accediendo a {original_url}")
+            print(f"🌐 Intento {attempt_id}: Accediendo a {original_url}")
             
-            response = scraper.get(original_url, timeout=20)
+            response = APKDoneInfoExtractor._get_session().get(original_url, timeout=20)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.text, 'html.parser')
-            print(f"✅ Proceso {process_id}: HTML cargado ({len(response.text)} chars)")
+            print(f"✅ Intento {attempt_id}: HTML cargado ({len(response.text)} chars)")
             
             # Extraer información usando métodos estáticos
             app_name = APKDoneInfoExtractor._extract_app_name_static(soup)
@@ -189,24 +223,23 @@ class APKDoneInfoExtractor:
                 'description': description,
                 'playstore_link': playstore_link,
                 'success': True,
-                'process_id': process_id
+                'attempt_id': attempt_id
             }
             
-            print(f"✅ Proceso {process_id}: Extracción completada exitosamente")
+            print(f"✅ Intento {attempt_id}: Extracción completada exitosamente")
             print(f"   - App: {app_name}")
             print(f"   - Versión: {version}")
             print(f"   - Categoría: {category}")
             
-            result_queue.put(result)
+            return result
             
         except Exception as e:
-            print(f"❌ Proceso {process_id}: Error - {str(e)}")
-            error_result = {
+            print(f"❌ Intento {attempt_id}: Error - {str(e)}")
+            return {
                 'success': False,
                 'error': str(e),
-                'process_id': process_id
+                'attempt_id': attempt_id
             }
-            result_queue.put(error_result)
 
     @staticmethod
     def _extract_app_name_static(soup):
@@ -413,97 +446,58 @@ class APKDoneInfoExtractor:
             return f"Error al formatear mensaje: {str(e)}"
 
     @staticmethod
-    def get_formatted_info(url, timeout=30, max_processes=2):
+    def get_formatted_info(url, timeout=30, hedge=None):
         """
-        Función principal que extrae y formatea información usando multiprocessing
+        Función principal que extrae y formatea información usando el pool persistente
         
         Args:
             url (str): URL de APKDone
             timeout (int): Timeout en segundos
-            max_processes (int): Número máximo de procesos paralelos
+            hedge (bool): Lanzar un segundo intento si el primero supera el percentil
+                de latencia (por defecto APKDONE_INFO_HEDGE)
         
         Returns:
             dict: Resultado con success, message, raw_info
         """
-        print(f"🚀 Iniciando extracción multiprocess para: {url}")
+        print(f"🚀 Iniciando extracción para: {url}")
+        
+        if hedge is None:
+            hedge = APKDONE_INFO_HEDGE
         
-        # Cola para comunicación entre procesos
-        result_queue = mp.Queue()
-        processes = []
+        def attempt(attempt_id):
+            result = APKDoneInfoExtractor._extract_app_info(url, attempt_id)
+            if not result.get('success', False):
+                raise Exception(result.get('error', 'Unknown'))
+            return result
         
         try:
-            # Crear múltiples procesos para mayor robustez
-            for i in range(max_processes):
-                process = mp.Process(
-                    target=APKDoneInfoExtractor._extract_app_info_process,
-                    args=(url, result_queue, i+1)
-                )
-                processes.append(process)
-                process.start()
-                print(f"🔄 Proceso {i+1} iniciado (PID: {process.pid})")
-            
-            # Esperar resultado del primer proceso que termine exitosamente
-            successful_result = None
-            start_time = time.time()
-            
-            while (time.time() - start_time) < timeout and successful_result is None:
-                try:
-                    if not result_queue.empty():
-                        result = result_queue.get(timeout=1)
-                        
-                        if result.get('success', False):
-                            successful_result = result
-                            print(f"✅ Proceso {result.get('process_id', 'X')} completado exitosamente")
-                            break
-                        else:
-                            print(f"❌ Proceso {result.get('process_id', 'X')} falló: {result.get('error', 'Unknown')}")
-                    else:
-                        time.sleep(0.1)
-                        
-                except Exception as e:
-                    print(f"⚠️  Error recibiendo resultado: {str(e)}")
-                    continue
-            
-            # Si obtuvimos un resultado exitoso, formatearlo
-            if successful_result:
-                formatted_message = APKDoneInfoExtractor.format_message(successful_result)
-                
-                return {
-                    'success': True,
-                    'message': formatted_message,
-                    'raw_info': successful_result
-                }
-            else:
-                return {
-                    'success': False,
-                    'message': '',
-                    'error': 'Timeout: No se pudo extraer información en el tiempo límite'
-                }
+            result = hedger.run(
+                'apkdone_info',
+                lambda: attempt(1),
+                backup=lambda: attempt(2),
+                timeout=timeout,
+                enabled=hedge,
+                executor=APKDoneInfoExtractor._get_executor()
+            )
+            print(f"✅ Intento {result.get('attempt_id', 'X')} completado exitosamente")
+            return {
+                'success': True,
+                'message': APKDoneInfoExtractor.format_message(result),
+                'raw_info': result
+            }
                 
         except Exception as e:
-            print(f"❌ Error crítico en multiprocessing: {str(e)}")
+            print(f"❌ Error en la extracción: {str(e)}")
             return {
                 'success': False,
                 'message': '',
                 'error': str(e)
             }
-            
-        finally:
-            # Limpiar procesos
-            print("🧹 Terminando procesos...")
-            for i, process in enumerate(processes):
-                if process.is_alive():
-                    print(f"⏹️  Terminando proceso {i+1}...")
-                    process.terminate()
-                    process.join(timeout=2)
-                    if process.is_alive():
-                        print(f"🔪 Matando proceso {i+1} forzadamente...")
-                        process.kill()
 
 # Función de prueba independiente
 def test_multiprocess_extractor():
-    """Función de prueba para el extractor multiprocess"""
-    print("🧪 PROBANDO EXTRACTOR MULTIPROCESS")
+    """Función de prueba para el extractor"""
+    print("🧪 PROBANDO EXTRACTOR")
     print("=" * 60)
     
     test_url = "https://apkdone.com/creatify/"
@@ -523,7 +517,7 @@ def test_multiprocess_extractor():
             print(f"\n🔍 INFO RAW:")
             raw_info = result.get('raw_info', {})
             for key, value in raw_info.items():
-                if key not in ['success', 'process_id']:
+                if key not in ['success', 'attempt_id']:
                     print(f"  {key}: {value}")
         else:
             print(f"\n❌ ERROR: {result.get('error', 'Unknown error')}")
@@ -0,0 +1,133 @@
+import os
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ruta asíncrona para los handlers HTTP (0 = usar siempre cloudscraper en hilos)
+ASYNC_HTTP_ENABLED = os.getenv("ASYNC_HTTP", "1") != "0"
+ASYNC_HTTP_TIMEOUT = float(os.getenv("ASYNC_HTTP_TIMEOUT", "30"))
+ASYNC_HTTP_LIMIT = int(os.getenv("ASYNC_HTTP_LIMIT", "200"))
+ASYNC_HTTP_LIMIT_PER_HOST = int(os.getenv("ASYNC_HTTP_LIMIT_PER_HOST", "20"))
+
+# Mismas cabeceras que presenta cloudscraper con browser=chrome/windows
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+class CloudflareChallenge(Exception):
+    """La respuesta es un desafío de Cloudflare que solo cloudscraper sabe resolver"""
+
+
+class HTTPStatusError(Exception):
+    """Respuesta con código de error; conserva la respuesta (cabeceras como Retry-After)"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} para {response.url}")
+        self.response = response
+
+
+class AsyncResponse:
+    """Respuesta ya leída, con la misma interfaz mínima que usan los handlers de requests"""
+
+    def __init__(self, url, status_code, headers, text):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPStatusError(self)
+
+
+_session = None
+_session_loop = None
+
+
+async def get_session():
+    """Sesión compartida (pool de conexiones con keep-alive) del event loop actual"""
+    global _session, _session_loop
+    # aiohttp se importa con la primera petición asíncrona, no al arrancar el bot
+    import aiohttp
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=ASYNC_HTTP_LIMIT,
+            limit_per_host=ASYNC_HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers=DEFAULT_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=ASYNC_HTTP_TIMEOUT)
+        )
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    """Cierra la sesión compartida (apagado de la cola)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def _is_cloudflare_challenge(status, headers, text):
+    if status not in (403, 429, 503):
+        return False
+    server = headers.get('Server', '').lower()
+    return ('cloudflare' in server or 'cf-mitigated' in headers or
+            'Just a moment' in text or 'cf-chl' in text)
+
+
+def _page_cache(url):
+    """Caché HTTP en disco si cubre el host de la URL (la misma que usa cached_session)"""
+    from .http_cache import http_cache, HTTP_CACHE_ENABLED
+    return http_cache if HTTP_CACHE_ENABLED and http_cache.covers(url) else None
+
+
+async def fetch(url, allow_redirects=True):
+    """
+    GET asíncrono sobre la sesión compartida, a través de la caché HTTP en disco
+
+    Las entradas frescas se sirven sin red y las vencidas se revalidan; el disco
+    se lee y escribe en un hilo para no bloquear el loop.
+
+    Raises:
+        CloudflareChallenge: si el sitio exige resolver el desafío de Cloudflare
+    """
+    cache = _page_cache(url)
+    headers = {}
+    if cache:
+        key, entry, fresh = await asyncio.to_thread(cache.lookup, url)
+        if fresh is not None:
+            return fresh
+        headers = cache.validators(entry)
+
+    session = await get_session()
+    async with session.get(url, allow_redirects=allow_redirects, headers=headers) as response:
+        body = await response.read()
+        encoding = response.get_encoding()
+        text = body.decode(encoding, errors='replace')
+        if _is_cloudflare_challenge(response.status, response.headers, text):
+            raise CloudflareChallenge(f"Desafío de Cloudflare en {url}")
+
+        if cache:
+            revalidated = await asyncio.to_thread(cache.revalidated, key, url, entry, response.status, response.headers)
+            if revalidated is not None:
+                return revalidated
+            cache.record_miss()
+            if response.status == 200:
+                await asyncio.to_thread(cache.store_page, url, str(response.url), response.headers, body, encoding)
+        return AsyncResponse(str(response.url), response.status, response.headers, text)
@@ -0,0 +1,312 @@
+import os
+import time
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Archivo compartido con manage_bot.sh para que la limpieza desde shell
+# mate solo los procesos que lanzó el bot
+BROWSER_PID_FILE = os.getenv("BROWSER_PID_FILE", "browser.pids")
+
+# Límites de memoria (MB): tope por driver y presupuesto total de navegadores
+BROWSER_RSS_CAP_MB = int(os.getenv("BROWSER_RSS_CAP_MB", "1024"))
+BROWSER_MEMORY_BUDGET_MB = int(os.getenv("BROWSER_MEMORY_BUDGET_MB", "3072"))
+BROWSER_SAMPLE_INTERVAL = float(os.getenv("BROWSER_SAMPLE_INTERVAL", "5"))
+
+
+@dataclass
+class TrackedBrowser:
+    driver_id: int
+    owner: str
+    label: str
+    root_pid: int
+    started_at: float
+    # pid -> create_time, para no matar un PID reutilizado por otro proceso
+    pids: Dict[int, float] = field(default_factory=dict)
+
+
+class BrowserRegistry:
+    """Registro del ciclo de vida de los navegadores lanzados por el bot"""
+
+    def __init__(self, pid_file: str = BROWSER_PID_FILE,
+                 rss_cap_mb: int = BROWSER_RSS_CAP_MB,
+                 memory_budget_mb: int = BROWSER_MEMORY_BUDGET_MB,
+                 sample_interval: float = BROWSER_SAMPLE_INTERVAL):
+        self.pid_file = pid_file
+        self.rss_cap_mb = rss_cap_mb
+        self.memory_budget_mb = memory_budget_mb
+        self.sample_interval = sample_interval
+        self.total_rss_mb = 0.0
+        self._browsers: Dict[int, TrackedBrowser] = {}
+        self._recycled = set()
+        self._lock = threading.Lock()
+        self._capacity = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._monitor = None
+
+    def set_owner(self, owner: str):
+        """Asocia los navegadores que lance el hilo actual a un dueño (ID de tarea)"""
+        self._local.owner = owner
+
+    def clear_owner(self):
+        """Quita el dueño asociado al hilo actual"""
+        self._local.owner = None
+
+    def current_owner(self) -> str:
+        return getattr(self._local, 'owner', None) or f"thread-{threading.get_ident()}"
+
+    def wait_for_capacity(self, timeout: float = 60):
+        """Bloquea el lanzamiento de un Chrome nuevo mientras se exceda el presupuesto de memoria"""
+        deadline = time.time() + timeout
+        with self._capacity:
+            while self._browsers and self.total_rss_mb >= self.memory_budget_mb:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception(
+                        f"Presupuesto de memoria del navegador agotado "
+                        f"({self.total_rss_mb:.0f}/{self.memory_budget_mb} MB)"
+                    )
+                logger.info(f"Esperando memoria para lanzar Chrome ({self.total_rss_mb:.0f} MB en uso)")
+                self._capacity.wait(min(remaining, self.sample_interval))
+
+    def consume_recycled(self, owner: str) -> bool:
+        """Indica (una sola vez) si un navegador del dueño fue reciclado por exceso de memoria"""
+        with self._lock:
+            if owner in self._recycled:
+                self._recycled.discard(owner)
+                return True
+        return False
+
+    def mark_recycled(self, owner: str):
+        """Marca un dueño como reciclado (cuando el reciclaje ocurrió en un worker de navegador)"""
+        with self._lock:
+            self._recycled.add(owner)
+
+    def register(self, driver, label: str = 'chrome'):
+        """Registra el árbol de procesos de un driver recién creado"""
+        try:
+            root_pid = driver.service.process.pid
+        except Exception as e:
+            logger.warning(f"No se pudo obtener el PID del driver: {e}")
+            return driver
+
+        browser = TrackedBrowser(
+            driver_id=id(driver),
+            owner=self.current_owner(),
+            label=label,
+            root_pid=root_pid,
+            started_at=time.time()
+        )
+        self._refresh_tree(browser)
+
+        with self._lock:
+            self._browsers[browser.driver_id] = browser
+            self._write_pid_file()
+            self._ensure_monitor()
+
+        logger.info(f"Navegador registrado: {label} (PID raíz: {root_pid}, dueño: {browser.owner})")
+        return driver
+
+    def release(self, driver):
+        """Cierra el driver y mata cualquier proceso suyo que haya quedado vivo"""
+        # Registrar los renderers antes de quit(): después quedan huérfanos y ya no cuelgan del driver
+        with self._lock:
+            browser = self._browsers.get(id(driver))
+        if browser:
+            self._refresh_tree(browser)
+
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug(f"Error cerrando driver: {e}")
+
+        with self._lock:
+            browser = self._browsers.pop(id(driver), None)
+        if browser:
+            self._reap(browser)
+            with self._capacity:
+                self._write_pid_file()
+                self._capacity.notify_all()
+
+    def reap_owner(self, owner: str) -> int:
+        """Mata los navegadores de un dueño (fin de tarea, timeout o cancelación)"""
+        # Incluye los sub-dueños "<dueño>/..." (p. ej. intentos de respaldo)
+        with self._lock:
+            browsers = [b for b in self._browsers.values()
+                        if b.owner == owner or b.owner.startswith(f"{owner}/")]
+            for browser in browsers:
+                del self._browsers[browser.driver_id]
+        killed = sum(self._reap(browser) for browser in browsers)
+        if browsers:
+            with self._capacity:
+                self._write_pid_file()
+                self._capacity.notify_all()
+            logger.info(f"Navegadores de {owner} terminados: {len(browsers)} ({killed} procesos)")
+        return killed
+
+    def reap_all(self) -> int:
+        """Mata todos los navegadores registrados (reinicio o apagado)"""
+        with self._lock:
+            browsers = list(self._browsers.values())
+            self._browsers.clear()
+        killed = sum(self._reap(browser) for browser in browsers)
+        with self._capacity:
+            self.total_rss_mb = 0.0
+            self._write_pid_file()
+            self._capacity.notify_all()
+        return killed
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Devuelve procesos vivos y RSS de cada navegador registrado"""
+        with self._lock:
+            browsers = list(self._browsers.values())
+
+        result = []
+        for browser in browsers:
+            self._refresh_tree(browser)
+            live = self._live_processes(browser)
+            rss = 0
+            for proc in live:
+                try:
+                    rss += proc.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    continue
+            result.append({
+                'driver_id': browser.driver_id,
+                'owner': browser.owner,
+                'label': browser.label,
+                'root_pid': browser.root_pid,
+                'processes': len(live),
+                'rss_mb': round(rss / 1024 / 1024, 1),
+                'age': round(time.time() - browser.started_at, 1)
+            })
+
+        with self._lock:
+            self._write_pid_file()
+        return result
+
+    def _ensure_monitor(self):
+        """Arranca el muestreo de memoria con el primer navegador registrado"""
+        if self._monitor is None or not self._monitor.is_alive():
+            self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+            self._monitor.start()
+
+    def _monitor_loop(self):
+        """Muestrea el RSS de cada driver y recicla los que superan el tope"""
+        while True:
+            time.sleep(self.sample_interval)
+            try:
+                samples = self.stats()
+                over_cap = [b for b in samples if b['rss_mb'] > self.rss_cap_mb]
+
+                for sample in over_cap:
+                    with self._lock:
+                        browser = self._browsers.pop(sample['driver_id'], None)
+                        if browser:
+                            self._recycled.add(browser.owner)
+                    if browser:
+                        logger.warning(
+                            f"Navegador {browser.label} de {browser.owner} excedió "
+                            f"{self.rss_cap_mb} MB ({sample['rss_mb']} MB), reciclando"
+                        )
+                        self._reap(browser)
+
+                with self._capacity:
+                    self.total_rss_mb = sum(
+                        b['rss_mb'] for b in samples if b not in over_cap
+                    )
+                    if over_cap:
+                        self._write_pid_file()
+                    self._capacity.notify_all()
+            except Exception as e:
+                logger.debug(f"Error muestreando memoria de navegadores: {e}")
+
+    def _refresh_tree(self, browser: TrackedBrowser):
+        """Agrega al registro los hijos nuevos (renderers) del driver"""
+        try:
+            root = psutil.Process(browser.root_pid)
+            processes = [root] + root.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return
+
+        with self._lock:
+            known = set(browser.pids)
+        found = {}
+        for proc in processes:
+            if proc.pid in known:
+                continue
+            try:
+                found[proc.pid] = proc.create_time()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+
+        # pids solo se modifica con el lock: _write_pid_file lo recorre desde otros hilos
+        if found:
+            with self._lock:
+                browser.pids.update(found)
+
+    def _live_processes(self, browser: TrackedBrowser) -> List[psutil.Process]:
+        with self._lock:
+            tracked = list(browser.pids.items())
+
+        live = []
+        dead = []
+        for pid, create_time in tracked:
+            try:
+                proc = psutil.Process(pid)
+                if proc.create_time() == create_time and proc.status() != psutil.STATUS_ZOMBIE:
+                    live.append(proc)
+                    continue
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+            dead.append(pid)
+
+        if dead:
+            with self._lock:
+                for pid in dead:
+                    browser.pids.pop(pid, None)
+        return live
+
+    def _reap(self, browser: TrackedBrowser) -> int:
+        """Termina los procesos vivos de un navegador, forzando si no responden"""
+        self._refresh_tree(browser)
+        live = self._live_processes(browser)
+        if not live:
+            return 0
+
+        for proc in live:
+            try:
+                proc.terminate()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        _, alive = psutil.wait_procs(live, timeout=3)
+        for proc in alive:
+            try:
+                proc.kill()
+                logger.debug(f"Proceso forzado: {proc.pid}")
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        return len(live)
+
+    def _write_pid_file(self):
+        """Escribe 'pid create_time dueño' por línea para manage_bot.sh (con lock)"""
+        try:
+            tmp_path = f"{self.pid_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                for browser in list(self._browsers.values()):
+                    for pid, create_time in list(browser.pids.items()):
+                        f.write(f"{pid} {create_time:.2f} {browser.owner}\n")
+            os.replace(tmp_path, self.pid_file)
+        except OSError as e:
+            logger.debug(f"No se pudo escribir {self.pid_file}: {e}")
+
+
+# Instancia global del registro
+browser_registry = BrowserRegistry()
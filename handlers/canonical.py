@@ -0,0 +1,120 @@
+import re
+from urllib.parse import urlparse, unquote_plus
+
+from .film_cache import film_id_from_url
+
+# Parámetros de seguimiento que no cambian el recurso: nombres exactos (sig, size o
+# refresh sí cuentan) y la familia utm_* por prefijo
+TRACKING_PARAMS = {'fbclid', 'gclid', 'ref', 'igshid', 'si'}
+TRACKING_PREFIXES = ('utm_',)
+
+MEDIAFIRE_FILE_PATTERN = re.compile(r'/(?:file|file_premium|download|view)/([a-z0-9]+)', re.IGNORECASE)
+MEDIAFIRE_FOLDER_PATTERN = re.compile(r'/folder/([a-z0-9]+)', re.IGNORECASE)
+# Sufijo de página de descarga: /download y /download/ (en /download/123456 el número es la versión)
+DOWNLOAD_SUFFIX = re.compile(r'/download/?$')
+# A2ZAPK: la ficha /123456-nombre/ y la descarga /dload/123456/ comparten el ID numérico
+A2ZAPK_ID_PATTERN = re.compile(r'^/(?:dload/(\d+)|(\d+)-)')
+
+
+def _is_tracking(param: str) -> bool:
+    name = unquote_plus(param.split('=', 1)[0]).lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def clean_query(query: str) -> str:
+    """
+    Query sin parámetros de seguimiento, ordenada, para claves de deduplicación y caché
+
+    Cada parámetro se conserva tal cual (sin decodificar ni agregar '='), de modo
+    que la query de MediaFire antiguo (?quickkey) sigue siendo el ID.
+    """
+    return '&'.join(sorted(param for param in query.split('&') if param and not _is_tracking(param)))
+
+
+def _clean_path(path: str) -> str:
+    """Ruta sin barras repetidas ni la barra final"""
+    path = re.sub(r'/{2,}', '/', path)
+    return path.rstrip('/') or '/'
+
+
+def _app_path(path: str) -> str:
+    """Ruta de la app sin el sufijo de la página de descarga"""
+    return _clean_path(DOWNLOAD_SUFFIX.sub('', _clean_path(path)))
+
+
+def _mediafire(host, path, query):
+    folder = MEDIAFIRE_FOLDER_PATTERN.search(path)
+    if folder:
+        return f"folder:{folder.group(1).lower()}"
+    file_id = MEDIAFIRE_FILE_PATTERN.search(path)
+    if file_id:
+        return f"file:{file_id.group(1).lower()}"
+    # Enlaces antiguos: mediafire.com/?quickkey
+    if re.fullmatch(r'[a-z0-9]+', query, re.IGNORECASE):
+        return f"file:{query.lower()}"
+    return None
+
+
+def _uptodown(host, path, query):
+    # El subdominio identifica la app; el prefijo de idioma (en., es.) no
+    labels = host.split('.')[:-2]
+    labels = labels[:1] + [label for label in labels[1:] if len(label) != 2]
+    labels = [label for label in labels if label != 'www']
+    return f"{'.'.join(labels)}:{_app_path(path).lower()}"
+
+
+def _app_site(host, path, query):
+    # APKDone, APK4Free y LiteAPKs: la ruta de la app identifica el recurso
+    return _app_path(path).lower()
+
+
+def _a2zapk(host, path, query):
+    file_id = A2ZAPK_ID_PATTERN.match(_clean_path(path))
+    if file_id:
+        return f"id:{file_id.group(1) or file_id.group(2)}"
+    return _app_site(host, path, query)
+
+
+def _megaup(host, path, query):
+    # megaup.net/<id>/<nombre>: el ID basta
+    segments = [segment for segment in path.split('/') if segment]
+    return segments[0] if segments else None
+
+
+def _filmaffinity(host, path, query):
+    # m. y www., /es/ y /en/ apuntan a la misma ficha
+    return film_id_from_url(path)
+
+
+CANONICALIZERS = {
+    'mediafire': _mediafire,
+    'uptodown': _uptodown,
+    'apkdone': _app_site,
+    'apk4free': _app_site,
+    'liteapks': _app_site,
+    'a2zapk': _a2zapk,
+    'megaup': _megaup,
+    'filmaffinity': _filmaffinity,
+}
+
+
+def resource_key(site: str, url: str) -> str:
+    """
+    Clave estable del recurso al que apunta una URL ya limpia
+
+    Todas las variantes de un mismo recurso (m./www., /download, barra final,
+    parámetros de seguimiento, mayúsculas del host) dan la misma clave, p. ej.
+    'uptodown:google-drive:/android' o 'mediafire:file:abc123'.
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    query = clean_query(parsed.query)
+
+    canonicalizer = CANONICALIZERS.get(site)
+    key = canonicalizer(host, parsed.path, parsed.query) if canonicalizer else None
+    if not key:
+        # Sin regla específica: host y ruta normalizados
+        key = f"{host.removeprefix('www.')}{_clean_path(parsed.path)}"
+        if query:
+            key += f"?{query}"
+    return f"{site}:{key}"
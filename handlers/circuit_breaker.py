@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Fallos seguidos de un sitio antes de abrir su circuito y fallar rápido
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Segundos abierto antes de dejar pasar una prueba; se duplica si la prueba falla
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "60"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "900"))
+# Resoluciones de prueba simultáneas con el circuito medio abierto
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+# Segundos que se recuerda el fallo de una URL concreta (0 = sin caché negativa)
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "120"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "2000"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class SiteUnavailableError(Exception):
+    """El circuito del sitio está abierto: se falla sin consultar el sitio"""
+
+
+class RecentFailureError(Exception):
+    """La misma URL falló hace poco (caché negativa)"""
+
+
+class ResourceUnavailable(Exception):
+    """El sitio responde pero el recurso no existe: cuenta para la caché negativa, no para el circuito"""
+
+
+class CircuitBreaker:
+    """
+    Circuito por sitio (handler) y caché negativa por URL
+
+    Tras CIRCUIT_FAILURE_THRESHOLD fallos seguidos el circuito se abre y las
+    peticiones al sitio fallan al instante con un mensaje claro; pasado el tiempo
+    de apertura se deja pasar una prueba (medio abierto) que lo cierra si resuelve
+    o lo vuelve a abrir por el doble de tiempo si falla. Los fallos de cada URL se
+    recuerdan NEGATIVE_CACHE_TTL segundos para no repetir la resolución completa.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 open_seconds: float = CIRCUIT_OPEN_SECONDS, max_open_seconds: float = CIRCUIT_MAX_OPEN_SECONDS,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES, negative_ttl: float = NEGATIVE_CACHE_TTL):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_probes = half_open_probes
+        self.negative_ttl = negative_ttl
+        self._sites: Dict[str, Dict[str, Any]] = {}
+        self._negative: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def check(self, match):
+        """Lanza SiteUnavailableError o RecentFailureError si no vale la pena resolver"""
+        now = time.time()
+        with self._lock:
+            failure = self._negative.get(match.key)
+            if failure:
+                if now < failure['expires']:
+                    failure['hits'] += 1
+                    raise RecentFailureError(failure['error'])
+                del self._negative[match.key]
+
+            site = self._site(match.spec.key)
+            if site['state'] == OPEN:
+                if now < site['opened_at'] + site['open_seconds']:
+                    site['rejected'] += 1
+                    raise SiteUnavailableError(self._message(match.spec.key, site, now))
+                site['state'] = HALF_OPEN
+                logger.info(f"Circuito de {match.spec.key} medio abierto: probando recuperación")
+
+            if site['state'] == HALF_OPEN:
+                if site['probes'] >= self.half_open_probes:
+                    site['rejected'] += 1
+                    raise SiteUnavailableError(self._message(match.spec.key, site, now))
+                site['probes'] += 1
+
+    def record_success(self, match):
+        with self._lock:
+            site = self._site(match.spec.key)
+            if site['state'] != CLOSED:
+                logger.info(f"Circuito de {match.spec.key} cerrado: el sitio volvió a responder")
+            site.update(state=CLOSED, failures=0, probes=0, open_seconds=self.open_seconds)
+
+    def record_failure(self, match, error: Exception, remember: bool = True):
+        """
+        Registra el fallo del sitio (salvo que sea del recurso) y, con remember,
+        el de la URL en la caché negativa; los fallos transitorios no se recuerdan
+        para no bloquear los reintentos de la cola
+        """
+        if isinstance(error, (SiteUnavailableError, RecentFailureError)):
+            return
+
+        now = time.time()
+        with self._lock:
+            if remember and self.negative_ttl > 0:
+                if len(self._negative) >= NEGATIVE_CACHE_MAX_ENTRIES:
+                    self._prune_negative(now)
+                self._negative[match.key] = {'error': str(error), 'expires': now + self.negative_ttl, 'hits': 0}
+
+            site = self._site(match.spec.key)
+            if isinstance(error, ResourceUnavailable):
+                # El sitio respondió: una prueba medio abierta con este resultado también lo confirma
+                if site['state'] == HALF_OPEN:
+                    site.update(state=CLOSED, failures=0, probes=0, open_seconds=self.open_seconds)
+                return
+
+            site['failures'] += 1
+            site['last_error'] = str(error)
+            if site['state'] == HALF_OPEN:
+                site['open_seconds'] = min(site['open_seconds'] * 2, self.max_open_seconds)
+                self._open(match.spec.key, site, now)
+            elif site['state'] == CLOSED and site['failures'] >= self.failure_threshold:
+                self._open(match.spec.key, site, now)
+
+    def release_probe(self, match):
+        """La resolución terminó sin veredicto (p. ej. cancelada): liberar el hueco de prueba"""
+        with self._lock:
+            site = self._site(match.spec.key)
+            if site['state'] == HALF_OPEN and site['probes']:
+                site['probes'] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            stats = {
+                key: {
+                    'state': site['state'],
+                    'failures': site['failures'],
+                    'rejected': site['rejected'],
+                    'retry_in': max(0, round(site['opened_at'] + site['open_seconds'] - now))
+                    if site['state'] == OPEN else 0,
+                }
+                for key, site in self._sites.items()
+            }
+            negative = sum(1 for failure in self._negative.values() if now < failure['expires'])
+        return {'sites': stats, 'negative_entries': negative}
+
+    def _site(self, key: str) -> Dict[str, Any]:
+        """Con lock: estado del circuito del sitio"""
+        return self._sites.setdefault(key, {
+            'state': CLOSED, 'failures': 0, 'probes': 0, 'opened_at': 0.0,
+            'open_seconds': self.open_seconds, 'rejected': 0, 'last_error': None
+        })
+
+    def _open(self, key: str, site: Dict[str, Any], now: float):
+        """Con lock: abre el circuito del sitio"""
+        site.update(state=OPEN, opened_at=now, probes=0)
+        logger.warning(f"Circuito de {key} abierto por {site['open_seconds']:.0f}s tras "
+                       f"{site['failures']} fallos: {site['last_error']}")
+
+    def _message(self, key: str, site: Dict[str, Any], now: float) -> str:
+        retry_in = max(1, round(site['opened_at'] + site['open_seconds'] - now))
+        return (f"{key} no está respondiendo (fallaron {site['failures']} intentos seguidos). "
+                f"Se volverá a probar en unos {retry_in}s")
+
+    def _prune_negative(self, now: float):
+        """Con lock: descarta las vencidas o, si no hay, la más antigua"""
+        expired = [key for key, failure in self._negative.items() if now >= failure['expires']]
+        for key in expired:
+            del self._negative[key]
+        if not expired and self._negative:
+            del self._negative[min(self._negative, key=lambda k: self._negative[k]['expires'])]
+
+
+# Instancia global usada por el dispatcher
+circuit_breaker = CircuitBreaker()
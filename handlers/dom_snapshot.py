@@ -0,0 +1,151 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Script que recolecta en un solo execute_script la parte del DOM que usan los handlers:
+# enlaces, botones, iframes, pares dt/dd y los elementos de selectores CSS pedidos.
+# Cada find_element/is_displayed/get_attribute/.text es un round-trip HTTP al WebDriver;
+# aquí todo vuelve en una sola respuesta.
+SNAPSHOT_JS = """
+    const selectors = arguments[0] || [];
+    const includeElements = arguments[1];
+
+    const ownText = (el) => Array.from(el.childNodes)
+        .filter((n) => n.nodeType === Node.TEXT_NODE)
+        .map((n) => n.nodeValue).join('').trim();
+    const isVisible = (el) => {
+        const style = window.getComputedStyle(el);
+        if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') {
+            return false;
+        }
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0;
+    };
+    const describe = (el, index, withElement) => {
+        const info = {
+            index: index,
+            tag: el.tagName.toLowerCase(),
+            id: el.id || '',
+            classes: el.getAttribute('class') || '',
+            text: (el.innerText || '').trim(),
+            own_text: ownText(el),
+            visible: isVisible(el)
+        };
+        if (includeElements && withElement) info.element = el;
+        return info;
+    };
+
+    const links = Array.from(document.querySelectorAll('a')).map((a, i) => {
+        const info = describe(a, i);
+        info.href = a.href || '';
+        info.raw_href = a.getAttribute('href') || '';
+        info.onclick = a.getAttribute('onclick') || '';
+        info.span_text = Array.from(a.querySelectorAll('span')).map(ownText).join(' ');
+        return info;
+    });
+
+    const buttons = Array.from(document.querySelectorAll('button')).map((button, i) => {
+        const info = describe(button, i);
+        const parent = button.parentElement;
+        info.parent_href = parent && parent.tagName === 'A' ? (parent.href || '') : '';
+        info.data_url = button.getAttribute('data-url') || '';
+        return info;
+    });
+
+    const iframes = Array.from(document.querySelectorAll('iframe')).map((frame, i) => {
+        const info = describe(frame, i, true);
+        info.src = frame.getAttribute('src') || '';
+        return info;
+    });
+
+    const terms = Array.from(document.querySelectorAll('dt')).map((dt) => {
+        let dd = dt.nextElementSibling;
+        while (dd && dd.tagName !== 'DD') dd = dd.nextElementSibling;
+        return {
+            term: (dt.innerText || '').trim(),
+            text: dd ? (dd.innerText || '').trim() : '',
+            links: dd ? Array.from(dd.querySelectorAll('a')).map((a) => (a.innerText || '').trim()) : []
+        };
+    });
+
+    const rawHrefs = Array.from(document.querySelectorAll('[href]'))
+        .map((el) => el.getAttribute('href') || '');
+
+    const matches = {};
+    selectors.forEach((selector) => {
+        try {
+            matches[selector] = Array.from(document.querySelectorAll(selector))
+                .map((el, i) => describe(el, i, true));
+        } catch (e) {
+            matches[selector] = [];
+        }
+    });
+
+    return {
+        url: window.location.href,
+        title: document.title,
+        ready_state: document.readyState,
+        links: links,
+        buttons: buttons,
+        iframes: iframes,
+        terms: terms,
+        raw_hrefs: rawHrefs,
+        matches: matches
+    };
+"""
+
+EMPTY_SNAPSHOT = {
+    'url': '',
+    'title': '',
+    'ready_state': '',
+    'links': [],
+    'buttons': [],
+    'iframes': [],
+    'terms': [],
+    'raw_hrefs': [],
+    'matches': {}
+}
+
+
+def take_snapshot(driver, selectors=(), include_elements=False):
+    """
+    Obtiene una foto estructurada del DOM en un solo round-trip al WebDriver
+
+    Args:
+        driver: WebDriver de Selenium
+        selectors (iterable): Selectores CSS adicionales a evaluar
+        include_elements (bool): Devolver referencias WebElement (solo en matches e iframes)
+            para poder hacer clic o cambiar de frame sin otra búsqueda
+
+    Returns:
+        dict: url, title, ready_state, links, buttons, iframes, terms, raw_hrefs, matches
+    """
+    try:
+        snapshot = driver.execute_script(SNAPSHOT_JS, list(selectors), include_elements) or {}
+    except Exception as e:
+        logger.error(f"Error obteniendo snapshot del DOM: {e}")
+        snapshot = {}
+
+    result = dict(EMPTY_SNAPSHOT)
+    result.update(snapshot)
+    return result
+
+
+def first_visible(snapshot, selectors):
+    """Devuelve (selector, info) del primer elemento visible en el orden de los selectores"""
+    for selector in selectors:
+        for info in snapshot['matches'].get(selector, []):
+            if info.get('visible'):
+                return selector, info
+    return None, None
+
+
+def wait_for_snapshot(driver, condition, timeout=3, interval=0.5, **kwargs):
+    """Toma snapshots hasta que condition(snapshot) sea verdadero o se agote el tiempo"""
+    deadline = time.time() + timeout
+    snapshot = take_snapshot(driver, **kwargs)
+    while not condition(snapshot) and time.time() < deadline:
+        time.sleep(interval)
+        snapshot = take_snapshot(driver, **kwargs)
+    return snapshot
@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import logging
+from typing import Optional, Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Base SQLite compartida entre el bot y los workers de navegador
+FILM_CACHE_DB = os.getenv("FILM_CACHE_DB", "film_cache.db")
+# Las fichas de películas casi no cambian: TTL largo
+FILM_CACHE_TTL = float(os.getenv("FILM_CACHE_TTL_DAYS", "30")) * 86400
+# Refresco en segundo plano de entradas viejas (0 = desactivado)
+FILM_CACHE_REFRESH = os.getenv("FILM_CACHE_REFRESH", "0") == "1"
+FILM_CACHE_REFRESH_AFTER = float(os.getenv("FILM_CACHE_REFRESH_AFTER_DAYS", "7")) * 86400
+
+FILM_ID_PATTERN = re.compile(r'/film(\d+)\.html')
+
+
+def film_id_from_url(url: str) -> Optional[str]:
+    """Extrae el ID de FilmAffinity de /filmNNNNNN.html (igual en móvil y escritorio)"""
+    match = FILM_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+class FilmCache:
+    """Caché persistente de fichas de FilmAffinity: datos estructurados y hashtags ya generados"""
+
+    def __init__(self, path: str = FILM_CACHE_DB, ttl: float = FILM_CACHE_TTL,
+                 refresh: bool = FILM_CACHE_REFRESH, refresh_after: float = FILM_CACHE_REFRESH_AFTER):
+        self.path = path
+        self.ttl = ttl
+        self.refresh = refresh
+        self.refresh_after = refresh_after
+        self._conn = None
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS films (
+                    film_id TEXT PRIMARY KEY,
+                    url TEXT,
+                    data TEXT,
+                    hashtags TEXT,
+                    fetched_at REAL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def get(self, film_id: str) -> Optional[Dict[str, Any]]:
+        """Entrada vigente de una película, o None si no existe o expiró"""
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT url, data, hashtags, fetched_at FROM films WHERE film_id = ?", (film_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error leyendo caché de películas: {e}")
+            return None
+
+        if not row or time.time() - row[3] > self.ttl:
+            return None
+        return {'url': row[0], 'data': json.loads(row[1]), 'hashtags': row[2], 'fetched_at': row[3]}
+
+    def put(self, film_id: str, url: str, data: Dict[str, Any], hashtags: str):
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO films (film_id, url, data, hashtags, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (film_id, url, json.dumps(data, ensure_ascii=False), hashtags, time.time())
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error guardando en caché de películas: {e}")
+
+    def lookup(self, url: str, refresh: Optional[Callable[[], Any]] = None) -> Optional[str]:
+        """
+        Hashtags en caché para la URL, sin navegador
+
+        Args:
+            url (str): URL de la película
+            refresh (callable): Vuelve a extraer la ficha; se lanza en segundo plano
+                si la entrada es vieja y FILM_CACHE_REFRESH está activo
+        """
+        film_id = film_id_from_url(url)
+        if not film_id:
+            return None
+
+        entry = self.get(film_id)
+        if entry is None:
+            return None
+
+        if refresh and self.refresh and time.time() - entry['fetched_at'] > self.refresh_after:
+            self._schedule_refresh(film_id, refresh)
+        return entry['hashtags']
+
+    def _schedule_refresh(self, film_id: str, refresh: Callable[[], Any]):
+        with self._lock:
+            if film_id in self._refreshing:
+                return
+            self._refreshing.add(film_id)
+
+        def run():
+            try:
+                refresh()
+                logger.info(f"Película {film_id} refrescada en segundo plano")
+            except Exception as e:
+                logger.warning(f"Error refrescando película {film_id}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(film_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+# Instancia global de la caché
+film_cache = FilmCache()
@@ -0,0 +1,290 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional
+
+from .browser_registry import browser_registry
+
+logger = logging.getLogger(__name__)
+
+# Sitios con cola larga de latencia donde se lanza un intento de respaldo
+HEDGE_SITES = {s.strip() for s in os.getenv("HEDGE_SITES", "apkdone,uptodown").split(",") if s.strip()}
+# Percentil de latencia a partir del cual se lanza el respaldo
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+# Muestras mínimas por sitio antes de empezar a cubrir
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "16"))
+
+# Señal de cancelación del intento en curso (None fuera del hedger)
+_cancel_event = contextvars.ContextVar('hedge_cancel', default=None)
+
+
+class AttemptCancelled(BaseException):
+    """
+    El intento perdió la carrera cubierta y se abandona
+
+    Hereda de BaseException (como asyncio.CancelledError) para que los
+    except Exception de los bucles de reintento de los handlers no la traguen.
+    """
+
+
+def hedge_sleep(seconds: float):
+    """
+    time.sleep que se interrumpe si el intento perdió la carrera
+
+    Future.cancel() no detiene un intento que ya corre en el pool: los handlers
+    cubiertos esperan con esta función entre peticiones para soltar el hilo (y
+    la conexión) en cuanto el otro intento gana.
+    """
+    event = _cancel_event.get()
+    if event is None:
+        time.sleep(seconds)
+    elif event.wait(seconds):
+        raise AttemptCancelled()
+
+
+def _reap(owner: str):
+    """Mata los navegadores del intento perdedor (locales y en los workers de navegador)"""
+    from browser_worker import browser_workers
+    browser_registry.reap_owner(owner)
+    browser_workers.reap_owner(owner)
+
+
+class Hedger:
+    """
+    Peticiones cubiertas: si el intento principal supera el p90 de latencia del sitio,
+    se lanza un respaldo (el mismo u otra estrategia) y gana el primero que tenga éxito
+
+    El intento perdedor recibe la señal de cancelación y la atiende en su siguiente
+    hedge_sleep; mientras tanto ocupa un hilo del pool. Si el pool no tiene hueco
+    para principal y respaldo, la petición se resuelve sin cubrir en el hilo que
+    llama, de modo que los perdedores que aún no terminaron nunca dejan a las
+    tareas esperando turno en el pool.
+    """
+
+    def __init__(self, sites=HEDGE_SITES, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, window: int = HEDGE_WINDOW,
+                 max_workers: int = HEDGE_MAX_WORKERS):
+        self.sites = set(sites)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        # Intentos enviados al pool propio que aún no terminaron (incluye perdedores cancelados)
+        self._busy = 0
+        self._latencies: Dict[str, deque] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def threshold(self, site: str) -> Optional[float]:
+        """Latencia viva (percentil) del sitio, o None si aún no hay muestras suficientes"""
+        with self._lock:
+            samples = sorted(self._latencies.get(site, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(int(len(samples) * self.percentile), len(samples) - 1)
+        return samples[index]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Tasa de cobertura y de victorias del respaldo por sitio"""
+        result = {}
+        with self._lock:
+            sites = dict(self._stats)
+        for site, counts in sites.items():
+            requests = counts['requests'] or 1
+            hedged = counts['hedged'] or 1
+            p90 = self.threshold(site)
+            result[site] = {
+                'requests': counts['requests'],
+                'hedged': counts['hedged'],
+                'backup_wins': counts['backup_wins'],
+                'saturated': counts['saturated'],
+                'hedge_rate': round(counts['hedged'] / requests, 3),
+                'win_rate': round(counts['backup_wins'] / hedged, 3),
+                'p90': round(p90, 2) if p90 is not None else None
+            }
+        return result
+
+    def run(self, site: str, attempt, backup=None, timeout: Optional[float] = None,
+            enabled: Optional[bool] = None, executor=None, owner: Optional[str] = None):
+        """
+        Ejecuta attempt() con cobertura en hilos
+
+        Args:
+            site (str): Clave del sitio para latencias y estadísticas
+            attempt (callable): Resolución principal
+            backup (callable): Resolución de respaldo (por defecto la misma)
+            timeout (float): Límite total en segundos (None = sin límite)
+            enabled (bool): Forzar o desactivar la cobertura (por defecto según HEDGE_SITES)
+            executor: Pool donde correr los intentos (por defecto el del hedger)
+            owner (str): Dueño de los navegadores del intento principal
+
+        Raises:
+            Exception: El último error de los intentos, o timeout
+        """
+        executor = executor or self.executor
+        owner = owner or browser_registry.current_owner()
+        delay = self._delay_for(site, enabled)
+        backup_owner = f"{owner}/hedge"
+
+        if executor is self.executor and self._saturated():
+            # Pool ocupado (p. ej. por perdedores que aún no soltaron su hilo): sin cubrir
+            logger.info(f"Pool de cobertura lleno, {site} se resuelve sin respaldo")
+            self._count_saturated(site)
+            return attempt()
+
+        start = time.time()
+        deadline = start + timeout if timeout else None
+        primary = self._submit(executor, attempt, owner)
+        owners = {primary: owner}
+        pending = {primary}
+        hedged = False
+        last_error = None
+
+        try:
+            while pending:
+                now = time.time()
+                if deadline is not None and now >= deadline:
+                    break
+
+                wait_time = deadline - now if deadline is not None else None
+                if delay is not None and not hedged:
+                    until_hedge = max(0, start + delay - now)
+                    wait_time = until_hedge if wait_time is None else min(wait_time, until_hedge)
+
+                done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future.exception() is None:
+                        self._record(site, time.time() - start, hedged, future is not primary)
+                        return future.result()
+                    last_error = future.exception()
+
+                # Solo un principal lento (sobre el percentil) se cubre; si falló, el error
+                # sube y el reintento lo programa la cola con su backoff
+                if delay is not None and not hedged and pending and time.time() - start >= delay:
+                    hedged = True
+                    logger.info(f"Cubriendo {site}: principal supera {delay:.1f}s, lanzando respaldo")
+                    future = self._submit(executor, backup or attempt, backup_owner)
+                    owners[future] = backup_owner
+                    pending.add(future)
+        finally:
+            # Cancelar y limpiar los intentos que perdieron (los que ya corren salen en su hedge_sleep)
+            for future in pending:
+                future.cancel()
+                future.cancel_event.set()
+                _reap(owners[future])
+
+        self._record(site, None, hedged, False)
+        if last_error is not None:
+            raise last_error
+        raise Exception(f"Timeout: sin resultado después de {timeout}s")
+
+    async def arun(self, site: str, attempt, backup=None, timeout: Optional[float] = None,
+                   enabled: Optional[bool] = None):
+        """Versión asíncrona de run(): attempt y backup son funciones que devuelven corutinas"""
+        delay = self._delay_for(site, enabled)
+        loop = asyncio.get_running_loop()
+
+        start = loop.time()
+        deadline = start + timeout if timeout else None
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        hedged = False
+        last_error = None
+
+        try:
+            while pending:
+                now = loop.time()
+                if deadline is not None and now >= deadline:
+                    break
+
+                wait_time = deadline - now if deadline is not None else None
+                if delay is not None and not hedged:
+                    until_hedge = max(0, start + delay - now)
+                    wait_time = until_hedge if wait_time is None else min(wait_time, until_hedge)
+
+                done, pending = await asyncio.wait(pending, timeout=wait_time, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        self._record(site, loop.time() - start, hedged, task is not primary)
+                        return task.result()
+                    last_error = task.exception()
+
+                if delay is not None and not hedged and pending and loop.time() - start >= delay:
+                    hedged = True
+                    logger.info(f"Cubriendo {site}: principal supera {delay:.1f}s, lanzando respaldo")
+                    pending.add(asyncio.ensure_future((backup or attempt)()))
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self._record(site, None, hedged, False)
+        if last_error is not None:
+            raise last_error
+        raise Exception(f"Timeout: sin resultado después de {timeout}s")
+
+    def _delay_for(self, site: str, enabled: Optional[bool]) -> Optional[float]:
+        if enabled is None:
+            enabled = site in self.sites
+        return self.threshold(site) if enabled else None
+
+    def _submit(self, executor, func, owner: str):
+        """Lanza un intento en el pool con una copia del contexto (intento de la cola) y su señal de cancelación"""
+        event = threading.Event()
+        future = executor.submit(contextvars.copy_context().run, self._call, func, owner, event)
+        future.cancel_event = event
+        if executor is self.executor:
+            with self._lock:
+                self._busy += 1
+            # También se llama si el intento se canceló antes de empezar
+            future.add_done_callback(self._release_slot)
+        return future
+
+    def _release_slot(self, future):
+        with self._lock:
+            self._busy -= 1
+
+    def _call(self, func, owner: str, event: threading.Event):
+        """Ejecuta un intento con sus navegadores a nombre del dueño indicado"""
+        browser_registry.set_owner(owner)
+        _cancel_event.set(event)
+        try:
+            return func()
+        finally:
+            browser_registry.clear_owner()
+
+    def _saturated(self) -> bool:
+        """True si el pool propio no tiene hueco para un principal y su respaldo"""
+        with self._lock:
+            return self._busy + 2 > self.max_workers
+
+    def _count_saturated(self, site: str):
+        with self._lock:
+            self._counts(site)['saturated'] += 1
+
+    def _record(self, site: str, latency: Optional[float], hedged: bool, backup_won: bool):
+        with self._lock:
+            counts = self._counts(site)
+            counts['requests'] += 1
+            counts['hedged'] += int(hedged)
+            counts['backup_wins'] += int(backup_won)
+            if latency is not None:
+                self._latencies.setdefault(site, deque(maxlen=self.window)).append(latency)
+
+
+    def _counts(self, site: str) -> Dict[str, int]:
+        """Con lock: contadores del sitio"""
+        return self._stats.setdefault(site, {'requests': 0, 'hedged': 0, 'backup_wins': 0, 'saturated': 0})
+
+
+# Instancia global usada por el dispatcher
+hedger = Hedger()
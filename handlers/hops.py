@@ -0,0 +1,139 @@
+import os
+import json
+import threading
+import logging
+from urllib.parse import urlparse
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Plantillas de URL aprendidas entre saltos, persistidas entre reinicios
+HOP_TEMPLATES_FILE = os.getenv("HOP_TEMPLATES_FILE", "hop_templates.json")
+# Observaciones coincidentes antes de confiar en una plantilla y saltarse la página
+HOP_MIN_CONFIRMATIONS = int(os.getenv("HOP_MIN_CONFIRMATIONS", "3"))
+
+
+def url_tokens(url: str) -> Dict[str, str]:
+    """Piezas de una URL que pueden reaparecer en la del siguiente salto"""
+    parsed = urlparse(url)
+    path = parsed.path.rstrip('/')
+    last = path.rsplit('/', 1)[-1]
+    return {
+        'scheme': parsed.scheme or 'https',
+        'host': parsed.netloc,
+        'path': path.rsplit('.', 1)[0] if '.' in last else path,
+        'slug': last.rsplit('.', 1)[0],
+    }
+
+
+def template_for(source_url: str, target_url: str) -> Optional[str]:
+    """
+    Expresa target_url en función de las piezas de source_url, o None si no se puede
+
+    p. ej. https://liteapks.com/spotify-2.html -> https://liteapks.com/download/spotify-2
+    da '{scheme}://{host}/download/{slug}'
+    """
+    tokens = url_tokens(source_url)
+    if not tokens['slug']:
+        return None
+
+    template = target_url.replace('{', '{{').replace('}', '}}')
+    # Primero las piezas más largas, para que 'path' gane a 'slug' cuando lo contiene
+    replaced = False
+    for name in sorted(tokens, key=lambda n: len(tokens[n]), reverse=True):
+        value = tokens[name]
+        if value and value in template:
+            template = template.replace(value, f'{{{name}}}', 1)
+            replaced = replaced or name in ('slug', 'path')
+    return template if replaced else None
+
+
+class HopTemplates:
+    """
+    Transformaciones de URL entre saltos de un resolvedor de varias páginas
+
+    Cada vez que un salto se recorre completo se registra cómo se pasó de una URL
+    a la siguiente; cuando la misma plantilla se confirma HOP_MIN_CONFIRMATIONS
+    veces, el handler puede derivar la URL del salto y no pedir la página intermedia.
+    """
+
+    def __init__(self, path: str = HOP_TEMPLATES_FILE, min_confirmations: int = HOP_MIN_CONFIRMATIONS):
+        self.path = path
+        self.min_confirmations = min_confirmations
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def learn(self, hop: str, source_url: str, target_url: str):
+        """Registra la transformación observada en un salto recorrido completo"""
+        template = template_for(source_url, target_url)
+        if template is None:
+            return
+
+        with self._lock:
+            entry = self._templates.get(hop)
+            if entry and entry['template'] == template:
+                entry['confirmations'] += 1
+                # Solo se escribe al volverse confiable: el resto de confirmaciones no cambia nada
+                changed = entry['confirmations'] == self.min_confirmations
+            else:
+                if entry:
+                    logger.info(f"Plantilla de {hop} cambió: {entry['template']} -> {template}")
+                entry = {'template': template, 'confirmations': 1, 'skipped': 0, 'failures': 0}
+                self._templates[hop] = entry
+                changed = True
+        if changed:
+            self._save()
+
+    def derive(self, hop: str, source_url: str) -> Optional[str]:
+        """URL del siguiente salto si la plantilla del salto es confiable"""
+        with self._lock:
+            entry = self._templates.get(hop)
+            if not entry or entry['confirmations'] < self.min_confirmations:
+                return None
+            entry['skipped'] += 1
+            template = entry['template']
+        try:
+            return template.format(**url_tokens(source_url))
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def record_failure(self, hop: str):
+        """La URL derivada no sirvió: volver a aprender la plantilla con la cadena completa"""
+        with self._lock:
+            entry = self._templates.get(hop)
+            if not entry:
+                return
+            entry['confirmations'] = 0
+            entry['failures'] += 1
+        logger.warning(f"Plantilla de {hop} falló, se vuelve a la cadena completa")
+        self._save()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {hop: dict(entry) for hop, entry in self._templates.items()}
+
+    def _save(self):
+        with self._lock:
+            data = json.dumps(self._templates, indent=2)
+        try:
+            # Nombre temporal por hilo: dos guardados simultáneos no comparten archivo
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.debug(f"No se pudo escribir {self.path}: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self._templates = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Plantillas de saltos ilegibles ({self.path}), empezando de cero: {e}")
+
+
+# Instancia global compartida por los handlers de varios saltos
+hop_templates = HopTemplates()
@@ -0,0 +1,310 @@
+import os
+import re
+import json
+import time
+import zlib
+import hashlib
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Any, Tuple
+from urllib.parse import urlparse, urlunparse
+
+from .canonical import clean_query
+
+logger = logging.getLogger(__name__)
+
+# Caché HTTP en disco para las páginas que piden los handlers (0 = desactivada)
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE", "1") != "0"
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "http_cache")
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "256"))
+# Frescura por sitio en segundos ("dominio=segundos,..."); reemplaza a Cache-Control
+DEFAULT_FRESHNESS = {
+    'apkdone.com': 900,
+    'apk4free.net': 900,
+    'liteapks.com': 900,
+    # Las páginas de descarga de Uptodown llevan tokens que caducan
+    'uptodown.com': 300,
+}
+HTTP_CACHE_FRESHNESS = {
+    **DEFAULT_FRESHNESS,
+    **{domain.strip(): int(seconds) for domain, seconds in
+       (item.split('=', 1) for item in os.getenv("HTTP_CACHE_FRESHNESS", "").split(',') if '=' in item)}
+}
+
+# Páginas de descarga: traen enlaces con tokens que caducan, así que no usan la frescura
+# del sitio (solo su propio Cache-Control) y siempre se revalidan
+DOWNLOAD_PAGE = re.compile(r'/(?:download|dload)(?:/|$)')
+
+# Cabeceras de la respuesta que se guardan con el cuerpo
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Date', 'Expires')
+
+
+def cache_key(url: str) -> str:
+    """URL canónica: esquema y host en minúsculas, sin fragmento ni parámetros de seguimiento"""
+    parsed = urlparse(url)
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or '/',
+                       parsed.params, clean_query(parsed.query), ''))
+
+
+def _cache_control(headers) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+class CachedResponse:
+    """Respuesta servida desde disco, con la interfaz que usan los handlers (también en modo stream)"""
+
+    def __init__(self, url, headers, content, encoding, revalidated=False):
+        self.url = url
+        self.status_code = 200
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.from_cache = True
+        self.revalidated = revalidated
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=16384):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class HTTPCache:
+    """
+    Caché HTTP en disco, comprimida con zlib y con clave en la URL canónica
+
+    Una entrada fresca se sirve sin red; una vencida se revalida con
+    If-None-Match / If-Modified-Since y un 304 la renueva sin volver a bajar la página.
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_mb: int = HTTP_CACHE_MAX_MB,
+                 freshness: Dict[str, int] = None):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.freshness = dict(HTTP_CACHE_FRESHNESS if freshness is None else freshness)
+        self._lock = threading.Lock()
+        self._stats = {'fresh': 0, 'revalidated': 0, 'miss': 0, 'stored': 0}
+        self._writes = 0
+
+    def get(self, session, url: str, **kwargs):
+        """GET a través de la caché usando la sesión (cloudscraper) indicada"""
+        key, entry, fresh = self.lookup(url)
+        if fresh is not None:
+            return fresh
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self.validators(entry))
+        response = session.get(url, headers=headers, **kwargs)
+
+        revalidated = self.revalidated(key, url, entry, response.status_code, response.headers)
+        if revalidated is not None:
+            response.close()
+            return revalidated
+
+        self.record_miss()
+        # Las respuestas en modo stream las guarda stream_page si llega a leerlas completas
+        if not kwargs.get('stream') and response.status_code == 200:
+            self._store(key, response.url, response.headers, response.content, response.encoding)
+        return response
+
+    def covers(self, url: str) -> bool:
+        """True si el host tiene frescura configurada (sitios cuyas páginas pasan por la caché)"""
+        return self._site_freshness(urlparse(url).hostname or '') is not None
+
+    def lookup(self, url: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[CachedResponse]]:
+        """(clave, entrada guardada, respuesta si la entrada sigue fresca)"""
+        key = cache_key(url)
+        entry = self._read(key)
+        if entry and time.time() < entry['expires']:
+            self._count('fresh')
+            return key, entry, self._response(entry)
+        return key, entry, None
+
+    def validators(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Cabeceras condicionales para revalidar una entrada vencida"""
+        headers = {}
+        if entry:
+            if entry['headers'].get('ETag'):
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def revalidated(self, key: str, url: str, entry: Optional[Dict[str, Any]],
+                    status_code: int, headers) -> Optional[CachedResponse]:
+        """Con un 304 renueva la frescura con las cabeceras nuevas y devuelve lo guardado"""
+        if not entry or status_code != 304:
+            return None
+        entry['headers'].update({h: headers[h] for h in STORED_HEADERS if h in headers})
+        entry['expires'] = time.time() + self._lifetime(url, entry['headers'])
+        self._write(key, entry)
+        self._count('revalidated')
+        return self._response(entry, revalidated=True)
+
+    def record_miss(self):
+        self._count('miss')
+
+    def store_page(self, url: str, final_url: str, headers, content: bytes, encoding: Optional[str]):
+        """Guarda una página leída fuera de get() (lectura incremental completa o ruta asíncrona)"""
+        self._store(cache_key(url), final_url, headers, content, encoding)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        total = sum(stats[k] for k in ('fresh', 'revalidated', 'miss')) or 1
+        stats['hit_rate'] = round((stats['fresh'] + stats['revalidated']) / total, 3)
+        return stats
+
+    def _store(self, key: str, final_url: str, response_headers, content: bytes, encoding: Optional[str]):
+        directives = _cache_control(response_headers)
+        if 'no-store' in directives or 'private' in directives:
+            return
+        headers = {h: response_headers[h] for h in STORED_HEADERS if h in response_headers}
+        entry = {
+            'url': final_url,
+            'headers': headers,
+            'encoding': encoding or 'utf-8',
+            'expires': time.time() + self._lifetime(key, headers),
+            'content': content,
+        }
+        self._write(key, entry)
+        self._count('stored')
+
+    def _site_freshness(self, host: str) -> Optional[int]:
+        for domain, seconds in self.freshness.items():
+            if host == domain or host.endswith(f".{domain}"):
+                return seconds
+        return None
+
+    def _lifetime(self, url: str, headers: Dict[str, str]) -> float:
+        """Segundos de frescura: override del sitio (salvo páginas de descarga), si no Cache-Control / Expires"""
+        parsed = urlparse(url)
+        seconds = self._site_freshness(parsed.hostname or '')
+        if seconds is not None and not DOWNLOAD_PAGE.search(parsed.path):
+            return seconds
+
+        directives = _cache_control(headers)
+        if 'no-cache' in directives:
+            return 0
+        if directives.get('s-maxage') or directives.get('max-age'):
+            try:
+                return int(directives.get('s-maxage') or directives['max-age'])
+            except ValueError:
+                return 0
+        if headers.get('Expires') and headers.get('Date'):
+            try:
+                return (parsedate_to_datetime(headers['Expires']) - parsedate_to_datetime(headers['Date'])).total_seconds()
+            except (TypeError, ValueError):
+                return 0
+        return 0
+
+    def _response(self, entry: Dict[str, Any], revalidated: bool = False) -> CachedResponse:
+        return CachedResponse(entry['url'], entry['headers'], entry['content'], entry['encoding'], revalidated)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.z')
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error) as e:
+            logger.debug(f"Entrada de caché ilegible para {key}: {e}")
+            return None
+
+        # Formato: cabecera JSON, salto de línea y cuerpo
+        meta, _, content = raw.partition(b'\n')
+        try:
+            entry = json.loads(meta)
+        except ValueError:
+            return None
+        entry['content'] = content
+        return entry
+
+    def _write(self, key: str, entry: Dict[str, Any]):
+        meta = {k: v for k, v in entry.items() if k != 'content'}
+        data = zlib.compress(json.dumps(meta).encode() + b'\n' + entry['content'])
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"No se pudo escribir la caché de {key}: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """Borra las entradas más viejas si la caché supera HTTP_CACHE_MAX_MB"""
+        try:
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.z')]
+            files = sorted(((os.stat(path).st_mtime, os.stat(path).st_size, path) for path in files), reverse=True)
+        except OSError:
+            return
+        total = 0
+        for _, size, path in files:
+            total += size
+            if total > self.max_bytes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+
+class CachedSession:
+    """Envuelve una sesión de cloudscraper: los GET pasan por la caché, el resto se delega"""
+
+    def __init__(self, session, cache: HTTPCache):
+        self._session = session
+        self._cache = cache
+
+    def get(self, url, **kwargs):
+        return self._cache.get(self._session, url, **kwargs)
+
+    def store_page(self, url, response, content: bytes):
+        """Guarda una respuesta en modo stream leída completa (la llama stream_page)"""
+        if response.status_code == 200 and not getattr(response, 'from_cache', False):
+            self._cache.store_page(url, response.url, response.headers, content, response.encoding)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+# Instancia global compartida por los handlers
+http_cache = HTTPCache()
+
+
+def cached_session(session):
+    """Sesión con caché HTTP en disco (o la misma sesión si HTTP_CACHE=0)"""
+    return CachedSession(session, http_cache) if HTTP_CACHE_ENABLED else session
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Enlaces resueltos de URLs populares, servidos sin volver a resolver (0 = desactivado)
+LINK_STORE_ENABLED = os.getenv("LINK_STORE", "1") != "0"
+LINK_STORE_TTL = float(os.getenv("LINK_STORE_TTL", "900"))
+# Vida por sitio ("sitio=segundos,..."): los enlaces de Uptodown llevan tokens cortos
+LINK_STORE_SITE_TTL = {
+    'uptodown': 240,
+    **{site.strip(): float(seconds) for site, seconds in
+       (item.split('=', 1) for item in os.getenv("LINK_STORE_SITE_TTL", "").split(',') if '=' in item)}
+}
+# Una URL es popular con estas peticiones dentro de la ventana
+LINK_STORE_HOT_REQUESTS = int(os.getenv("LINK_STORE_HOT_REQUESTS", "3"))
+LINK_STORE_WINDOW = float(os.getenv("LINK_STORE_WINDOW", "3600"))
+# Fracción final de la vida del enlace en la que se refresca en segundo plano
+LINK_STORE_REFRESH_AHEAD = float(os.getenv("LINK_STORE_REFRESH_AHEAD", "0.2"))
+LINK_STORE_MAX_ENTRIES = int(os.getenv("LINK_STORE_MAX_ENTRIES", "500"))
+
+# FilmAffinity devuelve hashtags y ya tiene su propia caché persistente
+EXCLUDED_SITES = {'filmaffinity'}
+
+
+class LinkStore:
+    """
+    Enlaces directos de las URLs más pedidas, con refresco anticipado
+
+    Cada consulta cuenta como una petición de la URL; las que superan
+    LINK_STORE_HOT_REQUESTS en la ventana guardan su enlace resuelto. Poco antes
+    de que venza, due_for_refresh() las entrega para que la cola las vuelva a
+    resolver con prioridad baja, de modo que las populares casi siempre se
+    responden al instante.
+    """
+
+    def __init__(self, ttl: float = LINK_STORE_TTL, site_ttl: Dict[str, float] = None,
+                 hot_requests: int = LINK_STORE_HOT_REQUESTS, window: float = LINK_STORE_WINDOW,
+                 refresh_ahead: float = LINK_STORE_REFRESH_AHEAD, max_entries: int = LINK_STORE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.site_ttl = dict(LINK_STORE_SITE_TTL if site_ttl is None else site_ttl)
+        self.hot_requests = hot_requests
+        self.window = window
+        self.refresh_ahead = refresh_ahead
+        self.max_entries = max_entries
+        self._requests: Dict[str, deque] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._refreshing = set()
+        self._stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0}
+        self._lock = threading.Lock()
+
+    def lookup(self, match) -> Optional[str]:
+        """Cuenta la petición y devuelve el enlace guardado si sigue vigente"""
+        if not LINK_STORE_ENABLED or match.spec.key in EXCLUDED_SITES:
+            return None
+
+        now = time.time()
+        with self._lock:
+            requests = self._requests.setdefault(match.key, deque(maxlen=max(self.hot_requests * 4, 16)))
+            requests.append(now)
+
+            entry = self._entries.get(match.key)
+            if entry and now < entry['expires']:
+                self._stats['hits'] += 1
+                return entry['link']
+            self._stats['misses'] += 1
+        return None
+
+    def remember(self, match, link: str):
+        """Guarda el enlace si la URL es popular"""
+        if not LINK_STORE_ENABLED or match.spec.key in EXCLUDED_SITES or not link:
+            return
+
+        now = time.time()
+        with self._lock:
+            if not self._is_hot(match.key, now):
+                return
+            if match.key not in self._entries and len(self._entries) >= self.max_entries:
+                self._evict(now)
+            ttl = self.site_ttl.get(match.spec.key, self.ttl)
+            self._entries[match.key] = {'match': match, 'link': link, 'stored_at': now, 'expires': now + ttl}
+
+    def due_for_refresh(self) -> List[Any]:
+        """Coincidencias populares cuyo enlace está por vencer (se marcan como en refresco)"""
+        now = time.time()
+        due = []
+        with self._lock:
+            # Olvidar los contadores de URLs que no se piden desde hace una ventana
+            for key in [k for k, requests in self._requests.items() if now - requests[-1] > self.window]:
+                del self._requests[key]
+
+            for key, entry in list(self._entries.items()):
+                if key in self._refreshing:
+                    continue
+                if not self._is_hot(key, now):
+                    # Ya no es popular: dejar que venza sin refrescarlo
+                    if now >= entry['expires']:
+                        del self._entries[key]
+                    continue
+                lifetime = entry['expires'] - entry['stored_at']
+                if now >= entry['expires'] - lifetime * self.refresh_ahead:
+                    self._refreshing.add(key)
+                    due.append(entry['match'])
+        return due
+
+    def refresh(self, match):
+        """Vuelve a resolver un enlace popular (lo ejecuta la cola con prioridad baja)"""
+        from handlers import _resolve_guarded
+        from handlers.browser_registry import browser_registry
+
+        owner = f"refresh-{match.key}"
+        browser_registry.set_owner(owner)
+        try:
+            link = _resolve_guarded(match)
+            now = time.time()
+            with self._lock:
+                ttl = self.site_ttl.get(match.spec.key, self.ttl)
+                self._entries[match.key] = {'match': match, 'link': link, 'stored_at': now, 'expires': now + ttl}
+                self._stats['refreshes'] += 1
+            logger.info(f"Enlace popular refrescado: {match.key}")
+        except Exception as e:
+            with self._lock:
+                self._stats['refresh_failures'] += 1
+            logger.warning(f"No se pudo refrescar {match.key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(match.key)
+            browser_registry.reap_owner(owner)
+            browser_registry.consume_recycled(owner)
+            browser_registry.clear_owner()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        total = stats['hits'] + stats['misses'] or 1
+        stats['hit_rate'] = round(stats['hits'] / total, 3)
+        return stats
+
+    def _is_hot(self, key: str, now: float) -> bool:
+        """Con lock: peticiones de la URL dentro de la ventana"""
+        requests = self._requests.get(key)
+        if not requests:
+            return False
+        return sum(1 for t in requests if now - t <= self.window) >= self.hot_requests
+
+    def _evict(self, now: float):
+        """Con lock: descarta las vencidas o, si no hay, la que vence antes"""
+        expired = [key for key, entry in self._entries.items() if now >= entry['expires']]
+        for key in expired:
+            del self._entries[key]
+        if not expired and self._entries:
+            del self._entries[min(self._entries, key=lambda k: self._entries[k]['expires'])]
+
+
+# Instancia global usada por el dispatcher
+link_store = LinkStore()
@@ -1,8 +1,13 @@
 import re
 import time
+import asyncio
 import cloudscraper
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
+from .async_http import fetch, CloudflareChallenge
+from .page_fetch import fetch_pages, parsed_page, aextract
+from .http_cache import cached_session
+from .strategy_stats import strategy_stats
+from .hops import hop_templates
 
 class LiteAPKsHandler:
     @staticmethod
@@ -12,135 +17,285 @@ class LiteAPKsHandler:
 
     @staticmethod
     def get_scraper():
-        return cloudscraper.create_scraper(browser={
+        # Las páginas pasan por la caché HTTP en disco (revalidación con ETag/Last-Modified)
+        return cached_session(cloudscraper.create_scraper(browser={
             'browser': 'chrome',
             'platform': 'windows',
             'mobile': False,
             'desktop': True,
-        }, delay=1)
+        }, delay=1))
 
     @staticmethod
-    def get_direct_link(url, retries=3):
-        scraper = LiteAPKsHandler.get_scraper()
+    def _find_download_button(soup):
+        """Devuelve el href del enlace que contiene el span "Download (" o None"""
+        download_spans = soup.find_all('span', class_='align-middle')
+        for span in download_spans:
+            if span.get_text() and 'Download (' in span.get_text():
+                # Buscar el elemento padre que sea un enlace
+                parent = span.parent
+                while parent and parent.name != 'a':
+                    parent = parent.parent
+                if parent and parent.name == 'a' and parent.get('href'):
+                    return parent['href']
+        return None
+
+    @staticmethod
+    def _third_page_url(second_page_url):
+        """Construye la URL de la tercera página agregando "/1" a la segunda"""
+        if not second_page_url.endswith('/'):
+            return second_page_url + '/1'
+        return second_page_url + '1'
+
+    @staticmethod
+    def _by_download_span(soup):
+        # Span con "Download (" y su enlace padre
+        direct_url = LiteAPKsHandler._find_download_button(soup)
+        if direct_url and direct_url.startswith('http'):
+            return direct_url
+        return None
+
+    @staticmethod
+    def _by_file_link(soup):
+        # Enlaces a archivos APK o dominios de descarga comunes
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if href.startswith('http') and any(x in href.lower() for x in ['.apk', 'download', 'file']):
+                return href
+        return None
+
+    @staticmethod
+    def _by_script(soup):
+        # Patrones de descarga en JavaScript
+        for script in soup.find_all('script'):
+            if script.string:
+                matches = re.findall(r'(https?://[^\s"\']+\.apk[^\s"\']*)', script.string)
+                if matches:
+                    return matches[0]
+
+                matches = re.findall(r'(https?://[^\s"\']*(?:download|file)[^\s"\']*)', script.string)
+                for match in matches:
+                    if not any(x in match.lower() for x in ['google', 'facebook', 'twitter']):
+                        return match
+        return None
+
+    @staticmethod
+    def _by_external_link(soup):
+        # Cualquier enlace externo que no sea de redes sociales
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if href.startswith('http') and 'liteapks.com' not in href:
+                if not any(x in href.lower() for x in ['facebook', 'twitter', 'instagram', 'youtube', 'telegram']):
+                    return href
+        return None
+
+    # Métodos de extracción en su orden original (del más preciso al más amplio)
+    STRATEGIES = ('_by_download_span', '_by_file_link', '_by_script')
+    # Comodín: siempre al final y fuera del orden adaptativo
+    FALLBACKS = ('_by_external_link',)
+
+    @staticmethod
+    def _extract_direct_link(soup):
+        """Busca el enlace directo en el HTML ya parseado de la tercera página, empezando por el método que más acierta"""
+        strategies = [(name, getattr(LiteAPKsHandler, name)) for name in LiteAPKsHandler.STRATEGIES]
+        fallbacks = [(name, getattr(LiteAPKsHandler, name)) for name in LiteAPKsHandler.FALLBACKS]
+        direct_url, method = strategy_stats.run('liteapks', strategies, soup, fallbacks=fallbacks)
+        if direct_url:
+            print(f"Enlace encontrado ({method}): {direct_url}")
+        return direct_url
+
+    @staticmethod
+    def _walk_chain(url, scraper, full_chain, prefetched=None):
+        """
+        Recorre una vez la cadena inicial -> segunda página -> tercera página
+
+        Con atajos (full_chain=False) la segunda página no se pide (la tercera es
+        segunda + "/1") y, si la plantilla aprendida es confiable, tampoco la inicial.
+
+        Returns:
+            str: Enlace directo, o None si la tercera página no lo tiene
+        """
+        derived = None
+        if not full_chain and prefetched is None:
+            derived = hop_templates.derive('liteapks', url)
         
-        for attempt in range(retries):
-            try:
-                print(f"Intento {attempt + 1}: Procesando LiteAPKs...")
-                
+        try:
+            if derived:
+                second_page_url = derived
+                print(f"Paso 1 omitido: segunda página derivada {second_page_url}")
+            else:
                 # PASO 1: Acceder a la página inicial
                 print(f"Paso 1: Accediendo a {url}")
-                response = scraper.get(url)
-                response.raise_for_status()
+                # Con atajos se usa la página ya descargada por get_download_info
+                if not full_chain and prefetched is not None:
+                    response = prefetched
+                else:
+                    response = scraper.get(url)
+                    response.raise_for_status()
                 
-                soup = BeautifulSoup(response.text, 'html.parser')
+                soup = parsed_page(response)
                 
                 # Buscar el botón de descarga con el span que contiene "Download ("
-                download_button = None
-                
-                # Buscar span que contenga "Download (" y obtener su elemento padre (el enlace)
-                download_spans = soup.find_all('span', class_='align-middle')
-                for span in download_spans:
-                    if span.get_text() and 'Download (' in span.get_text():
-                        # Buscar el elemento padre que sea un enlace
-                        parent = span.parent
-                        while parent and parent.name != 'a':
-                            parent = parent.parent
-                        if parent and parent.name == 'a' and parent.get('href'):
-                            download_button = parent
-                            break
-                
-                if not download_button:
+                download_href = LiteAPKsHandler._find_download_button(soup)
+                if not download_href:
                     raise Exception("No se encontró el botón de descarga en la página inicial")
                 
-                # PASO 2: Ir a la segunda página
-                second_page_url = urljoin(url, download_button['href'])
+                second_page_url = urljoin(url, download_href)
+                hop_templates.learn('liteapks', url, second_page_url)
+            
+            # PASO 2: La segunda página solo se visita en la cadena completa
+            if full_chain:
                 print(f"Paso 2: Accediendo a segunda página {second_page_url}")
-                
                 response = scraper.get(second_page_url)
                 response.raise_for_status()
+            
+            # PASO 3: Construir URL de tercera página agregando "/1"
+            third_page_url = LiteAPKsHandler._third_page_url(second_page_url)
+            
+            print(f"Paso 3: Accediendo a tercera página {third_page_url}")
+            response = scraper.get(third_page_url)
+            response.raise_for_status()
+            
+            # PASO 4: Esperar 5 segundos
+            print("Esperando 5 segundos...")
+            time.sleep(5)
+            
+            # PASO 5: Parsear la tercera página y buscar el enlace directo
+            direct_url = LiteAPKsHandler._extract_direct_link(parsed_page(response))
+        except Exception:
+            if derived:
+                hop_templates.record_failure('liteapks')
+            raise
+        
+        if not direct_url and derived:
+            hop_templates.record_failure('liteapks')
+        return direct_url
+
+    @staticmethod
+    def get_direct_link(url, retries=3, scraper=None, prefetched=None):
+        """
+        Resuelve la cadena inicial -> segunda página -> tercera página
+
+        Primero con atajos; si no llevan al enlace, en la misma llamada se recorre
+        la cadena completa (y los intentos siguientes ya no usan atajos).
+        """
+        scraper = scraper or LiteAPKsHandler.get_scraper()
+        full_chain = False
+        
+        for attempt in range(retries):
+            try:
+                print(f"Intento {attempt + 1}: Procesando LiteAPKs...")
                 
-                # PASO 3: Construir URL de tercera página agregando "/1"
-                if not second_page_url.endswith('/'):
-                    third_page_url = second_page_url + '/1'
-                else:
-                    third_page_url = second_page_url + '1'
+                if not full_chain:
+                    try:
+                        direct_url = LiteAPKsHandler._walk_chain(url, scraper, False, prefetched)
+                        if direct_url:
+                            return direct_url
+                        print("Los atajos no llevaron al enlace")
+                    except Exception as e:
+                        print(f"Atajo fallido: {str(e)}")
+                    print("Recorriendo la cadena completa...")
+                    full_chain = True
                 
-                print(f"Paso 3: Accediendo a tercera página {third_page_url}")
-                response = scraper.get(third_page_url)
+                direct_url = LiteAPKsHandler._walk_chain(url, scraper, True)
+                if direct_url:
+                    return direct_url
+
+            except Exception as e:
+                print(f"Error en intento {attempt + 1}: {str(e)}")
+                if attempt == retries - 1:
+                    raise Exception(f"Error LiteAPKs después de {retries} intentos: {str(e)}")
+                time.sleep(3)
+
+        raise Exception("No se encontró enlace directo después de varios intentos")
+
+    @staticmethod
+    async def _awalk_chain(url, full_chain):
+        """Versión asíncrona de _walk_chain sobre la sesión HTTP compartida"""
+        derived = None
+        if not full_chain:
+            derived = hop_templates.derive('liteapks', url)
+        
+        try:
+            if derived:
+                second_page_url = derived
+            else:
+                response = await fetch(url)
                 response.raise_for_status()
                 
-                # PASO 4: Esperar 5 segundos
-                print("Esperando 5 segundos...")
-                time.sleep(5)
+                download_href = await aextract(response, LiteAPKsHandler._find_download_button)
+                if not download_href:
+                    raise Exception("No se encontró el botón de descarga en la página inicial")
                 
-                # PASO 5: Parsear la tercera página y buscar el enlace directo
-                soup = BeautifulSoup(response.text, 'html.parser')
+                second_page_url = urljoin(url, download_href)
+                hop_templates.learn('liteapks', url, second_page_url)
+            
+            if full_chain:
+                response = await fetch(second_page_url)
+                response.raise_for_status()
+            
+            third_page_url = LiteAPKsHandler._third_page_url(second_page_url)
+            response = await fetch(third_page_url)
+            response.raise_for_status()
+            
+            print("Esperando 5 segundos...")
+            await asyncio.sleep(5)
+            
+            direct_url = await aextract(response, LiteAPKsHandler._extract_direct_link)
+        except Exception:
+            if derived:
+                hop_templates.record_failure('liteapks')
+            raise
+        
+        if not direct_url and derived:
+            hop_templates.record_failure('liteapks')
+        return direct_url
+
+    @staticmethod
+    async def aget_direct_link(url, retries=3):
+        """Versión asíncrona de get_direct_link sobre la sesión HTTP compartida"""
+        full_chain = False
+        
+        for attempt in range(retries):
+            try:
+                print(f"Intento {attempt + 1} (async): Procesando LiteAPKs...")
                 
-                # Método 1: Buscar span con "Download (" y obtener el enlace padre
-                download_spans = soup.find_all('span', class_='align-middle')
-                for span in download_spans:
-                    if span.get_text() and 'Download (' in span.get_text():
-                        # Buscar el elemento padre que sea un enlace
-                        parent = span.parent
-                        while parent and parent.name != 'a':
-                            parent = parent.parent
-                        if parent and parent.name == 'a' and parent.get('href'):
-                            direct_url = parent['href']
-                            if direct_url.startswith('http'):
-                                print(f"Enlace encontrado (Método 1): {direct_url}")
-                                return direct_url
-
-                # Método 2: Buscar enlaces que apunten a archivos APK o dominios de descarga
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    # Buscar enlaces que contengan extensiones de archivos o dominios de descarga comunes
-                    if any(x in href.lower() for x in ['.apk', 'download', 'file']):
-                        if href.startswith('http'):
-                            print(f"Enlace encontrado (Método 2): {href}")
-                            return href
-
-                # Método 3: Buscar en JavaScript patrones de descarga
-                for script in soup.find_all('script'):
-                    if script.string:
-                        # Buscar patrones de URL de descarga en JavaScript
-                        matches = re.findall(r'(https?://[^\s"\']+\.apk[^\s"\']*)', script.string)
-                        if matches:
-                            print(f"Enlace encontrado (Método 3): {matches[0]}")
-                            return matches[0]
-                        
-                        # Buscar otros patrones de descarga
-                        matches = re.findall(r'(https?://[^\s"\']*(?:download|file)[^\s"\']*)', script.string)
-                        if matches:
-                            for match in matches:
-                                if not any(x in match.lower() for x in ['google', 'facebook', 'twitter']):
-                                    print(f"Enlace encontrado (Método 3b): {match}")
-                                    return match
-
-                # Método 4: Buscar cualquier enlace externo que no sea de redes sociales
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    if href.startswith('http') and 'liteapks.com' not in href:
-                        # Evitar enlaces de redes sociales
-                        if not any(x in href.lower() for x in ['facebook', 'twitter', 'instagram', 'youtube', 'telegram']):
-                            print(f"Enlace encontrado (Método 4): {href}")
-                            return href
+                if not full_chain:
+                    try:
+                        direct_url = await LiteAPKsHandler._awalk_chain(url, False)
+                        if direct_url:
+                            return direct_url
+                        print("Los atajos no llevaron al enlace")
+                    except CloudflareChallenge:
+                        raise
+                    except Exception as e:
+                        print(f"Atajo fallido: {str(e)}")
+                    print("Recorriendo la cadena completa...")
+                    full_chain = True
+                
+                direct_url = await LiteAPKsHandler._awalk_chain(url, True)
+                if direct_url:
+                    return direct_url
 
+            except CloudflareChallenge:
+                print("Desafío de Cloudflare, usando cloudscraper...")
+                return await asyncio.to_thread(LiteAPKsHandler.get_direct_link, url, retries)
             except Exception as e:
                 print(f"Error en intento {attempt + 1}: {str(e)}")
                 if attempt == retries - 1:
                     raise Exception(f"Error LiteAPKs después de {retries} intentos: {str(e)}")
-                time.sleep(3)
+                await asyncio.sleep(3)
 
         raise Exception("No se encontró enlace directo después de varios intentos")
 
     @staticmethod
-    def extract_app_info(url):
+    def extract_app_info(url, prefetched=None):
         """Extrae información de la app desde la URL"""
-        scraper = LiteAPKsHandler.get_scraper()
-        
         try:
-            response = scraper.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            if prefetched is not None:
+                response = prefetched
+            else:
+                response = LiteAPKsHandler.get_scraper().get(url)
+            soup = parsed_page(response)
             
             # Extraer título
             title = "APK"
@@ -203,8 +358,12 @@ class LiteAPKsHandler:
     def get_download_info(url):
         """Obtiene tanto el enlace directo como la información de la app"""
         try:
-            direct_link = LiteAPKsHandler.get_direct_link(url)
-            app_info = LiteAPKsHandler.extract_app_info(url)
+            # La página inicial se pide una sola vez: sirve para el enlace y para la información
+            scraper = LiteAPKsHandler.get_scraper()
+            pages = fetch_pages(scraper, [url])
+            
+            direct_link = LiteAPKsHandler.get_direct_link(url, scraper=scraper, prefetched=pages[url])
+            app_info = LiteAPKsHandler.extract_app_info(url, prefetched=pages[url])
             
             return {
                 'direct_link': direct_link,
@@ -1,10 +1,57 @@
 import re
 import time
 import json
+import asyncio
+import threading
 import cloudscraper
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 from base64 import b64decode
+from .async_http import fetch, CloudflareChallenge
+from .circuit_breaker import ResourceUnavailable
+
+# Errores de get_links que el HTML tampoco resuelve (110: quickkey inválido o archivo borrado)
+DEFINITIVE_API_ERRORS = {'110'}
+
+
+class FileUnavailable(ResourceUnavailable):
+    """La API confirma que el archivo no existe: no tiene sentido scrapear ni reintentar"""
+
+
+class APIUnavailable(Exception):
+    """La API no puede servir este archivo (p. ej. protegido con contraseña): probar el HTML"""
+
+
+class TierMetrics:
+    """Latencia y proporción de tráfico resuelto por cada nivel (api, html)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+
+    def record(self, tier, seconds, success):
+        with self._lock:
+            stats = self._tiers.setdefault(tier, {'calls': 0, 'hits': 0, 'seconds': 0.0})
+            stats['calls'] += 1
+            stats['hits'] += int(success)
+            stats['seconds'] += seconds
+
+    def stats(self):
+        with self._lock:
+            total_hits = sum(t['hits'] for t in self._tiers.values()) or 1
+            return {
+                tier: {
+                    'calls': t['calls'],
+                    'share': round(t['hits'] / total_hits, 3),
+                    'avg_ms': round(t['seconds'] / t['calls'] * 1000) if t['calls'] else 0
+                }
+                for tier, t in self._tiers.items()
+            }
+
+
+tier_metrics = TierMetrics()
+_local = threading.local()
+
 
 class MediaFireHandler:
     @staticmethod
@@ -21,6 +68,13 @@ class MediaFireHandler:
             'desktop': True,
         })
 
+    @staticmethod
+    def get_session():
+        """Scraper reutilizado por hilo: conexiones keep-alive con la API entre tareas"""
+        if getattr(_local, 'scraper', None) is None:
+            _local.scraper = MediaFireHandler.get_scraper()
+        return _local.scraper
+
     @staticmethod
     def extract_file_id(url):
         patterns = [
@@ -35,73 +89,177 @@ class MediaFireHandler:
         return None
 
     @staticmethod
-    def get_direct_link(url, retries=3):
-        scraper = MediaFireHandler.get_scraper()
+    def _api_url(file_id):
+        return f"https://www.mediafire.com/api/1.5/file/get_links.php?quickkey={file_id}&link_type=direct_download"
+
+    @staticmethod
+    def _link_from_api(data):
+        """Extrae el enlace directo de la respuesta JSON de get_links"""
+        if data.get('response', {}).get('links', [{}])[0].get('direct_download'):
+            return data['response']['links'][0]['direct_download']
+        return None
+
+    @staticmethod
+    def _api_verdict(status_code, data):
+        """
+        Interpreta la respuesta de get_links
+
+        Returns:
+            str: Enlace directo si la API respondió de forma definitiva
+
+        Raises:
+            FileUnavailable: Error definitivo (archivo inexistente)
+            APIUnavailable: La API no sirve este archivo; hay que ir al HTML
+        """
+        if status_code != 200:
+            raise APIUnavailable(f"HTTP {status_code}")
+        direct_link = MediaFireHandler._link_from_api(data)
+        if direct_link:
+            return direct_link
+
+        response = data.get('response', {})
+        if response.get('result') == 'Error' and str(response.get('error')) in DEFINITIVE_API_ERRORS:
+            raise FileUnavailable(f"Archivo no disponible en MediaFire: {response.get('message', 'quickkey inválido')}")
+        raise APIUnavailable(response.get('message') or "sin enlace directo")
+
+    @staticmethod
+    def _extract_from_page(html):
+        """Busca el enlace directo en el HTML de la página del archivo"""
+        soup = BeautifulSoup(html, 'html.parser')
         
+        # Buscar en el botón de descarga
+        download_btn = soup.find('a', {'id': 'downloadButton'})
+        if download_btn:
+            if download_btn.get('href', '').startswith('http'):
+                return download_btn['href']
+            if download_btn.get('data-scrambled-url'):
+                try:
+                    return b64decode(download_btn['data-scrambled-url']).decode('utf-8')
+                except:
+                    pass
+
+        # Método 3: Buscar en scripts JavaScript
+        for script in soup.find_all('script'):
+            if script.string and 'downloadUrl' in script.string:
+                match = re.search(r'downloadUrl\s*:\s*["\'](https?://[^"\']+)', script.string)
+                if match:
+                    return match.group(1)
+
+        # Método 4: Patrón de descarga directa
+        matches = re.findall(r'(https?://download\d*\.mediafire\.com/\S+)', html)
+        if matches:
+            return matches[0]
+
+        return None
+
+    @staticmethod
+    def _api_tier(scraper, file_id):
+        start = time.time()
+        try:
+            response = scraper.get(MediaFireHandler._api_url(file_id))
+            direct_link = MediaFireHandler._api_verdict(response.status_code, response.json())
+        except Exception:
+            tier_metrics.record('api', time.time() - start, False)
+            raise
+        tier_metrics.record('api', time.time() - start, True)
+        return direct_link
+
+    @staticmethod
+    def _html_tier(scraper, url, retries):
+        """Scraping de la página: solo para lo que la API no puede servir"""
+        start = time.time()
         for attempt in range(retries):
             try:
-                # Método 1: Extraer de la API
-                file_id = MediaFireHandler.extract_file_id(url)
-                if file_id:
-                    api_url = f"https://www.mediafire.com/api/1.5/file/get_links.php?quickkey={file_id}&link_type=direct_download"
-                    response = scraper.get(api_url)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('response', {}).get('links', [{}])[0].get('direct_download'):
-                            return data['response']['links'][0]['direct_download']
-
-                # Método 2: Scraping mejorado con delays
-                time.sleep(1)
                 response = scraper.get(url)
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Buscar en el botón de descarga
-                download_btn = soup.find('a', {'id': 'downloadButton'})
-                if download_btn:
-                    if download_btn.get('href', '').startswith('http'):
-                        return download_btn['href']
-                    if download_btn.get('data-scrambled-url'):
-                        try:
-                            return b64decode(download_btn['data-scrambled-url']).decode('utf-8')
-                        except:
-                            pass
-
-                # Método 3: Buscar en scripts JavaScript
-                for script in soup.find_all('script'):
-                    if script.string and 'downloadUrl' in script.string:
-                        match = re.search(r'downloadUrl\s*:\s*["\'](https?://[^"\']+)', script.string)
-                        if match:
-                            return match.group(1)
-
-                # Método 4: Patrón de descarga directa
-                matches = re.findall(r'(https?://download\d*\.mediafire\.com/\S+)', response.text)
-                if matches:
-                    return matches[0]
-
+                direct_link = MediaFireHandler._extract_from_page(response.text)
+                if direct_link:
+                    tier_metrics.record('html', time.time() - start, True)
+                    return direct_link
             except Exception as e:
                 if attempt == retries - 1:
+                    tier_metrics.record('html', time.time() - start, False)
                     raise Exception(f"Error MediaFire: {str(e)}")
+            if attempt < retries - 1:
                 time.sleep(2)
 
+        tier_metrics.record('html', time.time() - start, False)
         raise Exception("No se encontró enlace directo después de varios intentos")
 
+    @staticmethod
+    def get_direct_link(url, retries=3):
+        scraper = MediaFireHandler.get_session()
+        
+        # Nivel 1: API JSON; si responde de forma definitiva no se descarga la página
+        file_id = MediaFireHandler.extract_file_id(url)
+        if file_id:
+            try:
+                return MediaFireHandler._api_tier(scraper, file_id)
+            except FileUnavailable:
+                raise
+            except Exception as e:
+                print(f"API de MediaFire sin enlace ({e}), probando HTML")
+
+        # Nivel 2: scraping HTML (protegidos con contraseña, enlaces sin quickkey)
+        return MediaFireHandler._html_tier(scraper, url, retries)
+
+    @staticmethod
+    async def aget_direct_link(url, retries=3):
+        """Versión asíncrona de get_direct_link sobre la sesión HTTP compartida"""
+        try:
+            file_id = MediaFireHandler.extract_file_id(url)
+            if file_id:
+                start = time.time()
+                try:
+                    response = await fetch(MediaFireHandler._api_url(file_id))
+                    direct_link = MediaFireHandler._api_verdict(response.status_code, response.json())
+                    tier_metrics.record('api', time.time() - start, True)
+                    return direct_link
+                except (FileUnavailable, CloudflareChallenge):
+                    tier_metrics.record('api', time.time() - start, False)
+                    raise
+                except Exception as e:
+                    tier_metrics.record('api', time.time() - start, False)
+                    print(f"API de MediaFire sin enlace ({e}), probando HTML")
+
+            start = time.time()
+            for attempt in range(retries):
+                try:
+                    response = await fetch(url)
+                    # El parseo de la página va en un hilo para no bloquear el loop
+                    direct_link = await asyncio.to_thread(MediaFireHandler._extract_from_page, response.text)
+                    if direct_link:
+                        tier_metrics.record('html', time.time() - start, True)
+                        return direct_link
+                except CloudflareChallenge:
+                    raise
+                except Exception as e:
+                    if attempt == retries - 1:
+                        tier_metrics.record('html', time.time() - start, False)
+                        raise Exception(f"Error MediaFire: {str(e)}")
+                if attempt < retries - 1:
+                    await asyncio.sleep(2)
+
+            tier_metrics.record('html', time.time() - start, False)
+            raise Exception("No se encontró enlace directo después de varios intentos")
+
+        except CloudflareChallenge:
+            return await asyncio.to_thread(MediaFireHandler.get_direct_link, url, retries)
+
     @staticmethod
     def process_folder(url, max_files=15):
+        from .mediafire_folder import folder_key_from_url, list_files, file_page_url
+        
         scraper = MediaFireHandler.get_scraper()
         try:
-            # Extraer folder_key
-            folder_key = url.split('/folder/')[1].split('/')[0]
-            
-            # Intentar con la API primero
-            api_url = f"https://www.mediafire.com/api/1.5/folder/get_content.php?folder_key={folder_key}&content_type=files&response_format=json"
-            response = scraper.get(api_url)
-            
+            # Intentar con la API primero (paginada por chunks)
             file_urls = []
-            if response.status_code == 200:
-                data = response.json()
-                files = data.get('response', {}).get('folder_content', {}).get('files', [])
-                if files:
-                    file_urls = [f"https://www.mediafire.com/file/{file['quickkey']}" for file in files]
+            try:
+                for files in list_files(scraper, folder_key_from_url(url)):
+                    file_urls.extend(file_page_url(file['quickkey']) for file in files)
+                    if len(file_urls) >= max_files:
+                        break
+            except Exception:
+                file_urls = []
 
             # Si la API falla o no devuelve resultados, hacer scraping HTML
             if not file_urls:
@@ -123,4 +281,4 @@ class MediaFireHandler:
             return unique_files[:max_files]
 
         except Exception as e:
-            raise Exception(f"Error al procesar carpeta: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error al procesar carpeta: {str(e)}")
@@ -0,0 +1,218 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Any, Tuple, Optional
+
+from .mediafire import MediaFireHandler
+
+logger = logging.getLogger(__name__)
+
+# Archivos por página de folder/get_content (la API acepta hasta 1000)
+MEDIAFIRE_FOLDER_CHUNK = int(os.getenv("MEDIAFIRE_FOLDER_CHUNK", "100"))
+# Quickkeys por llamada a file/get_links
+MEDIAFIRE_LINKS_BATCH = int(os.getenv("MEDIAFIRE_LINKS_BATCH", "50"))
+# Resoluciones individuales simultáneas para los archivos que la API no resolvió
+MEDIAFIRE_FOLDER_WORKERS = int(os.getenv("MEDIAFIRE_FOLDER_WORKERS", "6"))
+MEDIAFIRE_FOLDER_MAX_FILES = int(os.getenv("MEDIAFIRE_FOLDER_MAX_FILES", "200"))
+# Presupuestos del recorrido recursivo de subcarpetas
+MEDIAFIRE_FOLDER_MAX_DEPTH = int(os.getenv("MEDIAFIRE_FOLDER_MAX_DEPTH", "3"))
+MEDIAFIRE_FOLDER_MAX_FOLDERS = int(os.getenv("MEDIAFIRE_FOLDER_MAX_FOLDERS", "50"))
+# Carpetas listadas en paralelo durante el recorrido
+MEDIAFIRE_FOLDER_WALKERS = int(os.getenv("MEDIAFIRE_FOLDER_WALKERS", "4"))
+# Listados de carpetas reutilizados entre tareas (segundos)
+MEDIAFIRE_FOLDER_CACHE_TTL = float(os.getenv("MEDIAFIRE_FOLDER_CACHE_TTL", "600"))
+
+API_BASE = "https://www.mediafire.com/api/1.5"
+
+
+def folder_key_from_url(url: str) -> str:
+    return url.split('/folder/')[1].split('/')[0]
+
+
+def file_page_url(quickkey: str) -> str:
+    return f"https://www.mediafire.com/file/{quickkey}"
+
+
+def _list_content(scraper, folder_key: str, content_type: str,
+                  chunk_size: int = MEDIAFIRE_FOLDER_CHUNK) -> Iterator[List[Dict[str, Any]]]:
+    """Recorre folder/get_content página a página ('files' o 'folders')"""
+    chunk = 1
+    while True:
+        response = scraper.get(
+            f"{API_BASE}/folder/get_content.php?folder_key={folder_key}&content_type={content_type}"
+            f"&chunk={chunk}&chunk_size={chunk_size}&response_format=json"
+        )
+        response.raise_for_status()
+        content = response.json().get('response', {}).get('folder_content', {})
+
+        items = content.get(content_type, [])
+        if items:
+            yield items
+        if content.get('more_chunks') != 'yes' or not items:
+            return
+        chunk += 1
+
+
+def list_files(scraper, folder_key: str, chunk_size: int = MEDIAFIRE_FOLDER_CHUNK) -> Iterator[List[Dict[str, Any]]]:
+    """Recorre folder/get_content página a página y entrega cada página de archivos"""
+    return _list_content(scraper, folder_key, 'files', chunk_size)
+
+
+class FolderListingCache:
+    """Listados de carpeta (archivos y subcarpetas) en memoria, con TTL"""
+
+    def __init__(self, ttl: float = MEDIAFIRE_FOLDER_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, folder_key: str) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        with self._lock:
+            entry = self._entries.get(folder_key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[folder_key]
+                return None
+            return entry[1], entry[2]
+
+    def put(self, folder_key: str, files: List[Dict[str, Any]], folders: List[Dict[str, Any]]):
+        with self._lock:
+            self._entries[folder_key] = (time.time(), files, folders)
+
+
+folder_cache = FolderListingCache()
+
+
+def list_folder(scraper, folder_key: str, max_files: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Archivos (hasta max_files) y subcarpetas de una carpeta, usando la caché si está vigente"""
+    cached = folder_cache.get(folder_key)
+    if cached is not None:
+        return cached[0][:max_files], cached[1]
+
+    files = []
+    for page in list_files(scraper, folder_key):
+        files.extend(page)
+        if len(files) >= max_files:
+            break
+    folders = [folder for page in _list_content(scraper, folder_key, 'folders') for folder in page]
+
+    # Un listado truncado no se guarda: otra tarea con más presupuesto lo necesitaría completo
+    if len(files) < max_files:
+        folder_cache.put(folder_key, files, folders)
+    return files[:max_files], folders
+
+
+def walk_folder(scraper, folder_key: str, max_depth: int = MEDIAFIRE_FOLDER_MAX_DEPTH,
+                max_files: int = MEDIAFIRE_FOLDER_MAX_FILES, max_folders: int = MEDIAFIRE_FOLDER_MAX_FOLDERS,
+                walkers: int = MEDIAFIRE_FOLDER_WALKERS) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Recorre una carpeta y sus subcarpetas listando varias a la vez
+
+    Entrega (ruta, archivos) por carpeta a medida que se listan, respetando los
+    presupuestos de profundidad, cantidad de carpetas y cantidad de archivos.
+    """
+    remaining_files = max_files
+    visited = {folder_key}
+
+    pool = ThreadPoolExecutor(max_workers=walkers, thread_name_prefix='mediafire-walk')
+    try:
+        pending = {pool.submit(list_folder, scraper, folder_key, remaining_files): ('', 0)}
+        while pending and remaining_files > 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, depth = pending.pop(future)
+                try:
+                    files, folders = future.result()
+                except Exception as e:
+                    if not path:
+                        raise
+                    logger.warning(f"No se pudo listar la subcarpeta {path}: {e}")
+                    continue
+
+                files = files[:remaining_files]
+                remaining_files -= len(files)
+                if files:
+                    yield path, files
+
+                if depth >= max_depth:
+                    continue
+                for folder in folders:
+                    key = folder.get('folderkey')
+                    if not key or key in visited or len(visited) >= max_folders:
+                        continue
+                    visited.add(key)
+                    sub_path = f"{path}{folder.get('name') or key}/"
+                    pending[pool.submit(list_folder, scraper, key, remaining_files)] = (sub_path, depth + 1)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def bulk_links(scraper, quickkeys: List[str]) -> Dict[str, str]:
+    """Enlaces directos de varios archivos en una sola llamada a file/get_links"""
+    if not quickkeys:
+        return {}
+    try:
+        response = scraper.get(
+            f"{API_BASE}/file/get_links.php?quickkey={','.join(quickkeys)}"
+            f"&link_type=direct_download&response_format=json"
+        )
+        if response.status_code != 200:
+            return {}
+        links = response.json().get('response', {}).get('links', [])
+    except Exception as e:
+        logger.warning(f"get_links en lote falló ({len(quickkeys)} archivos): {e}")
+        return {}
+    return {link['quickkey']: link['direct_download'] for link in links
+            if link.get('quickkey') and link.get('direct_download')}
+
+
+def resolve_folder(url: str, max_files: int = MEDIAFIRE_FOLDER_MAX_FILES,
+                   workers: int = MEDIAFIRE_FOLDER_WORKERS) -> Iterator[Dict[str, Any]]:
+    """
+    Resuelve los archivos de una carpeta de MediaFire y los entrega a medida que llegan
+
+    Las subcarpetas se recorren en paralelo (walk_folder); cada carpeta listada se
+    resuelve con llamadas a get_links en lote y los archivos que la API no
+    devuelve (protegidos, enlaces raros) se resuelven uno por uno en un pool acotado.
+
+    Yields:
+        dict: {'name', 'url', 'link'} o {'name', 'url', 'error'}; el nombre
+        incluye la ruta de la subcarpeta
+    """
+    scraper = MediaFireHandler.get_scraper()
+    folder_key = folder_key_from_url(url)
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mediafire-folder')
+    pending = {}
+    try:
+        for path, files in walk_folder(scraper, folder_key, max_files=max_files):
+            for i in range(0, len(files), MEDIAFIRE_LINKS_BATCH):
+                batch = files[i:i + MEDIAFIRE_LINKS_BATCH]
+                links = bulk_links(scraper, [f['quickkey'] for f in batch])
+                for file in batch:
+                    page_url = file_page_url(file['quickkey'])
+                    name = f"{path}{file.get('filename') or file['quickkey']}"
+                    if file['quickkey'] in links:
+                        yield {'name': name, 'url': page_url, 'link': links[file['quickkey']]}
+                    else:
+                        pending[pool.submit(MediaFireHandler.get_direct_link, page_url)] = (name, page_url)
+
+                # Entregar los individuales que ya terminaron sin esperar al resto del listado
+                yield from _collect(pending, [f for f in pending if f.done()])
+
+        yield from _collect(pending, as_completed(list(pending)))
+    finally:
+        # Si el consumidor abandona (cancelación), no seguir resolviendo
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _collect(pending, futures) -> Iterator[Dict[str, Any]]:
+    for future in futures:
+        name, page_url = pending.pop(future)
+        try:
+            yield {'name': name, 'url': page_url, 'link': future.result()}
+        except Exception as e:
+            yield {'name': name, 'url': page_url, 'error': str(e)}
@@ -9,6 +9,8 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 from urllib.parse import urlparse
+from .browser_registry import browser_registry
+from .dom_snapshot import take_snapshot, first_visible
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,9 @@ class MegaUpHandler:
     @staticmethod
     def _setup_driver(headless=False):
         """Configura el driver de Chrome"""
+        # No lanzar otro Chrome si los navegadores ya superan el presupuesto de memoria
+        browser_registry.wait_for_capacity()
+        
         chrome_options = Options()
         
         if headless:
@@ -42,7 +47,7 @@ class MegaUpHandler:
         driver = webdriver.Chrome(service=service, options=chrome_options)
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         driver.set_page_load_timeout(30)
-        return driver
+        return browser_registry.register(driver, label='megaup')
 
     @staticmethod
     def _solve_cloudflare_captcha(driver, max_wait=30):
@@ -62,31 +67,27 @@ class MegaUpHandler:
                 '[data-sitekey] input[type="checkbox"]'
             ]
             
+            # Un solo snapshot con todos los selectores y su visibilidad
+            snapshot = take_snapshot(driver, selectors=selectors, include_elements=True)
+            
             checkbox = None
-            for selector in selectors:
-                try:
-                    checkboxes = driver.find_elements(By.CSS_SELECTOR, selector)
-                    if checkboxes:
-                        # Filtrar checkboxes visibles
-                        visible_checkboxes = [cb for cb in checkboxes if cb.is_displayed()]
-                        if visible_checkboxes:
-                            checkbox = visible_checkboxes[0]
-                            logger.info(f"Checkbox encontrado con selector: {selector}")
-                            break
-                except Exception as e:
-                    logger.debug(f"Selector {selector} no funcionó: {str(e)}")
-                    continue
+            selector, checkbox_info = first_visible(snapshot, selectors)
+            if checkbox_info:
+                checkbox = checkbox_info['element']
+                logger.info(f"Checkbox encontrado con selector: {selector}")
             
             # Si no encontramos checkbox, buscar por iframe (algunos captchas están en iframe)
             if not checkbox:
                 try:
                     logger.info("Buscando checkbox en iframe...")
-                    iframes = driver.find_elements(By.TAG_NAME, "iframe")
+                    # Solo entrar en los iframes visibles del snapshot
+                    iframes = [info['element'] for info in snapshot['iframes'] if info['visible']]
                     for iframe in iframes:
                         try:
                             driver.switch_to.frame(iframe)
-                            checkbox = driver.find_element(By.CSS_SELECTOR, 'input[type="checkbox"]')
-                            if checkbox.is_displayed():
+                            candidate = driver.find_element(By.CSS_SELECTOR, 'input[type="checkbox"]')
+                            if candidate.is_displayed():
+                                checkbox = candidate
                                 logger.info("Checkbox encontrado en iframe")
                                 break
                             driver.switch_to.default_content()
@@ -128,9 +129,10 @@ class MegaUpHandler:
                 try:
                     driver.switch_to.default_content()
                     # Verificar si ya no hay elementos de captcha
-                    captcha_elements = driver.find_elements(By.CSS_SELECTOR, 
-                                                          'input[type="checkbox"], .cf-turnstile, #cf-chl-widget-container')
-                    if not captcha_elements or not any(elem.is_displayed() for elem in captcha_elements):
+                    captcha_selector = 'input[type="checkbox"], .cf-turnstile, #cf-chl-widget-container'
+                    after = take_snapshot(driver, selectors=[captcha_selector])
+                    captcha_elements = after['matches'].get(captcha_selector, [])
+                    if not any(info['visible'] for info in captcha_elements):
                         logger.info("✔ Captcha resuelto exitosamente")
                         return True
                 except:
@@ -196,8 +198,13 @@ class MegaUpHandler:
             return None
 
     @staticmethod
-    def get_direct_link(url, retries=2):
-        """Obtiene el enlace directo de descarga de MegaUp"""
+    def get_direct_link(url, retries=3):
+        """
+        Obtiene el enlace directo de descarga de MegaUp en un solo intento
+
+        retries se acepta por la interfaz común de los handlers; los reintentos
+        (con backoff y un navegador nuevo) los programa la cola de tareas.
+        """
         driver = None
         try:
             logger.info(f"Procesando enlace MegaUp: {url}")
@@ -232,15 +239,11 @@ class MegaUpHandler:
             
         except Exception as e:
             logger.error(f"Error en MegaUpHandler: {str(e)}")
-            if retries > 0:
-                logger.info(f"Reintentando... ({retries} intentos restantes)")
-                time.sleep(3)
-                return MegaUpHandler.get_direct_link(url, retries-1)
-            raise Exception(f"No se pudo obtener el enlace después de {retries+1} intentos")
+            raise Exception(f"No se pudo obtener el enlace de MegaUp: {str(e)}") from e
             
         finally:
             if driver:
-                driver.quit()
+                browser_registry.release(driver)
 
     @staticmethod
     def test_handler():
@@ -288,7 +291,7 @@ class MegaUpHandler:
             if driver:
                 print("Cerrando navegador en 5 segundos...")
                 time.sleep(5)
-                driver.quit()
+                browser_registry.release(driver)
 
 if __name__ == "__main__":
     # Configurar logging
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_pages(scraper, urls, session_factory=None, **kwargs):
+    """
+    Descarga cada URL distinta una sola vez
+
+    Una sesión de cloudscraper/requests no es segura entre hilos (cookies y
+    estado del desafío de Cloudflare), así que la primera URL se pide en el hilo
+    actual con el scraper del handler y las demás en paralelo, cada una con su
+    propia sesión de session_factory. Sin session_factory se piden en secuencia.
+
+    Args:
+        scraper: Sesión de cloudscraper/requests del handler
+        urls (iterable): URLs a descargar (las repetidas se piden una vez)
+        session_factory (callable): Crea una sesión nueva (p. ej. get_scraper del handler)
+        **kwargs: Argumentos para scraper.get
+
+    Returns:
+        dict: {url: response} con None para las que fallaron, de modo que el
+            handler las vuelva a pedir dentro de su propio bucle de reintentos
+    """
+    unique = list(dict.fromkeys(urls))
+
+    def fetch(session, url):
+        try:
+            response = session.get(url, **kwargs)
+            response.raise_for_status()
+            return response
+        except Exception as e:
+            logger.warning(f"Error descargando {url}: {e}")
+            return None
+
+    if len(unique) == 1 or session_factory is None:
+        return {url: fetch(scraper, url) for url in unique}
+
+    first, rest = unique[0], unique[1:]
+    with ThreadPoolExecutor(max_workers=len(rest)) as pool:
+        others = pool.map(lambda url: fetch(session_factory(), url), rest)
+        pages = {first: fetch(scraper, first)}
+        pages.update(zip(rest, others))
+    return pages
+
+
+def parsed_page(response):
+    """
+    BeautifulSoup de una respuesta, parseado una sola vez
+
+    El enlace y la información de la app se extraen del mismo documento cuando
+    ambos salen de la misma página; los extractores solo leen el árbol.
+    """
+    soup = getattr(response, '_parsed_soup', None)
+    if soup is None:
+        soup = BeautifulSoup(response.text, 'html.parser')
+        response._parsed_soup = soup
+    return soup
+
+
+async def aextract(response, extract, *args):
+    """
+    parsed_page + extractor fuera del loop de asyncio
+
+    Parsear una página grande con html.parser bloquea decenas de milisegundos;
+    dentro de una corrutina eso frena todas las descargas async a la vez.
+    """
+    return await asyncio.to_thread(lambda: extract(parsed_page(response), *args))
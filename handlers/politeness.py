@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict, Optional, Any
+
+from .retry import retry_after, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+# Resoluciones simultáneas por sitio y separación mínima entre arranques (segundos)
+POLITENESS_MAX_CONCURRENCY = int(os.getenv("POLITENESS_MAX_CONCURRENCY", "2"))
+POLITENESS_MIN_INTERVAL = float(os.getenv("POLITENESS_MIN_INTERVAL", "1.0"))
+# Límites por sitio ("sitio=concurrencia:intervalo,..."); los de navegador pasan el captcha de Cloudflare
+DEFAULT_SITE_LIMITS = {
+    'megaup': (2, 3.0),
+    'a2zapk': (2, 3.0),
+}
+POLITENESS_SITE_LIMITS = {
+    **DEFAULT_SITE_LIMITS,
+    **{site.strip(): (int(limit.split(':')[0]), float(limit.split(':')[1]))
+       for site, limit in (item.split('=', 1) for item in os.getenv("POLITENESS_SITE_LIMITS", "").split(',')
+                           if '=' in item and ':' in item)}
+}
+# Pausa del sitio tras un 429 sin Retry-After, y tope para Retry-After desmesurados
+POLITENESS_429_COOLDOWN = float(os.getenv("POLITENESS_429_COOLDOWN", "30"))
+POLITENESS_MAX_PAUSE = float(os.getenv("POLITENESS_MAX_PAUSE", "600"))
+# Espera sugerida cuando el sitio está lleno (se libera un hueco al terminar otra resolución)
+POLITENESS_POLL_INTERVAL = float(os.getenv("POLITENESS_POLL_INTERVAL", "0.5"))
+
+
+class PolitenessScheduler:
+    """
+    Huecos por sitio: concurrencia máxima, separación mínima y pausas por 429
+
+    try_acquire() no bloquea: devuelve 0 si la resolución puede empezar (y ocupa
+    un hueco) o los segundos que conviene esperar, para que la cola deje la tarea
+    en espera sin ocupar un worker mientras los demás sitios siguen avanzando.
+    """
+
+    def __init__(self, max_concurrency: int = POLITENESS_MAX_CONCURRENCY,
+                 min_interval: float = POLITENESS_MIN_INTERVAL, site_limits: Dict[str, Any] = None):
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.site_limits = dict(POLITENESS_SITE_LIMITS if site_limits is None else site_limits)
+        self._sites: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, site: str) -> float:
+        """0 si se ocupó un hueco del sitio; si no, segundos hasta volver a intentarlo"""
+        now = time.time()
+        with self._lock:
+            state = self._site(site)
+            concurrency, interval = self._limits(site)
+
+            if now < state['paused_until']:
+                wait = state['paused_until'] - now
+            elif state['active'] >= concurrency:
+                wait = POLITENESS_POLL_INTERVAL
+            elif now < state['last_start'] + interval:
+                wait = state['last_start'] + interval - now
+            else:
+                state['active'] += 1
+                state['last_start'] = now
+                state['admitted'] += 1
+                return 0.0
+
+            state['deferred'] += 1
+            return wait
+
+    def release(self, site: str):
+        with self._lock:
+            state = self._site(site)
+            state['active'] = max(0, state['active'] - 1)
+
+    def pause(self, site: str, seconds: float):
+        """Detiene las resoluciones nuevas del sitio durante seconds (Retry-After)"""
+        seconds = min(seconds, POLITENESS_MAX_PAUSE)
+        with self._lock:
+            state = self._site(site)
+            state['paused_until'] = max(state['paused_until'], time.time() + seconds)
+            state['pauses'] += 1
+        logger.warning(f"Sitio {site} en pausa {seconds:.0f}s por límite de peticiones")
+
+    def note_failure(self, site: str, error: BaseException) -> Optional[float]:
+        """Si el error es un 429 o trae Retry-After, pausa el sitio; devuelve la pausa aplicada"""
+        seconds = retry_after(error)
+        if seconds is None and is_rate_limited(error):
+            seconds = POLITENESS_429_COOLDOWN
+        if seconds:
+            self.pause(site, seconds)
+        return seconds
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return {
+                site: {
+                    'active': state['active'],
+                    'admitted': state['admitted'],
+                    'deferred': state['deferred'],
+                    'pauses': state['pauses'],
+                    'paused_for': max(0, round(state['paused_until'] - now)),
+                }
+                for site, state in self._sites.items()
+            }
+
+    def _limits(self, site: str):
+        return self.site_limits.get(site, (self.max_concurrency, self.min_interval))
+
+    def _site(self, site: str) -> Dict[str, Any]:
+        """Con lock: estado del sitio"""
+        return self._sites.setdefault(site, {
+            'active': 0, 'last_start': 0.0, 'paused_until': 0.0,
+            'admitted': 0, 'deferred': 0, 'pauses': 0
+        })
+
+
+# Instancia global usada por la cola de tareas
+politeness = PolitenessScheduler()
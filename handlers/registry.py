@@ -0,0 +1,190 @@
+import re
+import sys
+import time
+import logging
+import importlib
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Any, List
+from urllib.parse import urlparse, urlunparse
+
+from .canonical import resource_key
+
+logger = logging.getLogger(__name__)
+
+# Clases de costo: 'http' se resuelve con peticiones, 'browser' necesita Chrome
+COST_HTTP = 'http'
+COST_BROWSER = 'browser'
+
+# Handlers ya importados ("modulo:Clase" -> clase) y tiempo de importación de cada módulo
+_loaded: Dict[str, Any] = {}
+_import_times: Dict[str, Dict[str, Any]] = {}
+_load_lock = threading.Lock()
+
+
+def load_handler(path: str):
+    """
+    Importa un handler registrado como "modulo:Clase" la primera vez que se usa
+
+    Selenium, cloudscraper y BeautifulSoup solo se cargan cuando llega el
+    primer enlace de un sitio que los necesita.
+    """
+    handler = _loaded.get(path)
+    if handler is not None:
+        return handler
+
+    with _load_lock:
+        if path not in _loaded:
+            module_name, class_name = path.split(':')
+            modules_before = len(sys.modules)
+            start = time.perf_counter()
+            module = importlib.import_module(module_name)
+            elapsed = time.perf_counter() - start
+            _loaded[path] = getattr(module, class_name)
+            if module_name not in _import_times:
+                _import_times[module_name] = {
+                    'seconds': round(elapsed, 3),
+                    'modules': len(sys.modules) - modules_before
+                }
+                logger.info(f"Handler {class_name} cargado en {elapsed * 1000:.0f} ms "
+                            f"({len(sys.modules) - modules_before} módulos nuevos)")
+        return _loaded[path]
+
+
+def import_report() -> List[Dict[str, Any]]:
+    """Módulos de handlers importados, del más lento al más rápido"""
+    with _load_lock:
+        report = [{'module': name, **times} for name, times in _import_times.items()]
+    return sorted(report, key=lambda item: item['seconds'], reverse=True)
+
+
+@dataclass(frozen=True)
+class SiteSpec:
+    key: str
+    name: str
+    domains: Tuple[str, ...]
+    # "modulo:Clase", importado en el primer uso
+    handler_path: str
+    method: str
+    cost: str
+    example: str
+    notes: str
+    # Fragmento que debe aparecer en la ruta (p. ej. '/film' en FilmAffinity)
+    path_contains: Optional[str] = None
+
+    @property
+    def handler(self):
+        return load_handler(self.handler_path)
+
+
+@dataclass(frozen=True)
+class LinkMatch:
+    spec: SiteSpec
+    url: str
+    host: str
+    # Clave estable del recurso (deduplicación de tareas y cachés)
+    key: str
+
+    @property
+    def handler(self):
+        return self.spec.handler
+
+    @property
+    def cost(self) -> str:
+        return self.spec.cost
+
+    def resolver(self):
+        return getattr(self.handler, self.spec.method)
+
+
+SITES = (
+    SiteSpec('mediafire', 'MediaFire', ('mediafire.com',), 'handlers.mediafire:MediaFireHandler', 'get_direct_link', COST_HTTP,
+             'https://www.mediafire.com/file/ejemplo/file.apk',
+             'Soporta archivos individuales y carpetas (con /folder/)'),
+    SiteSpec('megaup', 'MegaUp', ('megaup.net',), 'handlers.megaup:MegaUpHandler', 'get_direct_link', COST_BROWSER,
+             'https://megaup.net/ejemplo',
+             'Autodetecta captcha, espera 5 segundos'),
+    SiteSpec('a2zapk', 'A2ZAPK', ('a2zapk.io',), 'handlers.a2zapk:A2ZAPKHandler', 'get_direct_link', COST_BROWSER,
+             'https://a2zapk.io/ejemplo',
+             'Usa técnica de distracción para evitar bloqueos'),
+    SiteSpec('apk4free', 'APK4Free', ('apk4free.net',), 'handlers.apk4free:APK4FreeHandler', 'get_direct_link', COST_HTTP,
+             'https://apk4free.net/ejemplo',
+             'Descarga directa de APKs modificados'),
+    SiteSpec('apkdone', 'APKDone', ('apkdone.com',), 'handlers.apkdone:APKDoneHandler', 'get_direct_link', COST_HTTP,
+             'https://apkdone.com/spotify-premium',
+             'Descarga directa de APKs premium/modificados'),
+    SiteSpec('uptodown', 'Uptodown', ('uptodown.com',), 'handlers.uptodown:UptodownHandler', 'get_direct_link', COST_HTTP,
+             'https://google-drive.uptodown.com/android',
+             'Agrega /download automáticamente'),
+    SiteSpec('liteapks', 'LiteAPKs', ('liteapks.com',), 'handlers.liteapks:LiteAPKsHandler', 'get_direct_link', COST_HTTP,
+             'https://liteapks.com/spotify-2.html',
+             'Recorre las páginas de descarga hasta el enlace final'),
+    SiteSpec('filmaffinity', 'FilmAffinity', ('filmaffinity.com',), 'handlers.FilmAffinity:FilmAffinityHandler', 'process_url', COST_BROWSER,
+             'https://www.filmaffinity.com/es/film123456.html',
+             'Devuelve hashtags de reparto y géneros', path_contains='/film'),
+)
+
+
+class HandlerRegistry:
+    """Búsqueda de handler por dominio registrable: un urlparse y O(etiquetas) lookups en un dict"""
+
+    def __init__(self, sites=SITES):
+        self.sites = tuple(sites)
+        self._by_domain: Dict[str, SiteSpec] = {}
+        self._by_key: Dict[str, SiteSpec] = {}
+        for spec in self.sites:
+            self._by_key[spec.key] = spec
+            for domain in spec.domains:
+                self._by_domain[domain] = spec
+        self.resolve = lru_cache(maxsize=2048)(self._resolve)
+
+    def get(self, key: str) -> Optional[SiteSpec]:
+        return self._by_key.get(key)
+
+    def _resolve(self, url: str) -> Optional[LinkMatch]:
+        """Devuelve handler, clase de costo, URL canónica y clave del recurso, o None si el sitio no está soportado"""
+        try:
+            parsed = urlparse(re.sub(r'%22|"', '', url.strip()))
+        except ValueError:
+            return None
+
+        host = (parsed.hostname or '').lower()
+        labels = host.split('.')
+
+        # Sufijos del host, del más largo al más corto: a.b.uptodown.com -> b.uptodown.com -> uptodown.com
+        spec = None
+        for i in range(len(labels) - 1):
+            spec = self._by_domain.get('.'.join(labels[i:]))
+            if spec:
+                break
+        if spec is None:
+            return None
+
+        if spec.path_contains and spec.path_contains not in parsed.path.lower():
+            return None
+
+        # El handler recibe la query original (firmas, tamaños); la clave usa la limpia
+        canonical = urlunparse((parsed.scheme.lower() or 'https', parsed.netloc.lower(),
+                                parsed.path, parsed.params, parsed.query, ''))
+        return LinkMatch(spec=spec, url=canonical, host=host, key=resource_key(spec.key, canonical))
+
+    def supported_sites(self) -> Dict[str, Dict[str, str]]:
+        """Diccionario {nombre: {'ejemplo', 'notas'}} para los mensajes de /soporte"""
+        return {spec.name: {'ejemplo': spec.example, 'notas': spec.notes} for spec in self.sites}
+
+    def keys(self) -> List[str]:
+        return list(self._by_key)
+
+    def preload(self) -> List[Dict[str, Any]]:
+        """Importa todos los handlers por adelantado (modo --preload) y devuelve el reporte"""
+        for spec in self.sites:
+            try:
+                load_handler(spec.handler_path)
+            except Exception as e:
+                logger.warning(f"No se pudo precargar {spec.name}: {e}")
+        return import_report()
+
+
+# Instancia global del registro
+handler_registry = HandlerRegistry()
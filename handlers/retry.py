@@ -0,0 +1,193 @@
+import os
+import re
+import random
+import threading
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Optional, Any
+
+from .circuit_breaker import SiteUnavailableError, RecentFailureError, ResourceUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Intentos dentro del handler cuando resuelve el dispatcher: los reintentos los programa la cola
+HANDLER_ATTEMPTS = int(os.getenv("HANDLER_ATTEMPTS", "1"))
+# Intentos totales por tarea de descarga (el primero incluido)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+# Backoff exponencial con jitter completo: espera aleatoria en [0, min(max, base * 2^n)]
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+# Presupuesto total desde que se creó la tarea; no se programa un reintento que lo exceda
+RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", "180"))
+
+# Errores de red y de tiempo de espera (por nombre: requests, aiohttp y selenium se cargan bajo demanda)
+TRANSIENT_ERROR_NAMES = {
+    'Timeout', 'ReadTimeout', 'ConnectTimeout', 'ConnectionError', 'ChunkedEncodingError',
+    'ProxyError', 'SSLError', 'TimeoutException', 'TimeoutError', 'ServerDisconnectedError',
+    'ClientConnectionError', 'ClientConnectorError', 'ClientPayloadError', 'CloudflareChallenge',
+    'IncompleteRead', 'RemoteDisconnected', 'WebDriverException', 'StaleElementReferenceException',
+    'WorkerUnavailableError',
+}
+PERMANENT_ERRORS = (SiteUnavailableError, RecentFailureError, ResourceUnavailable)
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+
+# Código HTTP dentro del mensaje ("HTTP 503 para ...", "503 Server Error: ...")
+_STATUS_IN_MESSAGE = re.compile(r'\bHTTP\s+([45]\d\d)\b|\b([45]\d\d) (?:Server|Client) Error\b')
+
+# Intento de la cola en curso (0 = el primero); lo fija la cola y lo leen los handlers
+_queue_attempt = contextvars.ContextVar('queue_attempt', default=0)
+
+
+class LinkNotReady(Exception):
+    """
+    La página cargó sin el enlace en el primer intento
+
+    Algunos sitios arman el botón de descarga con retraso: en vez de esperar
+    dentro del handler, la cola vuelve a pedir la página pasados al menos wait
+    segundos.
+    """
+    retryable = True
+
+    def __init__(self, message: str, wait: float = 5):
+        super().__init__(message)
+        self.wait = wait
+
+
+@contextmanager
+def queue_attempt(attempt: int):
+    """Hace visible a los handlers el intento de la cola (task.attempts) durante la resolución"""
+    token = _queue_attempt.set(attempt)
+    try:
+        yield
+    finally:
+        _queue_attempt.reset(token)
+
+
+def current_attempt() -> int:
+    return _queue_attempt.get()
+
+
+def link_not_found(retries: int, wait: float = 5) -> Exception:
+    """
+    Error para una página que no trajo el enlace
+
+    Si el handler hizo una sola pasada (HANDLER_ATTEMPTS=1) y era el primer
+    intento de la cola, el error es reintentable: la cola hace la segunda pasada
+    que antes hacía el handler tras esperar más tiempo.
+    """
+    if retries <= 1 and current_attempt() == 0:
+        return LinkNotReady("No se encontró el enlace todavía, se volverá a intentar", wait)
+    return Exception("No se encontró enlace directo después de varios intentos")
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'status', None)
+    if isinstance(status, int):
+        return status
+    found = _STATUS_IN_MESSAGE.search(str(error))
+    return int(found.group(1) or found.group(2)) if found else None
+
+
+def _chain(error: BaseException) -> Iterator[BaseException]:
+    """El error y sus causas (__cause__ / __context__), sin ciclos"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Segundos pedidos por el sitio en Retry-After (segundos o fecha HTTP), si alguna respuesta lo trae"""
+    for err in _chain(error):
+        headers = getattr(getattr(err, 'response', None), 'headers', None) or getattr(err, 'headers', None)
+        value = headers.get('Retry-After') if headers else None
+        if not value:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True si el sitio respondió 429 en algún punto de la cadena de errores"""
+    return any(_status_code(err) == 429 for err in _chain(error))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True si el error es transitorio (timeouts, red, 5xx, 429)
+
+    Los handlers envuelven sus errores en Exception genéricas, así que se
+    recorre la cadena de causas; lo que no se reconoce como transitorio (404,
+    enlace no encontrado en la página) se trata como permanente.
+    """
+    for err in _chain(error):
+        # Veredicto explícito (p. ej. calculado en el worker de navegador, donde está la causa original)
+        if isinstance(getattr(err, 'retryable', None), bool):
+            return err.retryable
+        if isinstance(err, PERMANENT_ERRORS):
+            return False
+        if isinstance(err, (TimeoutError, ConnectionError)) or type(err).__name__ in TRANSIENT_ERROR_NAMES:
+            return True
+        status = _status_code(err)
+        if status is not None:
+            return status in RETRYABLE_STATUS
+    return False
+
+
+class RetryPolicy:
+    """Decide si una descarga fallida se reintenta y tras cuánto tiempo, y lleva la cuenta"""
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY, deadline: float = RETRY_DEADLINE):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._stats = {'scheduled': 0, 'permanent': 0, 'exhausted': 0, 'deadline': 0}
+
+    def delay(self, attempt: int) -> float:
+        """Espera antes del reintento número attempt (1 = primer reintento)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def next_delay(self, error: BaseException, attempts: int, elapsed: float) -> Optional[float]:
+        """Segundos hasta el próximo intento, o None si hay que dar la tarea por fallida"""
+        if not is_retryable(error):
+            reason = 'permanent'
+        elif attempts >= self.max_attempts:
+            reason = 'exhausted'
+        else:
+            # Si el sitio (Retry-After) o el handler (LinkNotReady) pidieron una espera, no volver antes
+            delay = max(self.delay(attempts), retry_after(error) or 0, getattr(error, 'wait', 0))
+            if elapsed + delay < self.deadline:
+                self._count('scheduled')
+                return delay
+            reason = 'deadline'
+
+        self._count(reason)
+        logger.debug(f"Sin reintento ({reason}) tras {attempts} intentos: {error}")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+
+# Instancia global usada por la cola de tareas
+retry_policy = RetryPolicy()
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import random
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple, Callable, Any
+
+logger = logging.getLogger(__name__)
+
+# Victorias por método de extracción, persistidas entre reinicios
+STRATEGY_STATS_FILE = os.getenv("STRATEGY_STATS_FILE", "strategy_stats.json")
+# Probabilidad de evaluar todos los métodos para dar crédito a los que no van primero
+STRATEGY_EXPLORE_RATE = float(os.getenv("STRATEGY_EXPLORE_RATE", "0.05"))
+# Olvido por extracción: las victorias viejas pesan menos y un cambio de diseño se nota pronto
+STRATEGY_DECAY = float(os.getenv("STRATEGY_DECAY", "0.98"))
+STRATEGY_SAVE_INTERVAL = float(os.getenv("STRATEGY_SAVE_INTERVAL", "30"))
+
+Strategy = Tuple[str, Callable[..., Optional[str]]]
+
+
+class StrategyStats:
+    """
+    Orden adaptativo de los métodos de extracción de cada handler
+
+    Cada handler prueba sus métodos del que más gana al que menos; los empates
+    conservan el orden original (los métodos más precisos primero). De vez en
+    cuando se evalúan todos los métodos sobre la misma página para que un método
+    relegado pueda recuperar puntaje si el sitio cambia de diseño.
+
+    Los métodos comodín (cualquier enlace externo) van aparte, en fallbacks: se
+    prueban siempre al final y no puntúan. Si entraran al orden, una racha de
+    cambio de diseño los pondría primero y, como aciertan casi siempre, ningún
+    método preciso podría volver a superarlos.
+    """
+
+    def __init__(self, path: str = STRATEGY_STATS_FILE, explore_rate: float = STRATEGY_EXPLORE_RATE,
+                 decay: float = STRATEGY_DECAY, save_interval: float = STRATEGY_SAVE_INTERVAL):
+        self.path = path
+        self.explore_rate = explore_rate
+        self.decay = decay
+        self.save_interval = save_interval
+        self._scores: Dict[str, Dict[str, float]] = {}
+        self._leaders: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+        self._load()
+
+    def order(self, handler: str, strategies: List[Strategy]) -> List[Strategy]:
+        """Métodos ordenados por puntaje (estable respecto al orden original)"""
+        with self._lock:
+            scores = dict(self._scores.get(handler, {}))
+        return sorted(strategies, key=lambda strategy: -scores.get(strategy[0], 0.0))
+
+    def run(self, handler: str, strategies: List[Strategy], *args,
+            fallbacks: List[Strategy] = ()) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Prueba los métodos en orden adaptativo y registra cuál dio el enlace
+
+        Args:
+            fallbacks: Métodos comodín, en orden fijo después de los demás y sin puntaje
+
+        Returns:
+            tuple: (enlace, nombre del método) o (None, None) si ninguno encontró nada
+        """
+        if fallbacks:
+            self._forget(handler, [name for name, _ in fallbacks])
+        ordered = self.order(handler, strategies)
+
+        if random.random() < self.explore_rate:
+            # Exploración: evaluar todos y dar crédito a cada método que acierte
+            hits = []
+            result = (None, None)
+            for name, method in ordered:
+                link = self._try(handler, name, method, *args)
+                if link:
+                    hits.append(name)
+                    if result[0] is None:
+                        result = (link, name)
+            self.record(handler, hits)
+            return result if result[0] else self._fallback(handler, fallbacks, *args)
+
+        for name, method in ordered:
+            link = self._try(handler, name, method, *args)
+            if link:
+                self.record(handler, [name])
+                return link, name
+
+        self.record(handler, [])
+        return self._fallback(handler, fallbacks, *args)
+
+    def _fallback(self, handler: str, fallbacks: List[Strategy], *args) -> Tuple[Optional[str], Optional[str]]:
+        """Métodos comodín en su orden fijo, cuando ningún método preciso acertó"""
+        for name, method in fallbacks:
+            link = self._try(handler, name, method, *args)
+            if link:
+                logger.info(f"{handler}: enlace encontrado solo por el método comodín {name}")
+                return link, name
+        return None, None
+
+    def _forget(self, handler: str, names: List[str]):
+        """Descarta el puntaje guardado de métodos que ya no se ordenan (comodines)"""
+        with self._lock:
+            scores = self._scores.get(handler, {})
+            if not any(name in scores for name in names):
+                return
+            for name in names:
+                scores.pop(name, None)
+            if self._leaders.get(handler) in names:
+                self._leaders.pop(handler)
+            self._dirty = True
+
+    def record(self, handler: str, winners: List[str]):
+        """Aplica el olvido a todos los métodos del handler y suma una victoria a los ganadores"""
+        with self._lock:
+            scores = self._scores.setdefault(handler, {})
+            for name in scores:
+                scores[name] *= self.decay
+            for name in winners:
+                scores[name] = scores.get(name, 0.0) + 1.0
+
+            leader = max(scores, key=scores.get) if scores else None
+            previous = self._leaders.get(handler)
+            if leader and leader != previous:
+                self._leaders[handler] = leader
+                if previous:
+                    # Cambió el método dominante: probablemente cambió el diseño del sitio
+                    logger.warning(f"{handler}: el método dominante cambió de {previous} a {leader}")
+            self._dirty = True
+
+        self._maybe_save()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Método dominante y tasa de victorias de cada método, por handler"""
+        result = {}
+        with self._lock:
+            for handler, scores in self._scores.items():
+                total = sum(scores.values()) or 1.0
+                result[handler] = {
+                    'leader': self._leaders.get(handler),
+                    'win_rates': {name: round(score / total, 3)
+                                  for name, score in sorted(scores.items(), key=lambda item: -item[1])}
+                }
+        return result
+
+    def save(self):
+        with self._lock:
+            # Se serializa bajo el lock: los contadores cambian desde otros hilos
+            data = json.dumps({'scores': self._scores, 'leaders': self._leaders}, indent=2)
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            # Nombre temporal por hilo: dos guardados simultáneos no comparten archivo
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.debug(f"No se pudo escribir {self.path}: {e}")
+
+    def _try(self, handler: str, name: str, method, *args) -> Optional[str]:
+        try:
+            return method(*args)
+        except Exception as e:
+            logger.debug(f"{handler}: el método {name} falló: {e}")
+            return None
+
+    def _maybe_save(self):
+        if self._dirty and time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self._scores = data.get('scores', {})
+            self._leaders = data.get('leaders', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Estadísticas de métodos ilegibles ({self.path}), empezando de cero: {e}")
+
+
+# Instancia global compartida por los handlers
+strategy_stats = StrategyStats()
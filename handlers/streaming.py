@@ -0,0 +1,234 @@
+import os
+import time
+import codecs
+import asyncio
+import threading
+import logging
+from html.parser import HTMLParser
+from typing import Callable, Dict, Optional, Any
+
+from .async_http import HTTPStatusError
+
+logger = logging.getLogger(__name__)
+
+# Lectura incremental de páginas: se corta la descarga al encontrar el enlace (0 = desactivado)
+STREAMING_FETCH = os.getenv("STREAMING_FETCH", "1") != "0"
+STREAMING_CHUNK_SIZE = int(os.getenv("STREAMING_CHUNK_SIZE", "16384"))
+
+# criterio(etiqueta, atributos) -> enlace o None, al abrir una etiqueta
+StartMatcher = Callable[[str, Dict[str, str]], Optional[str]]
+# criterio(atributos, texto) -> enlace o None, al cerrar un <a>
+AnchorMatcher = Callable[[Dict[str, str], str], Optional[str]]
+
+
+class LinkScanner(HTMLParser):
+    """Parser incremental que se detiene en el primer elemento que cumple el criterio del handler"""
+
+    def __init__(self, match_start: Optional[StartMatcher] = None,
+                 match_anchor: Optional[AnchorMatcher] = None):
+        super().__init__(convert_charrefs=True)
+        self.match_start = match_start
+        self.match_anchor = match_anchor
+        self.result = None
+        self._anchor = None
+        self._anchor_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.result:
+            return
+        attrs = {name: value or '' for name, value in attrs}
+        if self.match_start:
+            self.result = self.match_start(tag, attrs)
+        if tag == 'a' and self.match_anchor and attrs.get('href'):
+            self._anchor = attrs
+            self._anchor_text = []
+
+    def handle_data(self, data):
+        if self._anchor is not None:
+            self._anchor_text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._anchor is not None:
+            if not self.result:
+                self.result = self.match_anchor(self._anchor, ''.join(self._anchor_text).strip())
+            self._anchor = None
+
+
+class StreamedPage:
+    """Página leída hasta el enlace (link) o completa; misma interfaz que una respuesta para parsed_page"""
+
+    def __init__(self, url, status_code, headers, text, link, complete):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.link = link
+        self.complete = complete
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPStatusError(self)
+
+
+class StreamStats:
+    """Bytes y tiempo ahorrados por sitio al cortar la descarga antes del final"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites: Dict[str, Dict[str, float]] = {}
+
+    def record(self, site: str, bytes_read: int, elapsed: float, complete: bool,
+               content_length: Optional[int] = None):
+        with self._lock:
+            stats = self._sites.setdefault(site, {
+                'requests': 0, 'early_exits': 0, 'bytes_read': 0,
+                'bytes_saved': 0, 'seconds_saved': 0.0, 'page_size': 0.0
+            })
+            stats['requests'] += 1
+            stats['bytes_read'] += bytes_read
+
+            if complete:
+                # Tamaño típico de la página completa (media móvil), para estimar lo ahorrado
+                stats['page_size'] = bytes_read if not stats['page_size'] else 0.8 * stats['page_size'] + 0.2 * bytes_read
+                return
+
+            stats['early_exits'] += 1
+            full_size = content_length or stats['page_size']
+            saved = max(0, full_size - bytes_read)
+            stats['bytes_saved'] += saved
+            if bytes_read and elapsed > 0:
+                stats['seconds_saved'] += saved / (bytes_read / elapsed)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                site: {
+                    'requests': s['requests'],
+                    'early_exits': s['early_exits'],
+                    'kb_read': round(s['bytes_read'] / 1024),
+                    'kb_saved': round(s['bytes_saved'] / 1024),
+                    'seconds_saved': round(s['seconds_saved'], 1)
+                }
+                for site, s in self._sites.items()
+            }
+
+
+stream_stats = StreamStats()
+
+
+def _content_length(headers) -> Optional[int]:
+    # Con compresión, Content-Length no corresponde a los bytes ya descomprimidos
+    if headers.get('Content-Encoding'):
+        return None
+    try:
+        return int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def stream_page(scraper, url: str, site: str, match_start: Optional[StartMatcher] = None,
+                match_anchor: Optional[AnchorMatcher] = None,
+                chunk_size: int = STREAMING_CHUNK_SIZE) -> StreamedPage:
+    """
+    Descarga una página por partes y corta en cuanto aparece el enlace buscado
+
+    Si el enlace no aparece, la página queda completa en StreamedPage.text para
+    que el handler aplique sus métodos de extracción habituales sin volver a pedirla.
+    """
+    start = time.time()
+    response = scraper.get(url, stream=True, allow_redirects=True)
+    try:
+        response.raise_for_status()
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        scanner = LinkScanner(match_start, match_anchor)
+        parts = []
+        raw = []
+        bytes_read = 0
+        complete = True
+
+        for chunk in response.iter_content(chunk_size):
+            bytes_read += len(chunk)
+            raw.append(chunk)
+            text = decoder.decode(chunk)
+            parts.append(text)
+            scanner.feed(text)
+            if scanner.result:
+                complete = False
+                break
+        if complete:
+            parts.append(decoder.decode(b'', final=True))
+            # Página leída entera: a la caché HTTP si el scraper es un CachedSession
+            store_page = getattr(scraper, 'store_page', None)
+            if store_page:
+                store_page(url, response, b''.join(raw))
+    finally:
+        response.close()
+
+    stream_stats.record(site, bytes_read, time.time() - start, complete, _content_length(response.headers))
+    return StreamedPage(response.url, response.status_code, response.headers, ''.join(parts),
+                        scanner.result, complete)
+
+
+def _scan_cached(response, match_start: Optional[StartMatcher],
+                 match_anchor: Optional[AnchorMatcher]) -> StreamedPage:
+    """Página completa servida por la caché, recorrida con el mismo criterio que la lectura incremental"""
+    scanner = LinkScanner(match_start, match_anchor)
+    scanner.feed(response.text)
+    return StreamedPage(response.url, response.status_code, response.headers, response.text,
+                        scanner.result, True)
+
+
+async def astream_page(url: str, site: str, match_start: Optional[StartMatcher] = None,
+                       match_anchor: Optional[AnchorMatcher] = None,
+                       chunk_size: int = STREAMING_CHUNK_SIZE) -> StreamedPage:
+    """Versión asíncrona de stream_page sobre la sesión HTTP compartida (y la caché HTTP)"""
+    from .async_http import get_session, CloudflareChallenge, _is_cloudflare_challenge, _page_cache
+
+    cache = _page_cache(url)
+    headers = {}
+    if cache:
+        key, entry, fresh = await asyncio.to_thread(cache.lookup, url)
+        if fresh is not None:
+            return _scan_cached(fresh, match_start, match_anchor)
+        headers = cache.validators(entry)
+
+    start = time.time()
+    session = await get_session()
+    async with session.get(url, allow_redirects=True, headers=headers) as response:
+        if cache:
+            revalidated = await asyncio.to_thread(cache.revalidated, key, url, entry, response.status, response.headers)
+            if revalidated is not None:
+                return _scan_cached(revalidated, match_start, match_anchor)
+            cache.record_miss()
+
+        if response.status in (403, 429, 503):
+            text = await response.text(errors='replace')
+            if _is_cloudflare_challenge(response.status, response.headers, text):
+                raise CloudflareChallenge(f"Desafío de Cloudflare en {url}")
+            return StreamedPage(str(response.url), response.status, response.headers, text, None, True)
+
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        scanner = LinkScanner(match_start, match_anchor)
+        parts = []
+        raw = []
+        bytes_read = 0
+        complete = True
+
+        async for chunk in response.content.iter_chunked(chunk_size):
+            bytes_read += len(chunk)
+            raw.append(chunk)
+            text = decoder.decode(chunk)
+            parts.append(text)
+            scanner.feed(text)
+            if scanner.result:
+                complete = False
+                break
+        if complete:
+            parts.append(decoder.decode(b'', final=True))
+            if cache and response.status == 200:
+                await asyncio.to_thread(cache.store_page, url, str(response.url), response.headers,
+                                        b''.join(raw), response.charset)
+
+    stream_stats.record(site, bytes_read, time.time() - start, complete, _content_length(response.headers))
+    return StreamedPage(str(response.url), response.status, response.headers, ''.join(parts),
+                        scanner.result, complete)
@@ -0,0 +1,47 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PhraseTranslator:
+    """
+    Reemplaza frases completas en una sola pasada
+
+    Todas las frases de los glosarios se compilan una vez en una única alternancia
+    (las más largas primero, para que "Premium Unlocked" gane a "Premium"); cada
+    llamada a translate() es un solo re.sub sobre el texto.
+    """
+
+    def __init__(self, *glossaries):
+        self._phrases = {}
+        self._pattern = None
+        for glossary in glossaries:
+            self.add_glossary(glossary)
+
+    def add_glossary(self, glossary):
+        """Agrega frases (inglés -> español); la alternancia se recompila en el próximo uso"""
+        for source, target in glossary.items():
+            self._phrases[source.lower()] = target
+        self._pattern = None
+
+    def load_json(self, path):
+        """Agrega un glosario desde un archivo JSON {"frase": "traducción"}"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.add_glossary(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo cargar el glosario {path}: {e}")
+
+    def translate(self, text):
+        if not text or not self._phrases:
+            return text
+        pattern = self._pattern or self._compile()
+        return pattern.sub(lambda match: self._phrases[match.group(0).lower()], text)
+
+    def _compile(self):
+        phrases = sorted(self._phrases, key=len, reverse=True)
+        alternation = '|'.join(re.escape(phrase) for phrase in phrases)
+        self._pattern = re.compile(r'\b(?:' + alternation + r')\b', re.IGNORECASE)
+        return self._pattern
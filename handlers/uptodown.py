@@ -1,8 +1,14 @@
 import re
-import time
+import asyncio
 import cloudscraper
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
+from .async_http import fetch, CloudflareChallenge
+from .page_fetch import fetch_pages, parsed_page, aextract
+from .http_cache import cached_session
+from .strategy_stats import strategy_stats
+from .retry import link_not_found
+from .hedging import hedge_sleep
+from .streaming import stream_page, astream_page, STREAMING_FETCH
 
 class UptodownHandler:
     @staticmethod
@@ -12,12 +18,13 @@ class UptodownHandler:
 
     @staticmethod
     def get_scraper():
-        return cloudscraper.create_scraper(browser={
+        # Las páginas pasan por la caché HTTP en disco (revalidación con ETag/Last-Modified)
+        return cached_session(cloudscraper.create_scraper(browser={
             'browser': 'chrome',
             'platform': 'windows',
             'mobile': False,
             'desktop': True,
-        }, delay=1)
+        }, delay=1))
 
     @staticmethod
     def normalize_url(url):
@@ -36,8 +43,138 @@ class UptodownHandler:
         return url
 
     @staticmethod
-    def get_direct_link(url, retries=3):
-        scraper = UptodownHandler.get_scraper()
+    def _dw_url(data_url):
+        """URL completa de dw.uptodown.net a partir del data-url del botón"""
+        if data_url.startswith('/'):
+            data_url = data_url[1:]  # Quitar / inicial si existe
+        return f"https://dw.uptodown.net/dwn/{data_url}"
+
+    @staticmethod
+    def _stream_match(tag, attrs):
+        """Criterio de corte de la lectura incremental: el botón principal de descarga"""
+        if tag == 'button' and attrs.get('id') == 'detail-download-button' and attrs.get('data-url'):
+            return UptodownHandler._dw_url(attrs['data-url'])
+        return None
+
+    @staticmethod
+    def _by_id_button(soup):
+        # Botón específico de descarga de Uptodown, por ID
+        download_button = soup.find('button', id='detail-download-button')
+        if download_button and download_button.get('data-url'):
+            return UptodownHandler._dw_url(download_button['data-url'])
+        return None
+
+    @staticmethod
+    def _by_class_button(soup):
+        # Botón por clases específicas
+        download_button = soup.find('button', class_=re.compile(r'button.*download', re.IGNORECASE))
+        if download_button and download_button.get('data-url'):
+            return UptodownHandler._dw_url(download_button['data-url'])
+        return None
+
+    @staticmethod
+    def _by_data_url_text(soup):
+        # Cualquier elemento con data-url cuyo texto diga "Download"
+        for element in soup.find_all(attrs={'data-url': True}):
+            if re.search(r'Download|Descargar', element.get_text(), re.IGNORECASE):
+                return UptodownHandler._dw_url(element['data-url'])
+        return None
+
+    @staticmethod
+    def _by_dw_apk_link(soup):
+        # Enlaces completos a dw.uptodown.net que terminen en .apk
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if 'dw.uptodown.net' in href and href.endswith('.apk'):
+                return href
+        return None
+
+    @staticmethod
+    def _by_green_class(soup):
+        # Botón verde por clases CSS típicas de Uptodown
+        green_button_classes = [
+            'download-button', 'btn-download', 'download-link', 'main-download', 
+            'button-download', 'green-button', 'primary-button', 'download-btn'
+        ]
+
+        for class_name in green_button_classes:
+            elements = soup.find_all(['a', 'button', 'div'], class_=re.compile(class_name, re.IGNORECASE))
+            for element in elements:
+                # Verificar si contiene texto relacionado con descarga
+                if not re.search(r'Download|Descargar', element.get_text(), re.IGNORECASE):
+                    continue
+                if element.name == 'a' and 'dw.uptodown.net' in element.get('href', ''):
+                    return element['href']
+
+                # Buscar enlace padre
+                parent_link = element.find_parent('a')
+                if parent_link and 'dw.uptodown.net' in parent_link.get('href', ''):
+                    return parent_link['href']
+        return None
+
+    @staticmethod
+    def _by_download_text(soup):
+        # Enlaces de dw.uptodown.net con texto "Download"
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if re.search(r'\bDownload\b', link.get_text().strip(), re.IGNORECASE) and 'dw.uptodown.net' in href:
+                return href
+        return None
+
+    @staticmethod
+    def _by_script(soup):
+        # URLs de dw.uptodown.net en JavaScript
+        for script in soup.find_all('script'):
+            if script.string:
+                matches = re.findall(r'(https?://dw\.uptodown\.net/[^\s"\']+\.apk)', script.string)
+                if matches:
+                    return matches[0]
+        return None
+
+    @staticmethod
+    def _by_data_onclick(soup):
+        # Atributos data-url y onclick con la URL completa
+        for element in soup.find_all(attrs={'data-url': True}):
+            data_url = element['data-url']
+            if 'dw.uptodown.net' in data_url and data_url.endswith('.apk'):
+                return data_url
+
+        for element in soup.find_all(attrs={'onclick': True}):
+            url_matches = re.findall(r'(https?://dw\.uptodown\.net/[^\s"\')]+\.apk)', element['onclick'])
+            if url_matches:
+                return url_matches[0]
+        return None
+
+    @staticmethod
+    def _by_external_apk(soup):
+        # Búsqueda amplia de cualquier enlace .apk externo (fallback)
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            if href.startswith('http') and href.endswith('.apk') and 'uptodown.com' not in href:
+                return href
+        return None
+
+    # Métodos de extracción en su orden original (del más preciso al más amplio)
+    STRATEGIES = (
+        '_by_id_button', '_by_class_button', '_by_data_url_text', '_by_dw_apk_link',
+        '_by_green_class', '_by_download_text', '_by_script', '_by_data_onclick'
+    )
+    # Comodín: siempre al final y fuera del orden adaptativo
+    FALLBACKS = ('_by_external_apk',)
+
+    @staticmethod
+    def _extract_direct_link(soup):
+        """Busca el enlace directo en el HTML ya parseado, empezando por el método que más acierta"""
+        strategies = [(name, getattr(UptodownHandler, name)) for name in UptodownHandler.STRATEGIES]
+        fallbacks = [(name, getattr(UptodownHandler, name)) for name in UptodownHandler.FALLBACKS]
+        direct_url, method = strategy_stats.run('uptodown', strategies, soup, fallbacks=fallbacks)
+        if direct_url:
+            print(f"Enlace encontrado ({method}): {direct_url}")
+        return direct_url
+
+    @staticmethod
+    def get_direct_link(url, retries=3, scraper=None, prefetched=None):
+        scraper = scraper or UptodownHandler.get_scraper()
         
         # Normalizar URL primero (agregar /download automáticamente)
         download_url = UptodownHandler.normalize_url(url)
@@ -46,9 +183,20 @@ class UptodownHandler:
             try:
                 print(f"Intento {attempt + 1}: Accediendo a {download_url}")
                 
-                # Hacer request a la página de descarga
-                response = scraper.get(download_url, allow_redirects=True)
-                response.raise_for_status()
+                # Hacer request a la página de descarga (en el primer intento se usa
+                # la página ya descargada por get_download_info, si la hay)
+                if attempt == 0 and prefetched is not None:
+                    response = prefetched
+                elif STREAMING_FETCH:
+                    # Lectura incremental: se corta al aparecer el botón de descarga
+                    response = stream_page(scraper, download_url, 'uptodown',
+                                           match_start=UptodownHandler._stream_match)
+                    if response.link:
+                        print(f"Enlace encontrado (lectura parcial): {response.link}")
+                        return response.link
+                else:
+                    response = scraper.get(download_url, allow_redirects=True)
+                    response.raise_for_status()
                 
                 # Verificar si hubo redirección (ej: a .en.uptodown.com)
                 final_url = response.url
@@ -58,152 +206,93 @@ class UptodownHandler:
                 
                 # Esperar 5 segundos para que cargue el botón
                 print("Esperando 5 segundos para que cargue el botón...")
-                time.sleep(5)
+                hedge_sleep(5)
                 
                 # Parsear HTML
-                soup = BeautifulSoup(response.text, 'html.parser')
+                soup = parsed_page(response)
                 
-                # Método 1: Buscar el botón específico de descarga de Uptodown (PRIORIDAD MÁXIMA)
-                # Buscar por ID específico
-                download_button = soup.find('button', id='detail-download-button')
-                if download_button and download_button.get('data-url'):
-                    data_url = download_button['data-url']
-                    # Construir la URL completa
-                    if data_url.startswith('/'):
-                        data_url = data_url[1:]  # Quitar / inicial si existe
-                    
-                    direct_url = f"https://dw.uptodown.net/dwn/{data_url}"
-                    print(f"Enlace encontrado (Método 1 - ID button): {direct_url}")
+                direct_url = UptodownHandler._extract_direct_link(soup)
+                if direct_url:
                     return direct_url
 
-                # Método 2: Buscar por clases específicas del botón
-                download_button = soup.find('button', class_=re.compile(r'button.*download', re.IGNORECASE))
-                if download_button and download_button.get('data-url'):
-                    data_url = download_button['data-url']
-                    if data_url.startswith('/'):
-                        data_url = data_url[1:]
-                    
-                    direct_url = f"https://dw.uptodown.net/dwn/{data_url}"
-                    print(f"Enlace encontrado (Método 2 - Clase button): {direct_url}")
-                    return direct_url
+                # Si no se encontró nada en el primer intento, esperar más tiempo
+                if attempt == 0 and retries > 1:
+                    print("No se encontró enlace, esperando más tiempo...")
+                    hedge_sleep(3)
+                    continue
 
-                # Método 3: Buscar cualquier elemento con data-url que contenga "Download"
-                elements_with_data_url = soup.find_all(attrs={'data-url': True})
-                for element in elements_with_data_url:
-                    element_text = element.get_text()
-                    if re.search(r'Download|Descargar', element_text, re.IGNORECASE):
-                        data_url = element['data-url']
-                        if data_url.startswith('/'):
-                            data_url = data_url[1:]
-                        
-                        direct_url = f"https://dw.uptodown.net/dwn/{data_url}"
-                        print(f"Enlace encontrado (Método 3 - Data-URL): {direct_url}")
-                        return direct_url
+            except Exception as e:
+                print(f"Error en intento {attempt + 1}: {str(e)}")
+                if attempt == retries - 1:
+                    raise Exception(f"Error Uptodown después de {retries} intentos: {str(e)}")
+                hedge_sleep(3)
 
-                # Método 4: Buscar enlaces directos ya completos de dw.uptodown.net (fallback)
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    # Buscar específicamente enlaces completos a dw.uptodown.net que terminen en .apk
-                    if ('dw.uptodown.net' in href and href.endswith('.apk')):
-                        print(f"Enlace encontrado (Método 4 - dw.uptodown.net completo): {href}")
-                        return href
+        raise link_not_found(retries, wait=3)
 
-                # Método 3: Buscar botón verde por clases CSS típicas de Uptodown
-                green_button_classes = [
-                    'download-button', 'btn-download', 'download-link', 'main-download', 
-                    'button-download', 'green-button', 'primary-button', 'download-btn'
-                ]
+    @staticmethod
+    async def aget_direct_link(url, retries=3):
+        """Versión asíncrona de get_direct_link sobre la sesión HTTP compartida"""
+        download_url = UptodownHandler.normalize_url(url)
+        
+        for attempt in range(retries):
+            try:
+                print(f"Intento {attempt + 1} (async): Accediendo a {download_url}")
                 
-                for class_name in green_button_classes:
-                    elements = soup.find_all(['a', 'button', 'div'], class_=re.compile(class_name, re.IGNORECASE))
-                    for element in elements:
-                        # Verificar si contiene texto relacionado con descarga
-                        element_text = element.get_text()
-                        if re.search(r'Download|Descargar', element_text, re.IGNORECASE):
-                            if element.name == 'a' and element.get('href'):
-                                href = element['href']
-                                if 'dw.uptodown.net' in href:
-                                    print(f"Enlace encontrado (Método 3 - Clase verde): {href}")
-                                    return href
-                            
-                            # Buscar enlace padre
-                            parent_link = element.find_parent('a')
-                            if parent_link and parent_link.get('href'):
-                                href = parent_link['href']
-                                if 'dw.uptodown.net' in href:
-                                    print(f"Enlace encontrado (Método 3 - Parent clase): {href}")
-                                    return href
-
-                # Método 4: Buscar enlaces directos con "Download" 
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    link_text = link.get_text().strip()
-                    
-                    # Debe contener "Download" y ser enlace de dw.uptodown.net
-                    if (re.search(r'\bDownload\b', link_text, re.IGNORECASE) and 
-                        'dw.uptodown.net' in href):
-                        print(f"Enlace encontrado (Método 4 - Download directo): {href}")
-                        return href
-
-                # Método 5: Buscar en JavaScript y atributos especiales
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    if script.string:
-                        # Buscar URLs de dw.uptodown.net en JavaScript
-                        matches = re.findall(r'(https?://dw\.uptodown\.net/[^\s"\']+\.apk)', script.string)
-                        if matches:
-                            print(f"Enlace encontrado (Método 5 - JavaScript): {matches[0]}")
-                            return matches[0]
-
-                # Método 6: Buscar en atributos de datos y onclick
-                for element in soup.find_all(attrs={'data-url': True}):
-                    data_url = element['data-url']
-                    if 'dw.uptodown.net' in data_url and data_url.endswith('.apk'):
-                        print(f"Enlace encontrado (Método 6 - Data URL): {data_url}")
-                        return data_url
-
-                for element in soup.find_all(attrs={'onclick': True}):
-                    onclick = element['onclick']
-                    # Buscar URLs de dw.uptodown.net en eventos onclick
-                    url_matches = re.findall(r'(https?://dw\.uptodown\.net/[^\s"\')]+\.apk)', onclick)
-                    for match in url_matches:
-                        print(f"Enlace encontrado (Método 6 - OnClick): {match}")
-                        return match
-
-                # Método 7: Búsqueda amplia de cualquier enlace .apk externo (fallback)
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    if (href.startswith('http') and 
-                        href.endswith('.apk') and 
-                        'uptodown.com' not in href):
-                        print(f"Enlace encontrado (Método 7 - APK externo): {href}")
-                        return href
+                if STREAMING_FETCH:
+                    response = await astream_page(download_url, 'uptodown',
+                                                  match_start=UptodownHandler._stream_match)
+                    if response.link:
+                        print(f"Enlace encontrado (lectura parcial): {response.link}")
+                        return response.link
+                else:
+                    response = await fetch(download_url)
+                response.raise_for_status()
+                
+                # Verificar si hubo redirección (ej: a .en.uptodown.com)
+                if response.url != download_url:
+                    print(f"Redirección detectada: {response.url}")
+                    download_url = response.url
+                
+                print("Esperando 5 segundos para que cargue el botón...")
+                await asyncio.sleep(5)
+                
+                direct_url = await aextract(response, UptodownHandler._extract_direct_link)
+                if direct_url:
+                    return direct_url
 
-                # Si no se encontró nada en el primer intento, esperar más tiempo
-                if attempt == 0:
+                if attempt == 0 and retries > 1:
                     print("No se encontró enlace, esperando más tiempo...")
-                    time.sleep(3)
+                    await asyncio.sleep(3)
                     continue
 
+            except CloudflareChallenge:
+                print("Desafío de Cloudflare, usando cloudscraper...")
+                return await asyncio.to_thread(UptodownHandler.get_direct_link, url, retries)
             except Exception as e:
                 print(f"Error en intento {attempt + 1}: {str(e)}")
                 if attempt == retries - 1:
                     raise Exception(f"Error Uptodown después de {retries} intentos: {str(e)}")
-                time.sleep(3)
+                await asyncio.sleep(3)
 
-        raise Exception("No se encontró enlace directo después de varios intentos")
+        raise link_not_found(retries, wait=3)
 
     @staticmethod
-    def extract_app_info(url):
+    def _info_url(url):
+        """URL de la página principal de la app (sin /download)"""
+        return url.replace('/download', '') if '/download' in url else url
+
+    @staticmethod
+    def extract_app_info(url, prefetched=None):
         """Extrae información de la app desde la URL"""
-        scraper = UptodownHandler.get_scraper()
-        
         try:
             # Si es URL de descarga, obtener la URL original
-            original_url = url.replace('/download', '') if '/download' in url else url
+            original_url = UptodownHandler._info_url(url)
             
-            response = scraper.get(original_url, allow_redirects=True)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            if prefetched is not None:
+                response = prefetched
+            else:
+                response = UptodownHandler.get_scraper().get(original_url, allow_redirects=True)
+            soup = parsed_page(response)
             
             # Extraer título
             title = "APK"
@@ -270,8 +359,14 @@ class UptodownHandler:
     def get_download_info(url):
         """Obtiene tanto el enlace directo como la información de la app"""
         try:
-            direct_link = UptodownHandler.get_direct_link(url)
-            app_info = UptodownHandler.extract_app_info(url)
+            # Página de descarga y página principal se piden una vez cada una, en paralelo
+            scraper = UptodownHandler.get_scraper()
+            download_url = UptodownHandler.normalize_url(url)
+            info_url = UptodownHandler._info_url(url)
+            pages = fetch_pages(scraper, [download_url, info_url], UptodownHandler.get_scraper, allow_redirects=True)
+            
+            direct_link = UptodownHandler.get_direct_link(url, scraper=scraper, prefetched=pages[download_url])
+            app_info = UptodownHandler.extract_app_info(url, prefetched=pages[info_url])
             
             return {
                 'direct_link': direct_link,
@@ -1,40 +1,37 @@
 import os
 import time
+from datetime import datetime
+import argparse
+
+# Inicio del proceso, para medir el tiempo de arranque
+STARTUP_BEGIN = time.perf_counter()
+
 import asyncio
 import signal
 from telegram import Update
 from telegram.ext import ApplicationBuilder, MessageHandler, ContextTypes, filters, CommandHandler
-from handlers import get_direct_link, is_supported_link, process_mediafire_folder
+from handlers import resolve_link, process_mediafire_folder, mediafire_tier_stats
+from handlers.registry import handler_registry, import_report
 
 # Importar los nuevos sistemas
 from advanced_logging import bot_logger
 from task_queue_system import task_queue, restart_manager, TaskStatus
+from handlers.browser_registry import browser_registry
+from browser_worker import browser_workers
+from handlers.hedging import hedger
+from handlers.strategy_stats import strategy_stats
+from handlers.streaming import stream_stats
+from handlers.http_cache import http_cache
+from handlers.link_store import link_store
+from handlers.circuit_breaker import circuit_breaker
+from handlers.politeness import politeness
 
 TOKEN = os.getenv("BOT_TOKEN")
+# Importar todos los handlers al arrancar en vez de en el primer enlace (igual que --preload)
+PRELOAD_HANDLERS = os.getenv("PRELOAD_HANDLERS", "0") == "1"
 
-# Diccionario de sitios soportados
-SUPPORTED_SITES = {
-    'MediaFire': {
-        'ejemplo': 'https://www.mediafire.com/file/ejemplo/file.apk',
-        'notas': 'Soporta archivos individuales y carpetas (con /folder/)'
-    },
-    'MegaUp': {
-        'ejemplo': 'https://megaup.net/ejemplo',
-        'notas': 'Autodetecta captcha, espera 5 segundos'
-    },
-    'A2ZAPK': {
-        'ejemplo': 'https://a2zapk.io/ejemplo',
-        'notas': 'Usa técnica de distracción para evitar bloqueos'
-    },
-    'APK4Free': {
-        'ejemplo': 'https://apk4free.net/ejemplo',
-        'notas': 'Descarga directa de APKs modificados'
-    },
-    'APKDone': {
-        'ejemplo': 'https://apkdone.com/spotify-premium',
-        'notas': 'Descarga directa de APKs premium/modificados'
-    }
-}
+# Diccionario de sitios soportados (generado desde el registro de handlers)
+SUPPORTED_SITES = handler_registry.supported_sites()
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador principal de mensajes con sistema de colas"""
@@ -52,8 +49,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Verificar si el sitio es soportado
-        if not is_supported_link(url):
+        # Verificar si el sitio es soportado (una sola búsqueda en el registro)
+        match = resolve_link(url)
+        if match is None:
             await update.message.reply_text("Sitio no soportado. Usa /soporte para ver los sitios disponibles.")
             bot_logger.log(
                 f"Sitio no soportado: {url}",
@@ -63,11 +61,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
+        # Las carpetas de MediaFire se resuelven archivo por archivo y se entregan a medida que llegan
+        task_type = 'folder' if match.key.startswith('mediafire:folder:') else 'download'
+        
         # Agregar tarea a la cola
         task_id = task_queue.add_task(
             user_id=user_id,
-            task_type='download',
-            data={'url': url}
+            task_type=task_type,
+            data={'url': match.url, 'site': match.spec.key, 'cost': match.cost, 'key': match.key}
         )
         
         # Obtener estado de la cola para mostrar posición
@@ -90,11 +91,30 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bot_logger.log_exception(e, "handle_message", user_id)
         await update.message.reply_text(f"Error inesperado: {str(e)}")
 
+def chunk_lines(lines, limit=4000):
+    """Agrupa líneas en mensajes que no superen el límite de Telegram"""
+    chunk = ""
+    for line in lines:
+        if chunk and len(chunk) + len(line) + 1 > limit:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line[:limit]
+    if chunk:
+        yield chunk
+
+def escape_markdown(text):
+    """Escapa los caracteres especiales del Markdown clásico de Telegram"""
+    text = str(text)
+    for char in ('_', '*', '`', '['):
+        text = text.replace(char, f'\\{char}')
+    return text
+
 async def monitor_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_id: str, processing_msg_id: int):
     """Monitorea una tarea hasta su completación"""
     max_wait_time = 300  # 5 minutos máximo
     check_interval = 2   # Verificar cada 2 segundos
     elapsed_time = 0
+    sent_partials = 0
     
     while elapsed_time < max_wait_time:
         task = task_queue.get_task_status(task_id)
@@ -107,7 +127,19 @@ async def monitor_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_
             )
             return
         
-        if task.status == TaskStatus.COMPLETED:
+        # El estado se lee antes de entregar los parciales: si ya terminó, están todos
+        status = task.status
+        
+        # Entregar los resultados parciales nuevos (archivos de carpetas)
+        if len(task.partial_results) > sent_partials:
+            new_results = task.partial_results[sent_partials:]
+            sent_partials += len(new_results)
+            for chunk in chunk_lines(new_results):
+                await update.message.reply_text(chunk, disable_web_page_preview=True)
+            # Mientras lleguen resultados la tarea sigue viva
+            elapsed_time = 0
+        
+        if status == TaskStatus.COMPLETED:
             # Tarea completada exitosamente
             try:
                 await context.bot.delete_message(
@@ -120,7 +152,7 @@ async def monitor_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_
             await update.message.reply_text(task.result)
             return
         
-        elif task.status == TaskStatus.FAILED:
+        elif status == TaskStatus.FAILED:
             # Tarea falló
             try:
                 await context.bot.delete_message(
@@ -133,7 +165,7 @@ async def monitor_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_
             await update.message.reply_text(f"Error: {task.error}")
             return
         
-        elif task.status == TaskStatus.CANCELLED:
+        elif status == TaskStatus.CANCELLED:
             # Tarea cancelada
             try:
                 await context.bot.delete_message(
@@ -156,7 +188,10 @@ async def monitor_task(update: Update, context: ContextTypes.DEFAULT_TYPE, task_
                 if task.progress > 0:
                     progress_msg += f"Progreso: {task.progress}%\n"
                 
-                if task.status == TaskStatus.PENDING:
+                if task.status == TaskStatus.PENDING and task.retry_at:
+                    wait = max(0, (task.retry_at - datetime.now()).total_seconds())
+                    progress_msg += f"Reintento {task.attempts + 1} en {wait:.0f}s"
+                elif task.status == TaskStatus.PENDING:
                     progress_msg += f"Posición en cola: {queue_status['pending']}"
                 elif task.status == TaskStatus.PROCESSING:
                     progress_msg += "Procesando enlace..."
@@ -280,6 +315,8 @@ async def estado_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message += f"Tareas activas: {queue_status['active']}\n"
             message += f"Tareas completadas: {queue_status['completed']}\n"
             message += f"Workers máximos: {queue_status['max_workers']}\n"
+            if queue_status['retrying']:
+                message += f"Esperando reintento: {queue_status['retrying']}\n"
             
             if queue_status['active_tasks']:
                 message += f"\n**Tareas activas:**\n"
@@ -287,9 +324,92 @@ async def estado_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     task = task_queue.get_task_status(task_id)
                     if task:
                         elapsed = (time.time() - task.started_at.timestamp()) if task.started_at else 0
-                        message += f"• {task_id}: {task.task_type} ({elapsed:.0f}s)\n"
+                        message += f"• {escape_markdown(task_id)}: {escape_markdown(task.task_type)} ({elapsed:.0f}s)\n"
             
-            await update.message.reply_text(message, parse_mode='Markdown')
+            browsers = browser_registry.stats()
+            if browsers:
+                message += f"\n**Navegadores activos:** {len(browsers)}\n"
+                for browser in browsers[:5]:
+                    message += f"• {escape_markdown(browser['label'])} ({escape_markdown(browser['owner'])}): {browser['processes']} procesos, {browser['rss_mb']} MB\n"
+            
+            hedge_stats = hedger.stats()
+            if hedge_stats:
+                message += f"\n**Peticiones cubiertas (hedging):**\n"
+                for site, site_stats in hedge_stats.items():
+                    p90 = f"{site_stats['p90']}s" if site_stats['p90'] is not None else "calentando"
+                    site = escape_markdown(site)
+                    message += (f"• {site}: p90 {p90}, cubiertas {site_stats['hedge_rate']:.0%}, "
+                                f"gana respaldo {site_stats['win_rate']:.0%}\n")
+            
+            if browser_workers.running:
+                message += f"\n**Workers de navegador:**\n"
+                for worker in browser_workers.health():
+                    if 'error' in worker:
+                        message += f"• Worker {worker['index']}: ❌ {escape_markdown(worker['error'])}\n"
+                    else:
+                        rss = sum(b['rss_mb'] for b in worker['browsers'])
+                        message += f"• PID {worker['pid']}: {worker['active']}/{worker['concurrency']} activas, {len(worker['browsers'])} navegadores, {rss:.0f} MB\n"
+            
+            breaker_stats = circuit_breaker.stats()
+            tripped = {site: s for site, s in breaker_stats['sites'].items() if s['state'] != 'closed'}
+            if tripped or breaker_stats['negative_entries']:
+                message += f"\n**Sitios en falla:** {breaker_stats['negative_entries']} URLs con fallo reciente\n"
+                for site, site_stats in tripped.items():
+                    state = f"abierto, reintento en {site_stats['retry_in']}s" if site_stats['state'] == 'open' else "probando"
+                    message += f"• {escape_markdown(site)}: {state} ({site_stats['failures']} fallos, {site_stats['rejected']} rechazadas)\n"
+            
+            limited = {site: s for site, s in politeness.stats().items() if s['deferred'] or s['paused_for']}
+            if limited:
+                message += f"\n**Límites por sitio:**\n"
+                for site, site_stats in limited.items():
+                    paused = f", en pausa {site_stats['paused_for']}s" if site_stats['paused_for'] else ""
+                    message += (f"• {escape_markdown(site)}: {site_stats['active']} en curso, {site_stats['deferred']} esperas, "
+                                f"{site_stats['pauses']} pausas por 429{paused}\n")
+            
+            mediafire_tiers = mediafire_tier_stats()
+            if mediafire_tiers:
+                message += f"\n**MediaFire por nivel:**\n"
+                for tier, tier_stats in mediafire_tiers.items():
+                    message += (f"• {escape_markdown(tier)}: {tier_stats['share']:.0%} del tráfico, "
+                                f"{tier_stats['avg_ms']} ms promedio ({tier_stats['calls']} llamadas)\n")
+            
+            cache_stats = http_cache.stats()
+            if cache_stats['stored'] or cache_stats['fresh'] or cache_stats['revalidated']:
+                message += (f"\n**Caché HTTP:** {cache_stats['hit_rate']:.0%} aciertos "
+                            f"({cache_stats['fresh']} frescas, {cache_stats['revalidated']} revalidadas 304, "
+                            f"{cache_stats['miss']} descargas)\n")
+            
+            store_stats = link_store.stats()
+            if store_stats['entries'] or store_stats['hits']:
+                message += (f"\n**Enlaces populares:** {store_stats['entries']} guardados, "
+                            f"{store_stats['hit_rate']:.0%} aciertos, {store_stats['refreshes']} refrescados "
+                            f"({queue_status['active_refreshes']} en curso, {queue_status['pending_refreshes']} en espera)\n")
+            
+            streamed = stream_stats.stats()
+            if streamed:
+                message += f"\n**Lectura parcial de páginas:**\n"
+                for site, site_stats in streamed.items():
+                    message += (f"• {escape_markdown(site)}: {site_stats['early_exits']}/{site_stats['requests']} cortadas, "
+                                f"{site_stats['kb_saved']} KB y {site_stats['seconds_saved']}s ahorrados\n")
+            
+            method_stats = strategy_stats.stats()
+            if method_stats:
+                message += f"\n**Métodos de extracción:**\n"
+                for handler, handler_stats in method_stats.items():
+                    leader = escape_markdown(handler_stats['leader'] or '-')
+                    rate = handler_stats['win_rates'].get(handler_stats['leader'], 0)
+                    message += f"• {escape_markdown(handler)}: {leader} ({rate:.0%})\n"
+            
+            loaded = import_report()
+            if loaded:
+                message += f"\n**Handlers cargados:**\n"
+                for item in loaded:
+                    module = escape_markdown(item['module'])
+                    message += f"• {module}: {item['seconds'] * 1000:.0f} ms ({item['modules']} módulos)\n"
+            
+            # Con muchos sitios el resumen puede superar el límite de Telegram
+            for chunk in chunk_lines(message.splitlines()):
+                await update.message.reply_text(chunk, parse_mode='Markdown')
             
         else:
             # Mostrar estado de tarea específica
@@ -300,9 +420,9 @@ async def estado_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(f"Tarea {task_id} no encontrada")
                 return
             
-            message = f"**Estado de la Tarea {task_id}**\n\n"
+            message = f"**Estado de la Tarea {escape_markdown(task_id)}**\n\n"
             message += f"Usuario: {task.user_id}\n"
-            message += f"Tipo: {task.task_type}\n"
+            message += f"Tipo: {escape_markdown(task.task_type)}\n"
             message += f"Estado: {task.status.value}\n"
             message += f"Creada: {task.created_at.strftime('%H:%M:%S')}\n"
             
@@ -316,7 +436,7 @@ async def estado_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 message += f"Progreso: {task.progress}%\n"
             
             if task.error:
-                message += f"Error: {task.error}\n"
+                message += f"Error: {escape_markdown(task.error)}\n"
             
             await update.message.reply_text(message, parse_mode='Markdown')
             
@@ -436,7 +556,23 @@ def setup_signal_handlers():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+def preload_handlers():
+    """Modo --preload: importa todos los handlers y registra cuánto tardó cada uno"""
+    start = time.perf_counter()
+    report = handler_registry.preload()
+    for item in report:
+        bot_logger.log(
+            f"Import {item['module']}: {item['seconds'] * 1000:.0f} ms ({item['modules']} módulos)",
+            "INFO"
+        )
+    bot_logger.log(f"Handlers precargados en {time.perf_counter() - start:.2f}s", "INFO")
+
 def main():
+    parser = argparse.ArgumentParser(description="Bot de enlaces directos")
+    parser.add_argument('--preload', action='store_true',
+                        help="Importar todos los handlers al arrancar (calienta selenium, cloudscraper, bs4)")
+    args = parser.parse_args()
+    
     if not TOKEN:
         bot_logger.log("ERROR: No se ha configurado el token del bot", "ERROR")
         print("ERROR: No se ha configurado el token del bot")
@@ -449,6 +585,9 @@ def main():
         bot_logger.log("Iniciando bot de Telegram con sistema avanzado...", "INFO")
         print("Iniciando bot de Telegram con sistema avanzado...")
         
+        if args.preload or PRELOAD_HANDLERS:
+            preload_handlers()
+        
         app = ApplicationBuilder().token(TOKEN).build()
         
         # Handlers de mensajes
@@ -466,7 +605,10 @@ def main():
         app.add_handler(CommandHandler("ayuda", ayuda_command))
         app.add_handler(CommandHandler("help", ayuda_command))
         
-        bot_logger.log("Bot iniciado correctamente. Sistema de colas activo.", "INFO")
+        bot_logger.log(
+            f"Bot iniciado correctamente en {time.perf_counter() - STARTUP_BEGIN:.2f}s. Sistema de colas activo.",
+            "INFO"
+        )
         print("Bot iniciado correctamente. Sistema de colas activo.")
         print("Comandos nuevos: /log, /restart, /estado, /cancelar")
         
@@ -6,6 +6,7 @@ REQUIREMENTS="requirements.txt"
 BOT_SCRIPT="main.py"
 LOG_FILE="logs/bot.log"  # Cambiado para coincidir con tu logging_handler.py
 PID_FILE="bot.pid"
+BROWSER_PID_FILE="browser.pids"  # Escrito por handlers/browser_registry.py (+ .workerN por browser_worker.py)
 PROJECT_DIR=$(pwd)
 
 # Colores para output
@@ -47,14 +48,47 @@ is_running() {
     fi
 }
 
+# Función para verificar que un PID registrado sigue siendo un proceso de Chrome
+is_tracked_browser() {
+    local COMM
+    COMM=$(ps -o comm= -p "$1" 2>/dev/null)
+    [[ "$COMM" == *chrom* ]]
+}
+
+# Función para matar solo los navegadores registrados por el bot
+cleanup_browsers() {
+    if ! compgen -G "${BROWSER_PID_FILE}*" >/dev/null; then
+        return
+    fi
+    
+    local KILLED=0
+    while read -r BPID _; do
+        if [ -n "$BPID" ] && is_tracked_browser "$BPID"; then
+            kill -TERM "$BPID" 2>/dev/null && KILLED=$((KILLED + 1))
+        fi
+    done < <(cat "$BROWSER_PID_FILE" "$BROWSER_PID_FILE".worker* 2>/dev/null)
+    
+    sleep 2
+    
+    while read -r BPID _; do
+        if [ -n "$BPID" ] && is_tracked_browser "$BPID"; then
+            kill -9 "$BPID" 2>/dev/null || true
+        fi
+    done < <(cat "$BROWSER_PID_FILE" "$BROWSER_PID_FILE".worker* 2>/dev/null)
+    
+    rm -f "$BROWSER_PID_FILE" "$BROWSER_PID_FILE".worker*
+    info "Procesos del navegador terminados: $KILLED"
+}
+
 # Función para limpiar procesos huérfanos
 cleanup_orphans() {
     info "Limpiando procesos huérfanos..."
     
     # Matar procesos Python relacionados con el bot
     pkill -f "python.*main.py" 2>/dev/null || true
-    pkill -f "chromedriver" 2>/dev/null || true
-    pkill -f "chrome.*headless" 2>/dev/null || true
+    
+    # Matar solo los navegadores lanzados por el bot (no los de otros usuarios)
+    cleanup_browsers
     
     # Limpiar archivos temporales
     rm -f $PID_FILE
@@ -240,12 +274,32 @@ case "$1" in
             error "❌ Bot NO ESTÁ CORRIENDO"
         fi
         
-        # Verificar procesos relacionados
-        CHROME_PROCESSES=$(pgrep -f chrome | wc -l)
-        DRIVER_PROCESSES=$(pgrep -f chromedriver | wc -l)
+        # Verificar navegadores registrados por el bot
+        CHROME_PROCESSES=0
+        DRIVER_PROCESSES=0
+        BROWSER_MEMORY=0
+        declare -A OWNER_MEMORY
+        if compgen -G "${BROWSER_PID_FILE}*" >/dev/null; then
+            while read -r BPID _ BOWNER; do
+                if [ -n "$BPID" ] && is_tracked_browser "$BPID"; then
+                    if [[ "$(ps -o comm= -p "$BPID")" == *chromedriver* ]]; then
+                        DRIVER_PROCESSES=$((DRIVER_PROCESSES + 1))
+                    else
+                        CHROME_PROCESSES=$((CHROME_PROCESSES + 1))
+                    fi
+                    BRSS=$(ps -o rss= -p "$BPID" 2>/dev/null | tr -d ' ')
+                    BROWSER_MEMORY=$((BROWSER_MEMORY + ${BRSS:-0}))
+                    OWNER_MEMORY[$BOWNER]=$(( ${OWNER_MEMORY[$BOWNER]:-0} + ${BRSS:-0} ))
+                fi
+            done < <(cat "$BROWSER_PID_FILE" "$BROWSER_PID_FILE".worker* 2>/dev/null)
+        fi
         
         echo "   🌐 Procesos Chrome: $CHROME_PROCESSES"
         echo "   🚗 Procesos ChromeDriver: $DRIVER_PROCESSES"
+        echo "   💾 Memoria navegadores: ${BROWSER_MEMORY}KB"
+        for BOWNER in "${!OWNER_MEMORY[@]}"; do
+            echo "      • $BOWNER: ${OWNER_MEMORY[$BOWNER]}KB"
+        done
         ;;
         
     logs)
@@ -6,13 +6,23 @@ import time
 import threading
 import subprocess
 import uuid
-from datetime import datetime
+import heapq
+from datetime import datetime, timedelta
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, Optional, Callable, Any, List
 from concurrent.futures import ThreadPoolExecutor
 import queue
 
+# Reintentos permitidos cuando un navegador se recicla por exceder su tope de memoria
+MEMORY_RETRIES = int(os.getenv("BROWSER_MEMORY_RETRIES", "1"))
+# Resoluciones HTTP asíncronas simultáneas en el event loop de la cola
+ASYNC_MAX_TASKS = int(os.getenv("ASYNC_MAX_TASKS", "200"))
+# Carpetas resueltas a la vez; corren en su propio pool para no ocupar los workers de la cola
+FOLDER_MAX_TASKS = int(os.getenv("FOLDER_MAX_TASKS", "2"))
+# Fracción de los workers que puede dedicarse a refrescar enlaces populares (0 = sin refresco)
+LINK_REFRESH_SHARE = float(os.getenv("LINK_REFRESH_SHARE", "0.34"))
+
 class TaskStatus(Enum):
     PENDING = "pending"
     PROCESSING = "processing" 
@@ -33,25 +43,60 @@ class Task:
     result: Optional[str] = None
     error: Optional[str] = None
     progress: int = 0
+    # Resultados que se entregan antes de terminar (p. ej. archivos de una carpeta)
+    partial_results: List[str] = field(default_factory=list)
+    # Intentos fallidos y momento del próximo reintento (backoff fuera de los workers)
+    attempts: int = 0
+    retry_at: Optional[datetime] = None
 
 class TaskQueue:
     """Sistema de cola de tareas con soporte para concurrencia"""
     
-    def __init__(self, max_workers: int = 3):
+    def __init__(self, max_workers: int = 3, task_timeout: int = 300):
         self.task_queue = queue.Queue()
         self.active_tasks: Dict[str, Task] = {}
         self.completed_tasks: Dict[str, Task] = {}
         self.max_workers = max_workers
+        self.task_timeout = task_timeout
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
         self.running = True
         self.lock = threading.Lock()
         
+        # Deduplicación: clave de recurso -> tarea líder en curso, y líder -> tareas en espera
+        self.inflight: Dict[str, str] = {}
+        self.followers: Dict[str, List[Task]] = {}
+        
+        # Refresco anticipado de enlaces populares: solo con la cola vacía y en parte de los workers
+        self.refresh_queue = queue.Queue()
+        self.refresh_slots = max(1, int(max_workers * LINK_REFRESH_SHARE)) if LINK_REFRESH_SHARE > 0 else 0
+        self.active_refreshes = 0
+        
         # Iniciar workers
         self.workers = []
         for i in range(max_workers):
             worker = threading.Thread(target=self._worker, args=(i,), daemon=True)
             worker.start()
             self.workers.append(worker)
+        
+        # Reintentos con backoff y esperas por sitio: la tarea espera aquí, no en un worker
+        self.delayed: List[Any] = []
+        self.retry_ready = threading.Condition()
+        self.retry_thread = threading.Thread(target=self._retry_scheduler, daemon=True)
+        self.retry_thread.start()
+        
+        # Vigilante de tareas que exceden el tiempo límite
+        self.watchdog = threading.Thread(target=self._watchdog, daemon=True)
+        self.watchdog.start()
+        
+        # Event loop para descargas con handler asíncrono: no ocupan un worker
+        self.async_slots = asyncio.Semaphore(ASYNC_MAX_TASKS)
+        self.async_futures: Dict[str, Any] = {}
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        
+        # Pool para carpetas: pueden tardar minutos recorriendo subcarpetas
+        self.folder_pool = ThreadPoolExecutor(max_workers=FOLDER_MAX_TASKS, thread_name_prefix='folder-task')
     
     def add_task(self, user_id: int, task_type: str, data: Dict[str, Any]) -> str:
         """Agrega una tarea a la cola"""
@@ -66,11 +111,31 @@ class TaskQueue:
             created_at=datetime.now()
         )
         
-        self.task_queue.put(task)
+        # El mismo recurso ya en curso: esperar su resultado en vez de resolverlo otra vez
+        key = data.get('key')
+        leader_id = None
+        with self.lock:
+            if key:
+                leader_id = self.inflight.get(key)
+                if leader_id:
+                    self.followers.setdefault(leader_id, []).append(task)
+                    self.active_tasks[task_id] = task
+                else:
+                    self.inflight[key] = task_id
+        
+        if not leader_id:
+            self.task_queue.put(task)
         
         # Loggear
         from advanced_logging import bot_logger
         bot_logger.log_request_start(user_id, data.get('url', 'N/A'), task_id)
+        if leader_id:
+            bot_logger.log(
+                f"🔗 Tarea {task_id} unida a {leader_id} (mismo recurso)",
+                "INFO",
+                user_id=user_id,
+                extra_data={'task_id': task_id, 'leader_id': leader_id, 'key': key}
+            )
         bot_logger.log(
             f"📝 Tarea agregada a la cola: {task_type}",
             "INFO",
@@ -105,16 +170,30 @@ class TaskQueue:
                 # Mover a completadas
                 del self.active_tasks[task_id]
                 self.completed_tasks[task_id] = task
-                
-                from advanced_logging import bot_logger
-                bot_logger.log(
-                    f"🚫 Tarea cancelada: {task_id}",
-                    "WARNING",
-                    user_id=task.user_id,
-                    extra_data={'task_id': task_id, 'action': 'cancel'}
-                )
-                return True
-        return False
+                future = self.async_futures.pop(task_id, None)
+                promoted = self._release_key(task)
+            else:
+                return False
+        
+        # Otras tareas esperaban este recurso: la primera pasa a resolverlo
+        if promoted is not None:
+            self.task_queue.put(promoted)
+        
+        # Cancelar la resolución asíncrona en curso
+        if future is not None:
+            future.cancel()
+        
+        # Cerrar los navegadores que la tarea haya lanzado (fuera del lock)
+        self._reap_task_browsers(task_id)
+        
+        from advanced_logging import bot_logger
+        bot_logger.log(
+            f"🚫 Tarea cancelada: {task_id}",
+            "WARNING",
+            user_id=task.user_id,
+            extra_data={'task_id': task_id, 'action': 'cancel'}
+        )
+        return True
     
     def get_queue_status(self) -> Dict[str, Any]:
         """Obtiene estado completo de la cola"""
@@ -124,12 +203,17 @@ class TaskQueue:
                 'active': len(self.active_tasks),
                 'completed': len(self.completed_tasks),
                 'active_tasks': list(self.active_tasks.keys()),
-                'max_workers': self.max_workers
+                'max_workers': self.max_workers,
+                'retrying': len(self.delayed),
+                'pending_refreshes': self.refresh_queue.qsize(),
+                'active_refreshes': self.active_refreshes
             }
     
     def _worker(self, worker_id: int):
         """Worker que procesa tareas de la cola"""
         from advanced_logging import bot_logger
+        from handlers.browser_registry import browser_registry
+        from handlers.politeness import politeness
         
         bot_logger.log(f"🔧 Worker {worker_id} iniciado", "INFO")
         
@@ -139,6 +223,8 @@ class TaskQueue:
                 try:
                     task = self.task_queue.get(timeout=1.0)
                 except queue.Empty:
+                    # Worker ocioso: aprovecharlo para refrescar un enlace por vencer
+                    self._run_refresh()
                     continue
                 
                 # Mover a tareas activas
@@ -158,8 +244,29 @@ class TaskQueue:
                     }
                 )
                 
+                # Las descargas HTTP con variante asíncrona se resuelven en el event loop
+                if self._dispatch_async(task):
+                    continue
+                
+                # Las carpetas se recorren en su propio pool y liberan este worker
+                if task.task_type == 'folder':
+                    self.folder_pool.submit(self._run_folder_task, task)
+                    continue
+                
+                # Sitio sin hueco (concurrencia, espaciado o pausa por 429): esperar fuera del worker
+                site = task.data.get('site') if task.task_type == 'download' else None
+                if site:
+                    wait = politeness.try_acquire(site)
+                    if wait > 0:
+                        self._defer(task, wait)
+                        self.task_queue.task_done()
+                        continue
+                
                 # Procesar la tarea
                 try:
+                    # Los navegadores lanzados en este hilo quedan a nombre de la tarea
+                    browser_registry.set_owner(task.id)
+                    
                     if task.task_type == 'download':
                         result = self._process_download_task(task)
                     elif task.task_type == 'command':
@@ -168,34 +275,43 @@ class TaskQueue:
                         raise Exception(f"Tipo de tarea no reconocido: {task.task_type}")
                     
                     # Tarea completada exitosamente
-                    with self.lock:
-                        task.status = TaskStatus.COMPLETED
-                        task.result = result
-                        task.completed_at = datetime.now()
-                        
-                        # Mover a completadas
-                        if task.id in self.active_tasks:
-                            del self.active_tasks[task.id]
-                        self.completed_tasks[task.id] = task
-                    
-                    bot_logger.log_request_success(task.id, result)
+                    self._complete_task(task, result)
                     
                 except Exception as e:
-                    # Tarea falló
-                    with self.lock:
-                        task.status = TaskStatus.FAILED
-                        task.error = str(e)
-                        task.completed_at = datetime.now()
+                    # Si el navegador fue reciclado por exceso de memoria, reintentar la tarea
+                    if (browser_registry.consume_recycled(task.id) and
+                            task.data.get('memory_retries', 0) < MEMORY_RETRIES):
+                        task.data['memory_retries'] = task.data.get('memory_retries', 0) + 1
+                        # Sigue en active_tasks (PENDING) y como líder de su clave: se puede cancelar
+                        # y sus seguidores reciben el resultado del reintento
+                        with self.lock:
+                            if task.status == TaskStatus.CANCELLED:
+                                continue
+                            task.status = TaskStatus.PENDING
+                            task.started_at = None
+                        self.task_queue.put(task)
                         
-                        # Mover a completadas
-                        if task.id in self.active_tasks:
-                            del self.active_tasks[task.id]
-                        self.completed_tasks[task.id] = task
+                        bot_logger.log(
+                            f"♻️ Navegador reciclado por memoria, reintentando tarea: {task.id}",
+                            "WARNING",
+                            user_id=task.user_id,
+                            extra_data={'task_id': task.id, 'action': 'memory_retry'}
+                        )
+                        continue
                     
-                    bot_logger.log_request_error(task.id, str(e))
-                    bot_logger.log_exception(e, f"Worker {worker_id} - Task {task.id}", task.user_id)
+                    # Tarea falló: las descargas con error transitorio se reprograman
+                    if task.task_type == 'download':
+                        self._retry_or_fail(task, e, f"Worker {worker_id} - Task {task.id}")
+                    else:
+                        self._fail_task(task, e, f"Worker {worker_id} - Task {task.id}")
                 
                 finally:
+                    if site:
+                        politeness.release(site)
+                    browser_registry.reap_owner(task.id)
+                    # Un reciclaje del que el handler se recuperó no debe quedar marcado para siempre
+                    browser_registry.consume_recycled(task.id)
+                    browser_registry.clear_owner()
                     self.task_queue.task_done()
             
             except Exception as e:
@@ -204,9 +320,264 @@ class TaskQueue:
         
         bot_logger.log(f"🛑 Worker {worker_id} detenido", "INFO")
     
+    def _complete_task(self, task: Task, result: str):
+        """Marca una tarea (y las que esperaban el mismo recurso) como completada"""
+        from advanced_logging import bot_logger
+        
+        with self.lock:
+            # Cancelada mientras se resolvía: el resultado ya no se entrega
+            if task.status == TaskStatus.CANCELLED:
+                return
+            finished = [task] + self._settle_followers(task)
+            for t in finished:
+                if t is not task:
+                    t.partial_results = list(task.partial_results)
+                t.status = TaskStatus.COMPLETED
+                t.result = result
+                t.progress = 100
+                t.completed_at = datetime.now()
+                
+                # Mover a completadas
+                self.active_tasks.pop(t.id, None)
+                self.completed_tasks[t.id] = t
+        
+        for t in finished:
+            bot_logger.log_request_success(t.id, result)
+    
+    def _fail_task(self, task: Task, error: Exception, context: str):
+        """Marca una tarea (y las que esperaban el mismo recurso) como fallida"""
+        from advanced_logging import bot_logger
+        
+        with self.lock:
+            if task.status == TaskStatus.CANCELLED:
+                return
+            finished = [task] + self._settle_followers(task)
+            for t in finished:
+                t.status = TaskStatus.FAILED
+                t.error = str(error)
+                t.completed_at = datetime.now()
+                
+                # Mover a completadas
+                self.active_tasks.pop(t.id, None)
+                self.completed_tasks[t.id] = t
+        
+        for t in finished:
+            bot_logger.log_request_error(t.id, str(error))
+        bot_logger.log_exception(error, context, task.user_id)
+    
+    def _settle_followers(self, task: Task) -> List[Task]:
+        """Libera la clave de la tarea líder y devuelve las tareas que esperaban su resultado (con lock)"""
+        key = task.data.get('key')
+        if key and self.inflight.get(key) == task.id:
+            del self.inflight[key]
+        return [t for t in self.followers.pop(task.id, []) if t.status == TaskStatus.PENDING]
+    
+    def _release_key(self, task: Task) -> Optional[Task]:
+        """
+        Quita una tarea cancelada de la deduplicación (con lock)
+        
+        Si era la líder, la primera tarea en espera pasa a ser la nueva líder y
+        se devuelve para encolarla; las demás quedan esperando a esa.
+        """
+        key = task.data.get('key')
+        if not key:
+            return None
+        
+        leader_id = self.inflight.get(key)
+        if leader_id != task.id:
+            # Era una tarea en espera: dejar de esperarla
+            waiting = self.followers.get(leader_id, [])
+            if task in waiting:
+                waiting.remove(task)
+            return None
+        
+        waiting = [t for t in self.followers.pop(task.id, []) if t.status == TaskStatus.PENDING]
+        if not waiting:
+            del self.inflight[key]
+            return None
+        
+        promoted = waiting[0]
+        self.inflight[key] = promoted.id
+        if waiting[1:]:
+            self.followers[promoted.id] = waiting[1:]
+        return promoted
+    
+    def _dispatch_async(self, task: Task) -> bool:
+        """Programa la tarea en el event loop si su handler tiene variante asíncrona"""
+        from handlers import supports_async
+        
+        if task.task_type != 'download' or not supports_async(task.data.get('url', '')):
+            return False
+        
+        future = asyncio.run_coroutine_threadsafe(self._process_download_task_async(task), self.loop)
+        with self.lock:
+            self.async_futures[task.id] = future
+        return True
+    
+    async def _process_download_task_async(self, task: Task):
+        """Procesa una descarga HTTP en el event loop, sin ocupar un hilo worker"""
+        from handlers import aget_direct_link
+        from handlers.politeness import politeness
+        from handlers.retry import queue_attempt
+        
+        site = task.data.get('site')
+        try:
+            # Esperar el hueco del sitio en el event loop, antes de ocupar un hueco asíncrono
+            while site:
+                wait = politeness.try_acquire(site)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            
+            try:
+                async with self.async_slots:
+                    task.progress = 10
+                    with queue_attempt(task.attempts):
+                        result = await asyncio.wait_for(
+                            aget_direct_link(task.data['url']), timeout=self.task_timeout
+                        )
+                    task.progress = 100
+                    self._complete_task(task, result)
+            except asyncio.TimeoutError:
+                self._fail_task(task, Exception(f"Timeout después de {self.task_timeout}s"), f"Async - Task {task.id}")
+            except Exception as e:
+                self._retry_or_fail(task, e, f"Async - Task {task.id}")
+            finally:
+                if site:
+                    politeness.release(site)
+        finally:
+            with self.lock:
+                self.async_futures.pop(task.id, None)
+            self.task_queue.task_done()
+    
+    def _retry_or_fail(self, task: Task, error: Exception, context: str):
+        """Reprograma la descarga con backoff si el error es transitorio; si no, la marca como fallida"""
+        from advanced_logging import bot_logger
+        from handlers.retry import retry_policy
+        from handlers.politeness import politeness
+        
+        # Un 429 o un Retry-After pausan el sitio entero, no solo esta tarea
+        if task.data.get('site'):
+            politeness.note_failure(task.data['site'], error)
+        
+        task.attempts += 1
+        elapsed = (datetime.now() - task.created_at).total_seconds()
+        delay = retry_policy.next_delay(error, task.attempts, elapsed)
+        if delay is None:
+            self._fail_task(task, error, context)
+            return
+        
+        task.retry_at = datetime.now() + timedelta(seconds=delay)
+        if not self._defer(task, delay):
+            return
+        
+        bot_logger.log(
+            f"🔁 Tarea {task.id} reprogramada en {delay:.1f}s (intento {task.attempts + 1}): {error}",
+            "WARNING",
+            user_id=task.user_id,
+            extra_data={'task_id': task.id, 'action': 'retry', 'attempt': task.attempts + 1, 'delay': round(delay, 1)}
+        )
+    
+    def _defer(self, task: Task, delay: float) -> bool:
+        """Deja la tarea en espera delay segundos sin ocupar un worker (False si fue cancelada)"""
+        with self.lock:
+            if task.status == TaskStatus.CANCELLED:
+                return False
+            task.status = TaskStatus.PENDING
+            task.started_at = None
+        
+        with self.retry_ready:
+            heapq.heappush(self.delayed, (time.time() + delay, task.id, task))
+            self.retry_ready.notify()
+        return True
+    
+    def _retry_scheduler(self):
+        """Devuelve a la cola las tareas cuyo backoff o espera de sitio terminó"""
+        while self.running:
+            with self.retry_ready:
+                if not self.delayed:
+                    self.retry_ready.wait(timeout=1.0)
+                    continue
+                due, _, task = self.delayed[0]
+                remaining = due - time.time()
+                if remaining > 0:
+                    self.retry_ready.wait(timeout=min(remaining, 1.0))
+                    continue
+                heapq.heappop(self.delayed)
+            
+            # Cancelada durante la espera: ya está en completadas
+            if task.status == TaskStatus.CANCELLED:
+                continue
+            task.retry_at = None
+            self.task_queue.put(task)
+    
+    def _run_refresh(self):
+        """Refresca un enlace popular si hay un hueco de refresco libre (y hueco en su sitio)"""
+        from handlers.link_store import link_store
+        from handlers.politeness import politeness
+        
+        with self.lock:
+            if self.active_refreshes >= self.refresh_slots:
+                return
+            try:
+                match = self.refresh_queue.get_nowait()
+            except queue.Empty:
+                return
+            
+            # El sitio está ocupado o en pausa: volver a intentarlo con el próximo worker ocioso
+            if politeness.try_acquire(match.spec.key) > 0:
+                self.refresh_queue.put(match)
+                return
+            self.active_refreshes += 1
+        
+        try:
+            link_store.refresh(match)
+        finally:
+            politeness.release(match.spec.key)
+            with self.lock:
+                self.active_refreshes -= 1
+    
+    def _watchdog(self):
+        """Mata los navegadores de tareas que superan task_timeout y programa refrescos"""
+        from advanced_logging import bot_logger
+        from handlers.link_store import link_store
+        
+        while self.running:
+            time.sleep(5)
+            try:
+                if self.refresh_slots:
+                    for match in link_store.due_for_refresh():
+                        self.refresh_queue.put(match)
+                
+                now = datetime.now()
+                with self.lock:
+                    expired = [
+                        task for task in self.active_tasks.values()
+                        if task.started_at and (now - task.started_at).total_seconds() > self.task_timeout
+                    ]
+                
+                for task in expired:
+                    if self._reap_task_browsers(task.id):
+                        bot_logger.log(
+                            f"⏰ Tarea {task.id} excedió {self.task_timeout}s, navegadores terminados",
+                            "WARNING",
+                            user_id=task.user_id,
+                            extra_data={'task_id': task.id, 'action': 'timeout'}
+                        )
+            except Exception as e:
+                bot_logger.log_exception(e, "TaskQueue watchdog")
+    
+    def _reap_task_browsers(self, task_id: str) -> int:
+        """Mata los navegadores de una tarea, tanto locales como en los workers de navegador"""
+        from handlers.browser_registry import browser_registry
+        from browser_worker import browser_workers
+        
+        return browser_registry.reap_owner(task_id) + browser_workers.reap_owner(task_id)
+    
     def _process_download_task(self, task: Task) -> str:
         """Procesa una tarea de descarga"""
         from handlers import get_direct_link
+        from handlers.retry import queue_attempt
         
         url = task.data.get('url')
         if not url:
@@ -215,12 +586,54 @@ class TaskQueue:
         # Actualizar progreso
         task.progress = 10
         
-        # Obtener enlace directo
-        direct_link = get_direct_link(url)
+        # Obtener enlace directo (los handlers ven el intento de la cola en curso)
+        with queue_attempt(task.attempts):
+            direct_link = get_direct_link(url)
         
         task.progress = 100
         return direct_link
     
+    def _run_folder_task(self, task: Task):
+        """Ejecuta una tarea de carpeta en el pool de carpetas"""
+        try:
+            result = self._process_folder_task(task)
+            self._complete_task(task, result)
+        except Exception as e:
+            self._fail_task(task, e, f"Folder - Task {task.id}")
+        finally:
+            self.task_queue.task_done()
+    
+    def _process_folder_task(self, task: Task) -> str:
+        """Resuelve una carpeta MediaFire publicando cada archivo en partial_results al llegar"""
+        from handlers import resolve_mediafire_folder
+        
+        url = task.data.get('url')
+        if not url:
+            raise Exception("URL no proporcionada")
+        
+        task.progress = 10
+        resolved, failed = 0, 0
+        items = resolve_mediafire_folder(url)
+        try:
+            for item in items:
+                if task.status == TaskStatus.CANCELLED:
+                    break
+                if 'link' in item:
+                    resolved += 1
+                    task.partial_results.append(f"{item['name']}: {item['link']}")
+                else:
+                    failed += 1
+                    task.partial_results.append(f"{item['name']}: ❌ {item['error']}")
+        finally:
+            # Cerrar el generador detiene el recorrido y las resoluciones pendientes
+            items.close()
+        
+        if not resolved and not failed:
+            raise Exception("La carpeta está vacía o no se pudo listar")
+        
+        task.progress = 100
+        return f"Carpeta procesada: {resolved} archivos resueltos, {failed} con error"
+    
     def _process_command_task(self, task: Task) -> str:
         """Procesa una tarea de comando"""
         command = task.data.get('command')
@@ -245,6 +658,21 @@ class TaskQueue:
         for worker in self.workers:
             worker.join(timeout=5.0)
         
+        # Cerrar navegadores que hayan quedado vivos (locales y de los workers)
+        from handlers.browser_registry import browser_registry
+        from browser_worker import browser_workers
+        browser_registry.reap_all()
+        browser_workers.shutdown()
+        
+        # Cerrar la sesión HTTP compartida y detener el event loop
+        from handlers.async_http import close_session
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), self.loop).result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        
+        self.folder_pool.shutdown(wait=False, cancel_futures=True)
         self.executor.shutdown(wait=True)
         bot_logger.log("✅ Sistema de colas detenido", "INFO")
 
@@ -298,37 +726,19 @@ class BotRestartManager:
             self.restart_in_progress = False
     
     async def _cleanup_browser_processes(self):
-        """Limpia procesos de Chrome y ChromeDriver"""
-        import psutil
+        """Limpia los procesos de Chrome y ChromeDriver lanzados por el bot"""
         from advanced_logging import bot_logger
-        
-        processes_killed = 0
+        from handlers.browser_registry import browser_registry
+        from browser_worker import browser_workers
         
         try:
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                try:
-                    proc_info = proc.info
-                    proc_name = proc_info['name'].lower()
-                    cmdline = ' '.join(proc_info.get('cmdline', [])).lower()
-                    
-                    # Identificar procesos relacionados con Chrome/ChromeDriver
-                    if any(keyword in proc_name for keyword in ['chrome', 'chromedriver']):
-                        # Verificar que sea del bot (buscar patrones específicos)
-                        if any(pattern in cmdline for pattern in ['headless', 'no-sandbox', 'disable-dev-shm-usage']):
-                            bot_logger.log(f"Terminando proceso: {proc_name} (PID: {proc_info['pid']})", "DEBUG")
-                            proc.terminate()
-                            processes_killed += 1
-                            
-                            # Esperar un poco antes de forzar
-                            try:
-                                proc.wait(timeout=3)
-                            except psutil.TimeoutExpired:
-                                proc.kill()
-                                bot_logger.log(f"Proceso forzado: {proc_name}", "DEBUG")
-                
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    continue
+            # Los workers de navegador matan sus propios navegadores al detenerse
+            await asyncio.get_running_loop().run_in_executor(None, browser_workers.shutdown)
             
+            # Solo se matan los árboles de procesos registrados, no otros navegadores del host
+            processes_killed = await asyncio.get_running_loop().run_in_executor(
+                None, browser_registry.reap_all
+            )
             bot_logger.log(f"Procesos del navegador terminados: {processes_killed}", "INFO")
             
         except Exception as e:
@@ -0,0 +1,26 @@
+import os
+import sys
+import time
+
+import pytest
+
+# Las pruebas importan los módulos del bot (handlers, task_queue_system) desde la raíz del repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Clock:
+    """Reloj manual: las pruebas avanzan `now` en lugar de dormir"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Los módulos usan time.time() del módulo global, así que basta con parchearlo una vez
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
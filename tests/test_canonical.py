@@ -0,0 +1,95 @@
+import pytest
+
+from handlers.canonical import resource_key, clean_query
+
+
+def test_clean_query_drops_tracking_and_sorts():
+    assert clean_query('utm_source=tg&b=2&fbclid=x&a=1') == 'a=1&b=2'
+    assert clean_query('') == ''
+
+
+def test_clean_query_matches_exact_names():
+    assert clean_query('sig=1&signature=2&size=3&site=4&refresh=5&si=x&ref=y') == 'refresh=5&sig=1&signature=2&site=4&size=3'
+    assert clean_query('abc123xyz') == 'abc123xyz'
+
+
+@pytest.mark.parametrize('url', [
+    'https://google-drive.uptodown.com/android',
+    'https://google-drive.uptodown.com/android/',
+    'https://google-drive.uptodown.com/android/download',
+    'https://google-drive.uptodown.com/android/download/',
+    'https://google-drive.es.uptodown.com/android/download',
+    'https://www.google-drive.uptodown.com//android',
+])
+def test_uptodown_variants_share_key(url):
+    assert resource_key('uptodown', url) == 'uptodown:google-drive:/android'
+
+
+def test_uptodown_version_ids_do_not_collide():
+    # /download/<id> apunta a una versión concreta: no es la misma tarea que la última versión
+    latest = resource_key('uptodown', 'https://google-drive.uptodown.com/android/download')
+    v1 = resource_key('uptodown', 'https://google-drive.uptodown.com/android/download/1001')
+    v2 = resource_key('uptodown', 'https://google-drive.uptodown.com/android/download/1002')
+    assert len({latest, v1, v2}) == 3
+    assert v1 == 'uptodown:google-drive:/android/download/1001'
+    assert v1 == resource_key('uptodown', 'https://google-drive.en.uptodown.com/android/download/1001/')
+
+
+def test_uptodown_apps_do_not_collide():
+    assert (resource_key('uptodown', 'https://google-drive.uptodown.com/android')
+            != resource_key('uptodown', 'https://whatsapp.uptodown.com/android'))
+
+
+@pytest.mark.parametrize('url', [
+    'https://a2zapk.io/1383009-spotify-premium/',
+    'https://a2zapk.io/1383009-spotify-premium',
+    'https://a2zapk.io/dload/1383009/',
+    'https://www.a2zapk.io/dload/1383009',
+])
+def test_a2zapk_page_and_dload_share_id(url):
+    assert resource_key('a2zapk', url) == 'a2zapk:id:1383009'
+
+
+def test_a2zapk_without_id_uses_path():
+    assert resource_key('a2zapk', 'https://a2zapk.io/Spotify/') == 'a2zapk:/spotify'
+    assert resource_key('a2zapk', 'https://a2zapk.io/dload/1/') != resource_key('a2zapk', 'https://a2zapk.io/dload/2/')
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.mediafire.com/file/AbC123/app.apk/file',
+    'https://mediafire.com/download/abc123',
+    'https://www.mediafire.com/view/abc123/app.apk',
+    'https://www.mediafire.com/?abc123',
+])
+def test_mediafire_file_id(url):
+    assert resource_key('mediafire', url) == 'mediafire:file:abc123'
+
+
+def test_mediafire_folder():
+    assert resource_key('mediafire', 'https://www.mediafire.com/folder/XYZ9/apps') == 'mediafire:folder:xyz9'
+
+
+def test_app_sites_strip_bare_download():
+    assert resource_key('apkdone', 'https://apkdone.com/Spotify/download/') == 'apkdone:/spotify'
+    assert resource_key('apk4free', 'https://apk4free.net/spotify/') == 'apk4free:/spotify'
+
+
+def test_megaup_id():
+    assert resource_key('megaup', 'https://megaup.net/2Xk9/app.apk') == 'megaup:2Xk9'
+
+
+def test_filmaffinity_film_id():
+    es = resource_key('filmaffinity', 'https://www.filmaffinity.com/es/film123456.html')
+    en = resource_key('filmaffinity', 'https://m.filmaffinity.com/en/film123456.html')
+    assert es == en
+
+
+def test_unknown_site_falls_back_to_host_and_path():
+    key = resource_key('other', 'https://www.example.com//a/b/?utm_source=x&z=1')
+    assert key == 'other:example.com/a/b?z=1'
+
+
+def test_cache_key_keeps_real_params():
+    from handlers.http_cache import cache_key
+    assert cache_key('https://apkdone.com/a?size=1') != cache_key('https://apkdone.com/a?size=2')
+    assert cache_key('https://apkdone.com/a?utm_source=x&fbclid=y') == cache_key('https://apkdone.com/a')
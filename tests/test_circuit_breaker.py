@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+
+from handlers.circuit_breaker import (
+    CircuitBreaker, SiteUnavailableError, RecentFailureError, ResourceUnavailable, CLOSED, OPEN, HALF_OPEN
+)
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, open_seconds=60, max_open_seconds=200,
+                          half_open_probes=1, negative_ttl=120)
+
+
+def match(n=0, site='apkdone'):
+    return SimpleNamespace(key=f"{site}:/app-{n}", spec=SimpleNamespace(key=site))
+
+
+def state(breaker, site='apkdone'):
+    return breaker.stats()['sites'][site]['state']
+
+
+def fail(breaker, times, site='apkdone'):
+    for n in range(times):
+        breaker.check(match(n, site))
+        breaker.record_failure(match(n, site), Exception('HTTP 503'), remember=False)
+
+
+def test_opens_after_threshold(breaker):
+    fail(breaker, 2)
+    assert state(breaker) == CLOSED
+    fail(breaker, 1)
+    assert state(breaker) == OPEN
+    with pytest.raises(SiteUnavailableError):
+        breaker.check(match(99))
+
+
+def test_success_resets_failures(breaker):
+    fail(breaker, 2)
+    breaker.record_success(match())
+    fail(breaker, 2)
+    assert state(breaker) == CLOSED
+
+
+def test_sites_are_independent(breaker):
+    fail(breaker, 3)
+    breaker.check(match(site='uptodown'))
+
+
+def test_half_open_admits_one_probe(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 61
+    breaker.check(match())
+    assert state(breaker) == HALF_OPEN
+    with pytest.raises(SiteUnavailableError):
+        breaker.check(match(1))
+
+
+def test_successful_probe_closes(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 61
+    breaker.check(match())
+    breaker.record_success(match())
+    assert state(breaker) == CLOSED
+    breaker.check(match(1))
+
+
+def test_failed_probe_reopens_for_longer(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 61
+    breaker.check(match())
+    breaker.record_failure(match(), Exception('timeout'), remember=False)
+    assert state(breaker) == OPEN
+    assert breaker.stats()['sites']['apkdone']['retry_in'] == 120
+
+    clock.now += 61
+    with pytest.raises(SiteUnavailableError):
+        breaker.check(match())
+
+    # El tiempo de apertura se duplica hasta el máximo
+    clock.now += 60
+    breaker.check(match())
+    breaker.record_failure(match(), Exception('timeout'), remember=False)
+    assert breaker.stats()['sites']['apkdone']['retry_in'] == 200
+
+
+def test_released_probe_frees_slot(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 61
+    breaker.check(match())
+    breaker.release_probe(match())
+    breaker.check(match(1))
+
+
+def test_resource_unavailable_does_not_trip_circuit(breaker):
+    for n in range(5):
+        breaker.record_failure(match(n), ResourceUnavailable('archivo eliminado'))
+    assert state(breaker) == CLOSED
+
+
+def test_resource_unavailable_closes_half_open(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 61
+    breaker.check(match(7))
+    breaker.record_failure(match(7), ResourceUnavailable('archivo eliminado'))
+    assert state(breaker) == CLOSED
+
+
+def test_negative_cache(breaker, clock):
+    breaker.record_failure(match(), ResourceUnavailable('archivo eliminado'))
+    with pytest.raises(RecentFailureError, match='archivo eliminado'):
+        breaker.check(match())
+    breaker.check(match(1))
+
+    clock.now += 121
+    breaker.check(match())
+
+
+def test_transient_failures_not_remembered(breaker):
+    breaker.record_failure(match(), Exception('timeout'), remember=False)
+    breaker.check(match())
+    assert breaker.stats()['negative_entries'] == 0
+
+
+def test_own_errors_are_ignored(breaker):
+    for _ in range(5):
+        breaker.record_failure(match(), SiteUnavailableError('abierto'))
+    breaker.check(match())
+    assert state(breaker) == CLOSED
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import deque
+
+import pytest
+
+from handlers.hedging import Hedger, hedge_sleep
+
+
+@pytest.fixture
+def hedger():
+    hedger = Hedger(sites=('site',), min_samples=1, max_workers=4)
+    hedger._latencies['site'] = deque([0.05])
+    yield hedger
+    hedger.executor.shutdown(wait=False)
+
+
+def test_losing_attempt_is_cancelled_at_next_sleep(hedger):
+    calls = []
+    loser_exited = threading.Event()
+
+    def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            try:
+                hedge_sleep(30)
+            finally:
+                loser_exited.set()
+            return 'slow'
+        return 'fast'
+
+    assert hedger.run('site', attempt) == 'fast'
+    assert loser_exited.wait(2)
+    assert hedger.stats()['site']['backup_wins'] == 1
+
+
+def test_fast_failure_is_not_hedged(hedger):
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        hedger.run('site', attempt)
+    assert len(calls) == 1
+
+
+def test_saturated_pool_resolves_inline(hedger):
+    release = threading.Event()
+    blockers = [hedger.executor.submit(release.wait) for _ in range(3)]
+    hedger._busy = 3
+    try:
+        caller = threading.get_ident()
+        assert hedger.run('site', lambda: threading.get_ident()) == caller
+        assert hedger.stats()['site']['saturated'] == 1
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result()
+
+
+def test_pool_slots_are_released(hedger):
+    hedger.run('site', lambda: 'ok')
+    deadline = time.time() + 2
+    while hedger._busy and time.time() < deadline:
+        time.sleep(0.01)
+    assert hedger._busy == 0
+
+
+def test_hedge_sleep_outside_hedger_just_sleeps():
+    start = time.time()
+    hedge_sleep(0.01)
+    assert time.time() - start >= 0.01
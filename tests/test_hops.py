@@ -0,0 +1,155 @@
+import importlib
+import json
+import os
+import threading
+
+import pytest
+
+from handlers.hops import HopTemplates, template_for, url_tokens
+
+SOURCE = 'https://liteapks.com/spotify-2.html'
+TARGET = 'https://liteapks.com/download/spotify-2'
+
+
+@pytest.fixture
+def templates(tmp_path):
+    return HopTemplates(path=str(tmp_path / 'hops.json'), min_confirmations=3)
+
+
+def test_url_tokens():
+    tokens = url_tokens(SOURCE)
+    assert tokens['host'] == 'liteapks.com'
+    assert tokens['slug'] == 'spotify-2'
+    assert tokens['path'] == '/spotify-2'
+
+
+def test_template_for():
+    assert template_for(SOURCE, TARGET) == '{scheme}://{host}/download{path}'
+    # Sin piezas de la URL de origen no hay plantilla
+    assert template_for(SOURCE, 'https://liteapks.com/download/other') is None
+
+
+def test_derive_needs_confirmations(templates):
+    for _ in range(2):
+        templates.learn('liteapks', SOURCE, TARGET)
+        assert templates.derive('liteapks', SOURCE) is None
+
+    templates.learn('liteapks', SOURCE, TARGET)
+    assert templates.derive('liteapks', 'https://liteapks.com/netflix-7.html') == 'https://liteapks.com/download/netflix-7'
+    assert templates.stats()['liteapks']['skipped'] == 1
+
+
+def test_changed_template_restarts_confirmations(templates):
+    for _ in range(3):
+        templates.learn('liteapks', SOURCE, TARGET)
+    templates.learn('liteapks', SOURCE, 'https://liteapks.com/get/spotify-2')
+    assert templates.stats()['liteapks']['confirmations'] == 1
+    assert templates.derive('liteapks', SOURCE) is None
+
+
+def test_record_failure_distrusts_template(templates):
+    for _ in range(3):
+        templates.learn('liteapks', SOURCE, TARGET)
+    templates.record_failure('liteapks')
+    assert templates.derive('liteapks', SOURCE) is None
+    assert templates.stats()['liteapks']['failures'] == 1
+
+
+def test_record_failure_unknown_hop(templates, tmp_path):
+    templates.record_failure('liteapks')
+    assert templates.stats() == {}
+    assert not (tmp_path / 'hops.json').exists()
+
+
+def test_persisted_between_instances(templates, tmp_path):
+    for _ in range(3):
+        templates.learn('liteapks', SOURCE, TARGET)
+    reloaded = HopTemplates(path=str(tmp_path / 'hops.json'), min_confirmations=3)
+    assert reloaded.derive('liteapks', SOURCE) == TARGET
+
+
+def test_saves_only_on_change(templates, monkeypatch):
+    saves = []
+    monkeypatch.setattr(templates, '_save', lambda: saves.append(1))
+
+    templates.learn('liteapks', SOURCE, TARGET)      # plantilla nueva
+    templates.learn('liteapks', SOURCE, TARGET)
+    templates.learn('liteapks', SOURCE, TARGET)      # se vuelve confiable
+    for _ in range(10):
+        templates.learn('liteapks', SOURCE, TARGET)
+    assert len(saves) == 2
+
+    templates.learn('liteapks', SOURCE, 'https://liteapks.com/get/spotify-2')
+    assert len(saves) == 3
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / 'hops.json'
+    path.write_text('{not json')
+    assert HopTemplates(path=str(path)).stats() == {}
+
+
+def test_file_is_json(templates, tmp_path):
+    templates.learn('liteapks', SOURCE, TARGET)
+    data = json.loads((tmp_path / 'hops.json').read_text())
+    assert data['liteapks']['template'] == '{scheme}://{host}/download{path}'
+
+
+def test_concurrent_saves_do_not_collide(templates, tmp_path, monkeypatch):
+    hops = importlib.import_module('handlers.hops')
+    real_replace = os.replace
+    barrier = threading.Barrier(2, timeout=5)
+    replaced = []
+
+    def replace(src, dst):
+        # Ambos hilos escriben su temporal antes de que ninguno lo renombre
+        barrier.wait()
+        real_replace(src, dst)
+        replaced.append(src)
+
+    monkeypatch.setattr(hops.os, 'replace', replace)
+    threads = [threading.Thread(target=templates._save) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(replaced)) == 2
+    assert list(tmp_path.glob('*.tmp')) == []
+
+
+class _Response:
+    def __init__(self, url):
+        self.url = url
+        self.text = ''
+
+    def raise_for_status(self):
+        pass
+
+
+def test_liteapks_falls_back_to_full_chain_in_same_call(templates, monkeypatch):
+    pytest.importorskip('cloudscraper')
+    pytest.importorskip('bs4')
+    from handlers import liteapks
+
+    for _ in range(3):
+        templates.learn('liteapks', SOURCE, TARGET)
+    monkeypatch.setattr(liteapks, 'hop_templates', templates)
+    monkeypatch.setattr(liteapks.time, 'sleep', lambda seconds: None)
+
+    # Con la plantilla derivada la tercera página no trae enlace; con la cadena completa sí
+    requested = []
+
+    class Scraper:
+        def get(self, url, **kwargs):
+            requested.append(url)
+            return _Response(url)
+
+    monkeypatch.setattr(liteapks.LiteAPKsHandler, '_find_download_button', staticmethod(lambda soup: '/download/spotify-2'))
+    monkeypatch.setattr(liteapks, 'parsed_page', lambda response: response)
+    monkeypatch.setattr(liteapks.LiteAPKsHandler, '_extract_direct_link',
+                        staticmethod(lambda page: 'https://cdn/app.apk' if TARGET in requested else None))
+
+    assert liteapks.LiteAPKsHandler.get_direct_link(SOURCE, retries=1, scraper=Scraper()) == 'https://cdn/app.apk'
+    assert SOURCE in requested and TARGET in requested
+    assert templates.stats()['liteapks']['failures'] == 1
@@ -0,0 +1,87 @@
+import pytest
+
+from handlers.http_cache import HTTPCache, CachedSession
+from handlers.streaming import stream_page
+
+
+class Response:
+    def __init__(self, url, body=b'', status_code=200, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers or {'Content-Type': 'text/html', 'ETag': '"v1"'}
+        self.content = body
+        self.encoding = 'utf-8'
+
+    def iter_content(self, chunk_size=16384):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Session:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, dict(headers or {})))
+        if headers and headers.get('If-None-Match') == '"v1"':
+            return Response(url, status_code=304, headers={})
+        return Response(url, self.pages[url])
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HTTPCache(directory=str(tmp_path), freshness={'apkdone.com': 900, 'uptodown.com': 300})
+
+
+def test_fresh_entry_served_without_network(cache):
+    session = Session({'https://apkdone.com/app/': b'<html>info</html>'})
+    cache.get(session, 'https://apkdone.com/app/')
+    response = cache.get(session, 'https://apkdone.com/app/')
+    assert response.from_cache and response.text == '<html>info</html>'
+    assert len(session.requests) == 1
+
+
+def test_download_pages_skip_site_freshness(cache):
+    url = 'https://app.uptodown.com/android/download'
+    session = Session({url: b'<html>token=abc</html>'})
+    cache.get(session, url)
+    response = cache.get(session, url)
+    # Vencida al instante: se revalida (304) en vez de servir el token viejo sin preguntar
+    assert response.revalidated
+    assert session.requests[-1][1]['If-None-Match'] == '"v1"'
+
+
+def test_complete_streamed_page_is_stored(cache):
+    url = 'https://apkdone.com/app/'
+    body = b'<html>' + b'x' * 50000 + b'</html>'
+    session = Session({url: body})
+    scraper = CachedSession(session, cache)
+
+    page = stream_page(scraper, url, 'apkdone', match_anchor=lambda attrs, text: None, chunk_size=4096)
+    assert page.complete and page.link is None
+
+    cached = cache.get(session, url)
+    assert cached.from_cache and cached.content == body
+    assert len(session.requests) == 1
+
+
+def test_streamed_page_cut_early_is_not_stored(cache):
+    url = 'https://apkdone.com/app/'
+    body = b'<html><a href="https://cdn/app.apk">Download</a>' + b'x' * 50000 + b'</html>'
+    scraper = CachedSession(Session({url: body}), cache)
+
+    page = stream_page(scraper, url, 'apkdone', match_anchor=lambda attrs, text: attrs['href'], chunk_size=4096)
+    assert page.link == 'https://cdn/app.apk' and not page.complete
+    assert cache.lookup(url)[1] is None
+
+
+def test_covers_only_configured_sites(cache):
+    assert cache.covers('https://es.uptodown.com/x')
+    assert not cache.covers('https://www.mediafire.com/api/1.5/file/get_links.php')
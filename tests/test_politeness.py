@@ -0,0 +1,94 @@
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+from handlers.politeness import PolitenessScheduler, POLITENESS_POLL_INTERVAL
+
+module = importlib.import_module('handlers.politeness')
+
+
+@pytest.fixture
+def scheduler(clock):
+    return PolitenessScheduler(max_concurrency=2, min_interval=1.0, site_limits={'megaup': (1, 3.0)})
+
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+def test_min_interval_between_starts(scheduler, clock):
+    assert scheduler.try_acquire('apkdone') == 0
+    assert scheduler.try_acquire('apkdone') == pytest.approx(1.0)
+    clock.now += 0.4
+    assert scheduler.try_acquire('apkdone') == pytest.approx(0.6)
+    clock.now += 0.6
+    assert scheduler.try_acquire('apkdone') == 0
+
+
+def test_concurrency_limit(scheduler, clock):
+    for _ in range(2):
+        assert scheduler.try_acquire('apkdone') == 0
+        clock.now += 1
+    assert scheduler.try_acquire('apkdone') == POLITENESS_POLL_INTERVAL
+
+    scheduler.release('apkdone')
+    assert scheduler.try_acquire('apkdone') == 0
+
+
+def test_site_limits_override_defaults(scheduler, clock):
+    assert scheduler.try_acquire('megaup') == 0
+    clock.now += 5
+    assert scheduler.try_acquire('megaup') == POLITENESS_POLL_INTERVAL
+    scheduler.release('megaup')
+    assert scheduler.try_acquire('megaup') == 0
+    scheduler.release('megaup')
+    assert scheduler.try_acquire('megaup') == pytest.approx(3.0)
+
+
+def test_sites_are_independent(scheduler):
+    assert scheduler.try_acquire('apkdone') == 0
+    assert scheduler.try_acquire('uptodown') == 0
+
+
+def test_release_never_goes_negative(scheduler):
+    scheduler.release('apkdone')
+    assert scheduler.stats()['apkdone']['active'] == 0
+
+
+def test_pause_blocks_site(scheduler, clock):
+    scheduler.pause('apkdone', 20)
+    assert scheduler.try_acquire('apkdone') == pytest.approx(20)
+    clock.now += 20
+    assert scheduler.try_acquire('apkdone') == 0
+
+
+def test_pause_is_capped(scheduler):
+    scheduler.pause('apkdone', 10 ** 6)
+    assert scheduler.try_acquire('apkdone') == pytest.approx(module.POLITENESS_MAX_PAUSE)
+
+
+def test_note_failure_uses_retry_after(scheduler):
+    assert scheduler.note_failure('apkdone', HTTPError(503, {'Retry-After': '15'})) == 15
+    assert scheduler.stats()['apkdone']['paused_for'] == 15
+
+
+def test_note_failure_429_without_retry_after(scheduler):
+    assert scheduler.note_failure('apkdone', HTTPError(429)) == module.POLITENESS_429_COOLDOWN
+
+
+def test_note_failure_other_errors_do_not_pause(scheduler):
+    assert scheduler.note_failure('apkdone', HTTPError(503)) is None
+    assert scheduler.note_failure('apkdone', TimeoutError()) is None
+    assert scheduler.try_acquire('apkdone') == 0
+
+
+def test_stats(scheduler, clock):
+    scheduler.try_acquire('apkdone')
+    scheduler.try_acquire('apkdone')
+    stats = scheduler.stats()['apkdone']
+    assert stats['active'] == 1
+    assert stats['admitted'] == 1
+    assert stats['deferred'] == 1
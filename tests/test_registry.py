@@ -0,0 +1,103 @@
+import pytest
+
+from handlers.registry import HandlerRegistry, COST_HTTP, COST_BROWSER
+
+
+@pytest.fixture
+def registry():
+    return HandlerRegistry()
+
+
+@pytest.mark.parametrize('url, site', [
+    ('https://www.mediafire.com/file/abc123/app.apk/file', 'mediafire'),
+    ('https://megaup.net/2Xk9/app.apk', 'megaup'),
+    ('https://a2zapk.io/123-spotify/', 'a2zapk'),
+    ('https://apk4free.net/spotify/', 'apk4free'),
+    ('https://apkdone.com/spotify-premium/', 'apkdone'),
+    ('https://google-drive.uptodown.com/android', 'uptodown'),
+    ('https://liteapks.com/spotify-2.html', 'liteapks'),
+    ('https://www.filmaffinity.com/es/film123456.html', 'filmaffinity'),
+])
+def test_resolve_known_sites(registry, url, site):
+    match = registry._resolve(url)
+    assert match is not None
+    assert match.spec.key == site
+    assert match.key.startswith(f"{site}:")
+
+
+def test_resolve_matches_registrable_domain_suffix(registry):
+    match = registry._resolve('https://es.google-drive.uptodown.com/android/download')
+    assert match.spec.key == 'uptodown'
+    assert match.host == 'es.google-drive.uptodown.com'
+
+
+@pytest.mark.parametrize('url', [
+    'https://example.com/file.apk',
+    # El dominio tiene que coincidir por etiquetas completas, no como subcadena
+    'https://notmediafire.com/file/abc123',
+    'https://mediafire.com.evil.net/file/abc123',
+    'not a url',
+    '',
+])
+def test_resolve_unsupported(registry, url):
+    assert registry._resolve(url) is None
+
+
+def test_resolve_requires_path_fragment(registry):
+    # FilmAffinity solo es soportado para fichas de películas
+    assert registry._resolve('https://www.filmaffinity.com/es/main.html') is None
+    assert registry._resolve('https://www.filmaffinity.com/es/film123456.html') is not None
+
+
+def test_resolve_canonical_url(registry):
+    match = registry._resolve('  HTTPS://APKDone.com/spotify/?utm_source=x&b=2&a=1#top  ')
+    # El handler recibe la query original; solo la clave descarta el seguimiento
+    assert match.url == 'https://apkdone.com/spotify/?utm_source=x&b=2&a=1'
+    assert match.host == 'apkdone.com'
+    assert match.key == registry._resolve('https://apkdone.com/spotify/?a=1&b=2').key
+
+
+@pytest.mark.parametrize('url', [
+    'https://megaup.net/abc/file.apk?signature=zz',
+    'https://megaup.net/abc/file.apk?sig=zz&size=2&site=x&refresh=1',
+])
+def test_resolve_keeps_real_params_for_handler(registry, url):
+    assert registry.resolve(url).url == url
+
+
+def test_resolve_legacy_mediafire_query(registry):
+    match = registry.resolve('https://www.mediafire.com/?abc123xyz')
+    assert match.url == 'https://www.mediafire.com/?abc123xyz'
+    assert match.key == 'mediafire:file:abc123xyz'
+
+
+def test_resolve_strips_quotes(registry):
+    match = registry._resolve('"https://apkdone.com/spotify/%22')
+    assert match.url == 'https://apkdone.com/spotify/'
+
+
+def test_resolve_variants_share_key(registry):
+    keys = {registry._resolve(url).key for url in (
+        'https://apkdone.com/spotify',
+        'https://www.apkdone.com/spotify/',
+        'https://apkdone.com/spotify/download/?utm_source=telegram',
+    )}
+    assert len(keys) == 1
+
+
+def test_resolve_cost_class(registry):
+    assert registry._resolve('https://apkdone.com/spotify/').cost == COST_HTTP
+    assert registry._resolve('https://megaup.net/2Xk9/app.apk').cost == COST_BROWSER
+
+
+def test_resolve_is_cached(registry):
+    url = 'https://apkdone.com/spotify/'
+    assert registry.resolve(url) is registry.resolve(url)
+
+
+def test_resolve_does_not_import_handler(registry):
+    from handlers import registry as module
+    path = registry.get('megaup').handler_path
+    module._loaded.pop(path, None)
+    registry._resolve('https://megaup.net/2Xk9/app.apk')
+    assert path not in module._loaded
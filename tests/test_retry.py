@@ -0,0 +1,167 @@
+import importlib
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from handlers.circuit_breaker import SiteUnavailableError, RecentFailureError, ResourceUnavailable
+from handlers.retry import (
+    RetryPolicy, LinkNotReady, is_retryable, is_rate_limited, retry_after,
+    queue_attempt, current_attempt, link_not_found
+)
+
+module = importlib.import_module('handlers.retry')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"{status} Server Error")
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+class ReadTimeout(Exception):
+    """Mismo nombre que requests.exceptions.ReadTimeout"""
+
+
+def wrapped(error):
+    """Como los handlers: Exception genérica con la causa encadenada"""
+    try:
+        raise error
+    except Exception as e:
+        try:
+            raise Exception(f"Error APKDone después de 1 intentos: {e}") from e
+        except Exception as outer:
+            return outer
+
+
+@pytest.mark.parametrize('error', [
+    TimeoutError(),
+    ConnectionError(),
+    ReadTimeout(),
+    HTTPError(503),
+    HTTPError(429),
+    Exception("HTTP 502 para https://apkdone.com/app"),
+    wrapped(ReadTimeout()),
+    wrapped(HTTPError(504)),
+    LinkNotReady("sin enlace"),
+])
+def test_retryable(error):
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize('error', [
+    HTTPError(404),
+    HTTPError(403),
+    Exception("No se encontró enlace directo después de varios intentos"),
+    SiteUnavailableError("abierto"),
+    RecentFailureError("falló hace poco"),
+    ResourceUnavailable("archivo eliminado"),
+    wrapped(HTTPError(404)),
+    wrapped(ResourceUnavailable("archivo eliminado")),
+])
+def test_not_retryable(error):
+    assert not is_retryable(error)
+
+
+def test_explicit_retryable_attribute_wins():
+    error = Exception("HTTP 503")
+    error.retryable = False
+    assert not is_retryable(error)
+    error = Exception("mensaje del worker de navegador")
+    error.retryable = True
+    assert is_retryable(error)
+
+
+def test_rate_limited_through_chain():
+    assert is_rate_limited(wrapped(HTTPError(429)))
+    assert not is_rate_limited(wrapped(HTTPError(503)))
+
+
+def test_retry_after_seconds():
+    assert retry_after(HTTPError(429, {'Retry-After': '12'})) == 12
+    assert retry_after(wrapped(HTTPError(503, {'Retry-After': '7'}))) == 7
+    assert retry_after(HTTPError(503)) is None
+
+
+def test_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=60)
+    seconds = retry_after(HTTPError(429, {'Retry-After': format_datetime(when, usegmt=True)}))
+    assert 55 <= seconds <= 60
+
+
+def test_retry_after_invalid_or_past():
+    assert retry_after(HTTPError(429, {'Retry-After': 'pronto'})) is None
+    past = format_datetime(datetime.now(timezone.utc) - timedelta(minutes=5), usegmt=True)
+    assert retry_after(HTTPError(429, {'Retry-After': past})) == 0
+    assert retry_after(HTTPError(429, {'Retry-After': '-3'})) == 0
+
+
+@pytest.fixture
+def policy():
+    return RetryPolicy(max_attempts=3, base_delay=2, max_delay=30, deadline=180)
+
+
+def test_delay_is_full_jitter(policy, monkeypatch):
+    monkeypatch.setattr(module.random, 'uniform', lambda low, high: high)
+    assert policy.delay(1) == 4
+    assert policy.delay(2) == 8
+    assert policy.delay(10) == 30
+
+
+def test_next_delay_schedules_transient(policy, monkeypatch):
+    monkeypatch.setattr(module.random, 'uniform', lambda low, high: high)
+    assert policy.next_delay(TimeoutError(), attempts=1, elapsed=0) == 4
+    assert policy.stats()['scheduled'] == 1
+
+
+def test_next_delay_permanent(policy):
+    assert policy.next_delay(HTTPError(404), attempts=1, elapsed=0) is None
+    assert policy.stats()['permanent'] == 1
+
+
+def test_next_delay_exhausted(policy):
+    assert policy.next_delay(TimeoutError(), attempts=3, elapsed=0) is None
+    assert policy.stats()['exhausted'] == 1
+
+
+def test_next_delay_deadline(policy, monkeypatch):
+    monkeypatch.setattr(module.random, 'uniform', lambda low, high: high)
+    assert policy.next_delay(TimeoutError(), attempts=1, elapsed=177) is None
+    assert policy.stats()['deadline'] == 1
+
+
+def test_next_delay_honours_retry_after(policy, monkeypatch):
+    monkeypatch.setattr(module.random, 'uniform', lambda low, high: low)
+    assert policy.next_delay(HTTPError(429, {'Retry-After': '20'}), attempts=1, elapsed=0) == 20
+    # Un Retry-After que no cabe en el plazo no se programa
+    assert policy.next_delay(HTTPError(429, {'Retry-After': '200'}), attempts=1, elapsed=0) is None
+
+
+def test_next_delay_honours_link_not_ready_wait(policy, monkeypatch):
+    monkeypatch.setattr(module.random, 'uniform', lambda low, high: low)
+    assert policy.next_delay(LinkNotReady("sin enlace", wait=5), attempts=1, elapsed=0) == 5
+
+
+def test_queue_attempt_context():
+    assert current_attempt() == 0
+    with queue_attempt(2):
+        assert current_attempt() == 2
+    assert current_attempt() == 0
+
+
+def test_link_not_found_on_first_queue_attempt():
+    assert isinstance(link_not_found(1), LinkNotReady)
+    with queue_attempt(1):
+        error = link_not_found(1)
+    assert not isinstance(error, LinkNotReady)
+    assert not is_retryable(error)
+    # El handler ya hizo su segunda pasada
+    assert not isinstance(link_not_found(3), LinkNotReady)
+
+
+def test_hedger_threads_see_queue_attempt():
+    from handlers.hedging import Hedger
+    hedger = Hedger(sites=(), max_workers=1)
+    with queue_attempt(1):
+        assert hedger.run('apkdone', current_attempt, enabled=False) == 1
@@ -0,0 +1,85 @@
+import importlib
+import os
+import threading
+
+import pytest
+
+from handlers.strategy_stats import StrategyStats
+
+
+@pytest.fixture
+def stats(tmp_path):
+    return StrategyStats(path=str(tmp_path / 'stats.json'), explore_rate=0, save_interval=3600)
+
+
+def strategy(name, calls, link=None):
+    def method(page):
+        calls.append(name)
+        return link
+    return name, method
+
+
+def test_winner_moves_first(stats):
+    calls = []
+    strategies = [strategy('precise', calls), strategy('other', calls, 'https://cdn/app.apk')]
+    stats.run('site', strategies, 'page')
+    calls.clear()
+    assert stats.run('site', strategies, 'page') == ('https://cdn/app.apk', 'other')
+    assert calls == ['other']
+
+
+def test_fallback_runs_last_and_never_scores(stats):
+    calls = []
+    precise = strategy('precise', calls)
+    fallback = strategy('any_external', calls, 'https://ads/app.apk')
+    for _ in range(20):
+        assert stats.run('site', [precise], 'page', fallbacks=[fallback]) == ('https://ads/app.apk', 'any_external')
+    assert 'any_external' not in stats.stats().get('site', {}).get('win_rates', {})
+
+    # El diseño vuelve: el método preciso responde antes que el comodín
+    calls.clear()
+    precise = strategy('precise', calls, 'https://cdn/app.apk')
+    assert stats.run('site', [precise], 'page', fallbacks=[fallback]) == ('https://cdn/app.apk', 'precise')
+    assert calls == ['precise']
+
+
+def test_fallback_not_credited_when_exploring(stats):
+    stats.explore_rate = 1
+    calls = []
+    result = stats.run('site', [strategy('precise', calls, 'https://cdn/app.apk')], 'page',
+                       fallbacks=[strategy('any_external', calls, 'https://ads/app.apk')])
+    assert result == ('https://cdn/app.apk', 'precise')
+    assert calls == ['precise']
+
+
+def test_stored_fallback_score_is_forgotten(stats):
+    stats.record('site', ['any_external'])
+    calls = []
+    stats.run('site', [strategy('precise', calls, 'https://cdn/app.apk')], 'page',
+              fallbacks=[strategy('any_external', calls, 'https://ads/app.apk')])
+    assert stats.stats()['site']['leader'] == 'precise'
+    assert 'any_external' not in stats.stats()['site']['win_rates']
+
+
+def test_concurrent_saves_do_not_collide(stats, tmp_path, monkeypatch):
+    module = importlib.import_module('handlers.strategy_stats')
+    real_replace = os.replace
+    barrier = threading.Barrier(2, timeout=5)
+    replaced = []
+
+    def replace(src, dst):
+        # Ambos hilos escriben su temporal antes de que ninguno lo renombre
+        barrier.wait()
+        real_replace(src, dst)
+        replaced.append(src)
+
+    stats.record('site', ['precise'])
+    monkeypatch.setattr(module.os, 'replace', replace)
+    threads = [threading.Thread(target=stats.save) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(replaced)) == 2
+    assert list(tmp_path.glob('*.tmp')) == []